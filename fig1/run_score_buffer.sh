@@ -1,29 +1,16 @@
 schemes="ledbat cubic"
 runs=3
-pids=""
-sys_cpu_cnt=`lscpu | grep "^CPU(s):" | awk '{print $2}'`
-cpu_num=$((sys_cpu_cnt/6))
-cnt=0
 
+# every experiment as a job of the scheduler, which starts the next one as
+# soon as the ones running leave enough CPUs for it (6 for a 48 Mbps link),
+# pinned to CPUs of its own
 for cc in $schemes
 do
     for qs in 40 80 160 320 640
     do
-        ./cc_solo.sh $cc bench-test 1 $runs 0 20 $qs "0" 48 30 48 48 5 & sleep 2
-        cnt=$((cnt+1))
-        pids="$pids $!"
-        sleep 2
-        if [ $cnt -gt $cpu_num ]
-        then
-            for pid in $pids
-            do
-                wait $pid
-            done
-            cnt=0
-            pids=""
-        fi
+        echo "6 ./cc_solo.sh $cc bench-test 1 $runs 0 20 $qs \"0\" 48 30 48 48 5"
     done
-done
+done | python ../helpers/scheduler.py --pin --delay 4
 
 sleep 60
 
@@ -31,12 +18,7 @@ for cc in $schemes
 do
     for qs in 40 80 160 320 640
     do
-        ./cc_solo_analysis.sh $cc bench-test 1 $runs 0 20 $qs "0" 48 30 48 48 5 &
-        pids="$pids $!"
+        echo "1 ./cc_solo_analysis.sh $cc bench-test 1 $runs 0 20 $qs \"0\" 48 30 48 48 5"
     done
-done
-for pid in $pids
-do
-    wait $pid
-done
+done | python ../helpers/scheduler.py
 ./buffersize_score.sh
@@ -1,45 +1,25 @@
 schemes="bbr vegas"
-pids=""
-sys_cpu_cnt=`lscpu | grep "^CPU(s):" | awk '{print $2}'`
-cpu_num=$((sys_cpu_cnt/6))
-cnt=0
 runs=3
 
+# every experiment as a job of the scheduler, which starts the next one as
+# soon as the ones running leave enough CPUs for it (6 for a 48 Mbps link),
+# pinned to CPUs of its own
 for cc in $schemes
 do
     for dl in 10 20 30 40 50 60
     do
         qs=$((dl*2*4*5))
-        ./cc_solo.sh $cc bench-test 1 $runs 0 $dl $qs "0" 48 30 48 48 5 &
-        cnt=$((cnt+1))
-        pids="$pids $!"
-        sleep 2
-        if [ $cnt -gt $cpu_num ]
-        then
-            for pid in $pids
-            do
-                wait $pid
-            done
-            cnt=0
-            pids=""
-        fi
+        echo "6 ./cc_solo.sh $cc bench-test 1 $runs 0 $dl $qs \"0\" 48 30 48 48 5"
     done
-done
+done | python ../helpers/scheduler.py --pin --delay 2
 
 sleep 60
-pids=""
 for cc in $schemes
 do
     for dl in 10 20 30 40 50 60
     do
         qs=$((dl*2*4*5))
-        ./cc_solo_analysis.sh $cc bench-test 1 $runs 0 $dl $qs "0" 48 30 48 48 5 &
-        pids="$pids $!"
-        sleep 1
+        echo "1 ./cc_solo_analysis.sh $cc bench-test 1 $runs 0 $dl $qs \"0\" 48 30 48 48 5"
     done
-done
-for pid in $pids
-do
-    wait $pid
-done
+done | python ../helpers/scheduler.py --delay 1
 ./rtt_score.sh
@@ -1,15 +1,104 @@
 #!/usr/bin/env python
 
 from os import path
+import sys
+import glob
+import time
+import traceback
+import multiprocessing
 
 import arg_parser
 import context
 from helpers.subprocess_wrappers import check_call
 
+TRACE_NAME = 'tcpdatagen_mm_datalink_run1.log'
+
+
+def expand_data_dirs(patterns):
+    data_dirs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            sys.stderr.write('Warning: %s matches no directory\n' % pattern)
+        data_dirs += [path.abspath(d) for d in matches if path.isdir(d)]
+    return data_dirs
+
+
+def default_jobs(mem_per_job):
+    # one worker per core, as long as each can have mem_per_job MB
+    jobs = multiprocessing.cpu_count()
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) / 1024
+                    jobs = min(jobs, available / mem_per_job)
+    except (IOError, ValueError):
+        pass
+    return max(1, jobs)
+
+
+def analyze_dir(task):
+    # runs in a worker, which imports numpy and pandas once for all the
+    # directories it is given
+    data_dir, options = task
+    import network_oracle
+
+    start_time = time.time()
+    try:
+        network_oracle.analyze_trace_file(path.join(data_dir, TRACE_NAME),
+                                          **options)
+    except (Exception, SystemExit):
+        return data_dir, traceback.format_exc(), time.time() - start_time
+    return data_dir, None, time.time() - start_time
+
+
+def analyze_dirs(args):
+    data_dirs = expand_data_dirs(args.data_dirs)
+    if not data_dirs:
+        sys.exit('No data directories to analyze')
+
+    options = {'stream': args.stream, 'output_format': args.output_format}
+    if args.output_dir:
+        options['output_dir'] = args.output_dir
+    if args.cwnd_dir:
+        options['cwnd_dir'] = args.cwnd_dir
+    if args.time_steps:
+        options['time_steps'] = args.time_steps
+
+    jobs = args.jobs or default_jobs(args.mem_per_job)
+    jobs = min(jobs, len(data_dirs))
+    sys.stderr.write('Analyzing %d directories with %d workers\n'
+                     % (len(data_dirs), jobs))
+
+    pool = multiprocessing.Pool(processes=jobs)
+    failed = []
+    results = pool.imap_unordered(
+        analyze_dir, [(data_dir, options) for data_dir in data_dirs])
+    for done, (data_dir, error, elapsed) in enumerate(results, 1):
+        if error is None:
+            sys.stderr.write('[%d/%d] %s: done in %.1f s\n'
+                             % (done, len(data_dirs), data_dir, elapsed))
+        else:
+            failed.append(data_dir)
+            sys.stderr.write('[%d/%d] %s: failed after %.1f s\n%s'
+                             % (done, len(data_dirs), data_dir, elapsed,
+                                error))
+    pool.close()
+    pool.join()
+
+    if failed:
+        sys.exit('Failed to analyze %d of %d directories:\n%s'
+                 % (len(failed), len(data_dirs), '\n'.join(failed)))
+
 
 def main():
     args = arg_parser.parse_analyze()
 
+    if args.data_dirs:
+        analyze_dirs(args)
+        return
+
     analysis_dir = path.join(context.src_dir, 'analysis')
     # plot = path.join(analysis_dir, 'plot.py')
     # report = path.join(analysis_dir, 'report.py')
@@ -32,6 +121,17 @@ def main():
         if args.include_acklink:
             cmd += ['--include-acklink']
 
+    if args.stream:
+        network_oracle_cmd += ['--stream']
+    network_oracle_cmd += ['--output-format', args.output_format]
+    if args.output_dir:
+        network_oracle_cmd += ['--output-dir', args.output_dir]
+    if args.cwnd_dir:
+        network_oracle_cmd += ['--cwnd-dir', args.cwnd_dir]
+    if args.time_steps:
+        network_oracle_cmd += (['--time-steps'] +
+                               ['%g' % step for step in args.time_steps])
+
     # if args.data_dir:
     #     normalize_cmd+=['--datadir',args.data_dir]
 
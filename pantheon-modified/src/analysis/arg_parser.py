@@ -14,6 +14,17 @@ def verify_schemes(schemes):
         if cc not in all_schemes:
             sys.exit('%s is not a scheme included in src/config.yml' % cc)
 
+def parse_windows(windows):
+    ret = []
+    for window in windows.split():
+        try:
+            win_start, win_end = window.split(':')
+            ret.append((float(win_start), float(win_end)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                'window %s is not in the form START:END' % window)
+    return ret
+
 def make_raw_data():
     parser = argparse.ArgumentParser(
         description='Make raw data (sending/receiving throughput ...) from the log file')
@@ -30,6 +41,16 @@ def make_raw_data():
     args = parser.parse_args()
     return args
 
+def parse_stats_shared(parser):
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='compute statistics in one pass over blocks of each log in '
+        'bounded memory, without keeping per-packet delays (no delay graph)')
+    parser.add_argument(
+        '--approx-delay', action='store_true',
+        help='estimate delay percentiles and jitter from a histogram '
+        '(within 0.5%%) instead of keeping every per-packet delay')
+
 def parse_tunnel_piecewise():
     parser = argparse.ArgumentParser(
         description='evaluate throughput and delay of a tunnel log in a piecewise manner')
@@ -44,6 +65,18 @@ def parse_tunnel_piecewise():
         '--win-end', metavar='WIN-END-TIME', type=float, default=100,
         help='start time in second (default 100)')
 
+    parser.add_argument(
+        '--windows', metavar='"START:END START:END..."', type=parse_windows,
+        help='evaluate several windows (in seconds) from one read of the '
+        'log; overrides --win-start and --win-end')
+
+    parser.add_argument(
+        '--no-log-cache', action='store_true',
+        help='do not read or write the parsed <log>.cols cache; seek into '
+        'the text log through its <log>.idx index instead')
+
+    parse_stats_shared(parser)
+
     args = parser.parse_args()
     return args
 
@@ -65,6 +98,7 @@ def parse_tunnel_graph():
     parser.add_argument(
         '--ms-per-bin', metavar='MS-PER-BIN', type=int, default=500,
         help='bin size in ms (default 500)')
+    parse_stats_shared(parser)
 
     parser.add_argument('out_raw', metavar='out_raw',
         help='output raw file prefix')
@@ -103,12 +137,110 @@ def parse_save_piecewise():
         '--win-end', metavar='WIN-END-TIME', type=float, default=100,
         help='start time in second (default 100)')
 
+    parser.add_argument(
+        '--windows', metavar='"START:END START:END..."', type=parse_windows,
+        help='save piecewise_perf_START_END.json for several windows (in '
+        'seconds) from one read of each log; overrides --win-start and '
+        '--win-end')
+
+    parser.add_argument(
+        '--no-log-cache', action='store_true',
+        help='do not read or write the parsed <log>.cols cache; seek into '
+        'the text log through its <log>.idx index instead')
+
+    parse_stats_shared(parser)
+
     args = parser.parse_args()
     if args.schemes is not None:
         verify_schemes(args.schemes)
 
     return args
 
+def parse_results_store():
+    parser = argparse.ArgumentParser(
+        description='ingest the piecewise results of every experiment in a '
+        'data directory into one SQLite store for the league scripts')
+
+    parser.add_argument(
+        '--datadir', '-d', required=True,
+        help='directory of the experiment directories (dataset-gen-...)')
+    parser.add_argument(
+        '--store', metavar='DB',
+        help='SQLite file to update (default DATADIR/results.db)')
+
+    return parser.parse_args()
+
+def parse_league():
+    parser = argparse.ArgumentParser(
+        description='rank the schemes by the environments they win in each '
+        'window of the single-flow experiments')
+
+    parser.add_argument(
+        '--datadir', '-d', required=True,
+        help='directory of the experiment directories (dataset-gen-...)')
+    parser.add_argument(
+        '--schemes', metavar='"SCHEME1 SCHEME2..."', required=True,
+        help='space-separated list of schemes to rank')
+    parser.add_argument(
+        '--grid', default='single-flow',
+        help='scenario grid of src/scenarios.yml to rank the schemes in '
+        '(default single-flow)')
+    parser.add_argument(
+        '--windows', metavar='"START:END START:END..."', type=parse_windows,
+        help='windows (in seconds) to run a league in (default the windows '
+        'of the grid)')
+    parser.add_argument(
+        '--win-margin', metavar='WIN-MARGIN', type=float, default=10.0,
+        help='schemes within this %% of the best score win (default 10)')
+    parser.add_argument(
+        '--sweep-margins', metavar='MARGIN', type=float, nargs='+',
+        help='also write the overall ranking for each of these win margins, '
+        'from the same scores')
+    parser.add_argument(
+        '-j', '--jobs', type=int,
+        help='number of worker processes writing the windows (default one '
+        'per window, up to one per core)')
+    parser.add_argument(
+        '--bootstrap', metavar='RESAMPLES', type=int, default=0,
+        help='also write each overall ranking with the confidence interval '
+        'of the win %% of every scheme and the probability that it keeps its '
+        'rank, from this many resamples of the environments and runs '
+        '(to <ranking>-bootstrap)')
+    parser.add_argument(
+        '--confidence', metavar='PERCENT', type=float, default=95.0,
+        help='confidence level of the bootstrap intervals (default 95)')
+    parser.add_argument(
+        '--seed', type=int,
+        help='seed of the bootstrap resamples, to repeat them exactly')
+    parser.add_argument(
+        '--store', metavar='DB',
+        help='read the results from this store, made by results_store.py, '
+        'instead of the JSON files of every experiment')
+
+    return parser.parse_args()
+
+def parse_league_ranking():
+    parser = argparse.ArgumentParser(
+        description='rank the schemes by the environments they win in the '
+        'league windows of a grid, from the winners of every window')
+
+    parser.add_argument(
+        '--datadir', '-d', required=True,
+        help='directory of the league directories (dataset-gen-league-...)')
+    parser.add_argument(
+        '--schemes', metavar='"SCHEME1 SCHEME2..."', required=True,
+        help='space-separated list of schemes to rank')
+    parser.add_argument(
+        '--grid', default='two-flow',
+        help='scenario grid of src/scenarios.yml whose league windows to rank '
+        'the schemes in (default two-flow)')
+    parser.add_argument(
+        '--output', metavar='NAME',
+        help='file of the overall ranking in DATADIR, written with NAME.json '
+        '(default charts-overall-ranking-multi for grids of several flows)')
+
+    return parser.parse_args()
+
 def parse_plot():
     parser = argparse.ArgumentParser(
         description='plot throughput and delay graphs for schemes in tests')
@@ -119,6 +251,7 @@ def parse_plot():
     parser.add_argument(
         '--no-graphs', action='store_true', help='only append datalink '
         'statistics to stats files with no graphs generated')
+    parse_stats_shared(parser)
 
     args = parser.parse_args()
     if args.schemes is not None:
@@ -142,6 +275,43 @@ def parse_report():
     return args
 
 
+def parse_network_oracle_shared(parser):
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='read the trace in blocks and compute the windows of each '
+        'block as it is read, in bounded memory')
+    parser.add_argument(
+        '--output-format', choices=['csv', 'npz', 'parquet'], default='csv',
+        help='format of the features written (default csv)')
+    parser.add_argument(
+        '--output-dir', metavar='DIR',
+        help='directory to write the features to (default the tcpdatagen '
+        'dataset directory)')
+    parser.add_argument(
+        '--cwnd-dir', metavar='DIR',
+        help='directory that contains <scenario>-cwnd.txt (default the '
+        'tcpdatagen dataset directory)')
+    parser.add_argument(
+        '--time-steps', metavar='MS', type=float, nargs='+',
+        help='window sizes in ms to compute the features at, all in one '
+        'pass over the trace, e.g. "10 50 100 500"; other than 10 ms they '
+        'are written to <scenario>-<step>ms.<ext> (default 10)')
+
+
+def parse_network_oracle():
+    parser = argparse.ArgumentParser(
+        description='compute per-window network features of the datalink '
+        'trace of a tcpdatagen scenario')
+
+    parser.add_argument(
+        'trace_base', metavar='SCENARIO-DIR',
+        help='scenario directory (with a trailing /) that contains '
+        'tcpdatagen_mm_datalink_run1.log')
+    parse_network_oracle_shared(parser)
+
+    return parser.parse_args()
+
+
 def parse_analyze():
     parser = argparse.ArgumentParser(
         description='call plot.py and report.py')
@@ -149,6 +319,20 @@ def parse_analyze():
     parse_analyze_shared(parser)
     parser.add_argument('--include-acklink', action='store_true',
                         help='include acklink analysis')
+    parse_network_oracle_shared(parser)
+    parser.add_argument(
+        '--data-dirs', metavar='DIR', nargs='+',
+        help='scenario directories or glob patterns such as '
+        '"data/single-flow-scenario-*" to analyze in parallel, in place of '
+        '--data-dir')
+    parser.add_argument(
+        '-j', '--jobs', type=int,
+        help='number of worker processes for --data-dirs (default one per '
+        'core, limited by --mem-per-job)')
+    parser.add_argument(
+        '--mem-per-job', metavar='MB', type=int, default=2048,
+        help='memory to reserve for each worker process when sizing '
+        '--jobs (default 2048)')
 
     args = parser.parse_args()
     if args.schemes is not None:
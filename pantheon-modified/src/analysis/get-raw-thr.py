@@ -9,6 +9,7 @@ import matplotlib_agg
 import matplotlib.pyplot as plt
 
 import arg_parser
+import tunnel_log
 
 
 class MakeRawData(object):
@@ -26,136 +27,58 @@ class MakeRawData(object):
         return bin_id * self.ms_per_bin / 1000.0
 
     def parse_tunnel_log(self):
-        tunlog = open(self.tunnel_log)
+        log = tunnel_log.load_tunnel_log(self.tunnel_log)
 
-        self.flows = {}
-        first_ts = None
-        capacities = {}
+        self.flows = dict.fromkeys(log.flows(), True)
+        first_ts = log.ts[0] if len(log) else None
 
-        arrivals = {}
-        departures = {}
         self.delays_t = {}
         self.delays = {}
 
-        first_capacity = None
-        last_capacity = None
-        first_arrival = {}
-        last_arrival = {}
-        first_departure = {}
-        last_departure = {}
+        if first_ts is not None:
+            bins = ((log.ts - first_ts) / self.ms_per_bin).astype(np.int64)
 
-        total_first_departure = None
-        total_last_departure = None
-        total_arrivals = 0
-        total_departures = 0
-
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
-
-            if line.startswith('#'):
-                continue
-
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
-
-            if first_ts is None:
-                first_ts = ts
-
-            bin_id = self.ms_to_bin(ts, first_ts)
-
-            if event_type == '#':
-                capacities[bin_id] = capacities.get(bin_id, 0) + num_bits
-
-                if first_capacity is None:
-                    first_capacity = ts
-
-                if last_capacity is None or ts > last_capacity:
-                    last_capacity = ts
-            elif event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                self.flows[flow_id] = True
-
-                if flow_id not in arrivals:
-                    arrivals[flow_id] = {}
-                    first_arrival[flow_id] = ts
-
-                if flow_id not in last_arrival:
-                    last_arrival[flow_id] = ts
-                else:
-                    if ts > last_arrival[flow_id]:
-                        last_arrival[flow_id] = ts
-
-                old_value = arrivals[flow_id].get(bin_id, 0)
-                arrivals[flow_id][bin_id] = old_value + num_bits
-
-                total_arrivals += num_bits
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                self.flows[flow_id] = True
+        arrival = log.event == tunnel_log.ARRIVAL
+        departure = log.event == tunnel_log.DEPARTURE
+        num_bits = log.size * 8
 
-                if flow_id not in departures:
-                    departures[flow_id] = {}
-                    first_departure[flow_id] = ts
+        total_arrivals = num_bits[arrival].sum()
+        total_departures = num_bits[departure].sum()
 
-                if flow_id not in last_departure:
-                    last_departure[flow_id] = ts
-                else:
-                    if ts > last_departure[flow_id]:
-                        last_departure[flow_id] = ts
-
-                old_value = departures[flow_id].get(bin_id, 0)
-                departures[flow_id][bin_id] = old_value + num_bits
-
-                total_departures += num_bits
-
-                # update total variables
-                if total_first_departure is None:
-                    total_first_departure = ts
-                if (total_last_departure is None or
-                        ts > total_last_departure):
-                    total_last_departure = ts
-
-                # store delays in a list for each flow and sort later
-                delay = float(items[3])
-                if flow_id not in self.delays:
-                    self.delays[flow_id] = []
-                    self.delays_t[flow_id] = []
-                self.delays[flow_id].append(delay)
-                self.delays_t[flow_id].append((ts - first_ts) / 1000.0)
-
-        tunlog.close()
+        total_first_departure = None
+        total_last_departure = None
+        if departure.any():
+            departure_ts = log.ts[departure]
+            total_first_departure = departure_ts[0]
+            total_last_departure = departure_ts.max()
 
         us_per_bin = 1000.0 * self.ms_per_bin
 
         self.avg_capacity = None
         self.link_capacity = []
         self.link_capacity_t = []
-        if capacities:
+        capacity = log.event == tunnel_log.CAPACITY
+        if capacity.any():
+            capacity_ts = log.ts[capacity]
+            capacity_bits = num_bits[capacity]
+            first_capacity = capacity_ts[0]
+            last_capacity = capacity_ts.max()
+
             # calculate average capacity
             if last_capacity == first_capacity:
                 self.avg_capacity = 0
             else:
                 delta = 1000.0 * (last_capacity - first_capacity)
-                self.avg_capacity = sum(capacities.values()) / delta
+                self.avg_capacity = capacity_bits.sum() / delta
 
             # transform capacities into a list
-            capacity_bins = capacities.keys()
-            for bin_id in xrange(min(capacity_bins), max(capacity_bins) + 1):
-                self.link_capacity.append(
-                    capacities.get(bin_id, 0) / us_per_bin)
-                self.link_capacity_t.append(self.bin_to_s(bin_id))
+            capacity_bins = bins[capacity]
+            min_bin = capacity_bins.min()
+            capacities = np.bincount(capacity_bins - min_bin,
+                                     weights=capacity_bits)
+            self.link_capacity = (capacities / us_per_bin).tolist()
+            self.link_capacity_t = [self.bin_to_s(bin_id) for bin_id in
+                                    xrange(min_bin, min_bin + len(capacities))]
 
         # calculate ingress and egress throughput for each flow
         self.ingress_tput = {}
@@ -182,44 +105,60 @@ class MakeRawData(object):
             self.avg_ingress[flow_id] = 0
             self.avg_egress[flow_id] = 0
 
-            if flow_id in arrivals:
+            flow = log.flow_id == flow_id
+            flow_arrival = arrival & flow
+            flow_departure = departure & flow
+
+            if flow_arrival.any():
                 # calculate average ingress and egress throughput
-                first_arrival_ts = first_arrival[flow_id]
-                last_arrival_ts = last_arrival[flow_id]
+                arrival_ts = log.ts[flow_arrival]
+                first_arrival_ts = arrival_ts[0]
+                last_arrival_ts = arrival_ts.max()
 
                 if last_arrival_ts == first_arrival_ts:
                     self.avg_ingress[flow_id] = 0
                 else:
                     delta = 1000.0 * (last_arrival_ts - first_arrival_ts)
-                    flow_arrivals = sum(arrivals[flow_id].values())
+                    flow_arrivals = num_bits[flow_arrival].sum()
                     self.avg_ingress[flow_id] = flow_arrivals / delta
 
-                ingress_bins = arrivals[flow_id].keys()
-                for bin_id in xrange(min(ingress_bins), max(ingress_bins) + 1):
-                    self.ingress_tput[flow_id].append(
-                        arrivals[flow_id].get(bin_id, 0) / us_per_bin)
-                    self.ingress_t[flow_id].append(self.bin_to_s(bin_id))
+                ingress_bins = bins[flow_arrival]
+                min_bin = ingress_bins.min()
+                arrivals = np.bincount(ingress_bins - min_bin,
+                                       weights=num_bits[flow_arrival])
+                self.ingress_tput[flow_id] = (arrivals / us_per_bin).tolist()
+                self.ingress_t[flow_id] = [
+                    self.bin_to_s(bin_id) for bin_id in
+                    xrange(min_bin, min_bin + len(arrivals))]
 
-            if flow_id in departures:
-                first_departure_ts = first_departure[flow_id]
-                last_departure_ts = last_departure[flow_id]
+            if flow_departure.any():
+                departure_ts = log.ts[flow_departure]
+                first_departure_ts = departure_ts[0]
+                last_departure_ts = departure_ts.max()
 
                 if last_departure_ts == first_departure_ts:
                     self.avg_egress[flow_id] = 0
                 else:
                     delta = 1000.0 * (last_departure_ts - first_departure_ts)
-                    flow_departures = sum(departures[flow_id].values())
+                    flow_departures = num_bits[flow_departure].sum()
                     self.avg_egress[flow_id] = flow_departures / delta
 
-                egress_bins = departures[flow_id].keys()
+                egress_bins = bins[flow_departure]
+                min_bin = egress_bins.min()
+                departures = np.bincount(egress_bins - min_bin,
+                                         weights=num_bits[flow_departure])
 
                 self.egress_tput[flow_id].append(0.0)
-                self.egress_t[flow_id].append(self.bin_to_s(min(egress_bins)))
+                self.egress_t[flow_id].append(self.bin_to_s(min_bin))
+
+                self.egress_tput[flow_id] += (departures / us_per_bin).tolist()
+                self.egress_t[flow_id] += [
+                    self.bin_to_s(bin_id + 1) for bin_id in
+                    xrange(min_bin, min_bin + len(departures))]
 
-                for bin_id in xrange(min(egress_bins), max(egress_bins) + 1):
-                    self.egress_tput[flow_id].append(
-                        departures[flow_id].get(bin_id, 0) / us_per_bin)
-                    self.egress_t[flow_id].append(self.bin_to_s(bin_id + 1))
+                # store delays in an array for each flow
+                self.delays[flow_id] = log.delay[flow_departure]
+                self.delays_t[flow_id] = (departure_ts - first_ts) / 1000.0
 
             # calculate 95th percentile per-packet one-way delay
             self.percentile_delay_90th[flow_id] = None
@@ -240,12 +179,12 @@ class MakeRawData(object):
                 delta_times_from_avg = np.absolute(tmp)
                 self.jitter[flow_id] = np.average(delta_times_from_avg)
 
-                total_delays += self.delays[flow_id]
+                total_delays.append(self.delays[flow_id])
 
             # calculate loss rate for each flow
-            if flow_id in arrivals and flow_id in departures:
-                flow_arrivals = sum(arrivals[flow_id].values())
-                flow_departures = sum(departures[flow_id].values())
+            if flow_arrival.any() and flow_departure.any():
+                flow_arrivals = num_bits[flow_arrival].sum()
+                flow_departures = num_bits[flow_departure].sum()
 
                 self.loss_rate[flow_id] = None
                 if flow_arrivals > 0:
@@ -253,6 +192,9 @@ class MakeRawData(object):
                         1 - 1.0 * flow_departures / flow_arrivals)
                     self.avg_gput[flow_id] = self.avg_egress[flow_id]*(1.0-self.loss_rate[flow_id])
 
+        if total_delays:
+            total_delays = np.concatenate(total_delays)
+
         self.total_loss_rate = None
         if total_arrivals > 0:
             self.total_loss_rate = 1 - 1.0 * total_departures / total_arrivals
@@ -271,27 +213,27 @@ class MakeRawData(object):
             self.total_avg_gput = self.total_avg_egress*(1.0-self.total_loss_rate)
 
         self.total_percentile_delay = None
-        if total_delays:
+        if len(total_delays):
             self.total_percentile_delay = np.percentile(
                 #total_delays, 95, interpolation='nearest')
                 total_delays, 95, interpolation='higher')
 
         self.total_avg_delay = None
-        if total_delays:
+        if len(total_delays):
             self.total_avg_delay = np.average(total_delays)
 
         self.total_mean_delay = None
-        if total_delays:
+        if len(total_delays):
             self.total_mean_delay = np.mean(total_delays)
 
         self.total_90th_delay = None
-        if total_delays:
+        if len(total_delays):
             self.total_90th_delay = np.percentile(
                 #total_delays, 90, interpolation='nearest')
                 total_delays, 90, interpolation='higher')
 
-            self.total_jitter = None
-        if total_delays:
+        self.total_jitter = None
+        if len(total_delays):
             tmp = np.array(total_delays)
             tmp -= self.total_avg_delay
             delta_times_from_avg = np.absolute(tmp)
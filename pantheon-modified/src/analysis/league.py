@@ -0,0 +1,580 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import sys
+import json
+import shutil
+import multiprocessing
+from os import path
+import numpy as np
+
+import arg_parser
+import context
+import league_ranking
+import results_store
+from helpers import scenarios
+
+# the single-flow league: in every environment, the schemes whose power score
+# is within win_margin % of the best one win. For each window it writes
+# <datadir>/dataset-gen-league-<start>_<end>/ with the per-environment tables
+# and winners under log/, the cwnd traces of all winners (winners), the
+# number of environments (num_env) and the wins of each scheme (charts); the
+# wins over all windows go to <datadir>/charts-overall-ranking-single-flow-<margin>
+# and its .json, as league_ranking.py writes them
+
+# version of the per-scheme aggregates that the league keeps in the results
+# store; to be increased when the way they are computed changes
+AGGREGATES_VERSION = 2
+
+# per-flow results the league reads, and the aggregates it makes of them for
+# each scheme, environment and window
+FLOW_METRICS = ['tput', 'delay_avg', 'delay_90', 'delay']
+AGGREGATE_METRICS = ['samples', 'tput', 'delay_95', 'delay_90', 'delay_avg',
+                     'jindex', 'score']
+
+# sums a flow with results is added to in turn, up to the first of its
+# metrics that is missing
+FLOW_STEPS = ['samples', 'tput', 'delay_avg', 'delay_90', 'delay_95', 'score',
+              'jindex']
+STEP_METRICS = {'tput': 'tput', 'delay_90': 'delay_90', 'delay_95': 'delay'}
+
+# grid of src/scenarios.yml whose environments the league ranks the schemes in
+GRID = 'single-flow'
+
+
+def league_dir(datadir, win_start, win_end):
+    return path.join(datadir, '%s%d_%d' % (league_ranking.LEAGUE_PREFIX,
+                                           win_start, win_end))
+
+
+def winner_trace(dir_post, winner, variants=()):
+    # name of the cwnd trace of a winner: dashes become underscores, except
+    # in the link variants
+    trace = (winner + '-' + dir_post).replace('-', '_')
+    for variant in variants:
+        variant = '-' + variant
+        trace = trace.replace(variant.replace('-', '_'), variant)
+    return trace + '_cwnd.txt'
+
+
+def round_half_up(values):
+    # round() of Python 2 for values >= 0; numpy rounds halves to even
+    floor = np.floor(values)
+    return floor + (values - floor >= 0.5)
+
+
+def aggregate_flows(flows, counted, run_times, uni_del):
+    # averages of the experiments from their per-flow results, with flows
+    # mapping each metric of FLOW_METRICS to an [experiment, run, flow] array
+    # and counted how many of the sums of FLOW_STEPS each flow was added to;
+    # the sums are averaged after every run, as the league always did
+    num_exps, num_runs, num_flows = counted.shape
+    sums = dict((name, np.zeros(num_exps)) for name in FLOW_STEPS)
+    sums['samples'] = np.zeros(num_exps, dtype=np.int64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for run in xrange(num_runs):
+            for flow in xrange(num_flows):
+                added = dict((name, counted[:, run, flow] > step) for
+                             step, name in enumerate(FLOW_STEPS))
+                value = dict((name, values[:, run, flow]) for name, values
+                             in flows.items())
+                tput_tmp = round_half_up(value['tput'])
+                steps = {
+                    'samples': 1,
+                    'tput': value['tput'],
+                    'delay_avg': value['delay_avg'] + uni_del,
+                    'delay_90': value['delay_90'] + uni_del,
+                    'delay_95': value['delay'] + uni_del,
+                    'score': tput_tmp * tput_tmp /
+                    round_half_up(value['delay_avg'] + uni_del),
+                }
+                for name, step_value in steps.items():
+                    sums[name] = np.where(added[name], sums[name] + step_value,
+                                          sums[name])
+                sums['jindex'] = np.where(
+                    added['jindex'], value['tput'] * value['tput'] +
+                    sums['jindex'], sums['jindex'])
+
+            averaged = (sums['samples'] != 0) & (run < run_times)
+            total = np.maximum(sums['samples'], 1)
+            sums['jindex'] = np.where(
+                averaged, np.where(sums['jindex'] != 0,
+                                   sums['tput'] * sums['tput'] /
+                                   sums['jindex'], 0) / total,
+                sums['jindex'])
+            for name in ['tput', 'delay_95', 'delay_90', 'delay_avg',
+                         'score']:
+                sums[name] = np.where(averaged, sums[name] / total,
+                                      sums[name])
+
+    return sums
+
+
+class LeagueInputs(object):
+    # metadata and piecewise results of the experiments in some windows,
+    # from the results store or else from the JSON files of every
+    # experiment. With the store, the aggregates of every experiment are
+    # kept there, and only the experiments that are new or changed since are
+    # read again.
+    def __init__(self, datadir, windows, store=None):
+        self.datadir = datadir
+        self.windows = windows
+
+        self.store = None
+        self.results_of = {}
+        self.cached = {}
+        self.computed = dict((window, {}) for window in windows)
+        if store:
+            self.store = results_store.open_store(store)
+            self.store_info = self.store.metadata()
+            for window in windows:
+                for dir_name, aggregate in self.store.aggregates(
+                        window[0], window[1], AGGREGATES_VERSION).items():
+                    self.cached[(window, dir_name)] = aggregate
+
+    def metadata(self, dir_name):
+        if self.store is not None:
+            if dir_name not in self.store_info:
+                sys.exit('%s is not in the store; run results_store.py'
+                         % dir_name)
+            return self.store_info[dir_name]
+
+        with open(path.join(self.datadir, dir_name,
+                            'pantheon_metadata.json')) as json_file:
+            return json.load(json_file)
+
+    def results(self, window, dir_name):
+        if self.store is not None:
+            # all the results of the window at once
+            if window not in self.results_of:
+                self.results_of[window] = self.store.window_results(*window)
+            if dir_name not in self.results_of[window]:
+                sys.exit('%s is not in the store; run results_store.py'
+                         % dir_name)
+            return self.results_of[window][dir_name]
+
+        with open(path.join(self.datadir, dir_name, 'piecewise_perf_%d_%d.json'
+                            % window)) as json_file:
+            return json.load(json_file)
+
+    def aggregate(self, window, dir_name):
+        # saved aggregates of an experiment in a window, or None
+        return self.cached.get((window, dir_name))
+
+    def save_aggregate(self, window, dir_name, aggregate):
+        if self.store is not None:
+            self.computed[window][dir_name] = aggregate
+
+    def close(self):
+        if self.store is None:
+            return
+        for window in self.windows:
+            if self.computed[window]:
+                self.store.save_aggregates(window[0], window[1],
+                                           AGGREGATES_VERSION,
+                                           self.computed[window])
+        self.store.close()
+        sys.stderr.write('scored %d experiment windows, reused %d\n'
+                         % (sum(len(computed) for computed in
+                                self.computed.values()), len(self.cached)))
+
+
+class LeagueScores(object):
+    # aggregates of every [scheme, environment, window], normalized by the
+    # best scheme of the environment in the window, and the winners for any
+    # win margin
+    def __init__(self, schemes, aggregates, run_times, flows):
+        self.schemes = schemes
+        for name in AGGREGATE_METRICS:
+            setattr(self, name, aggregates[name])
+
+        # every scheme with results counts, and wins, once for each run and
+        # flow of the last scheme
+        repeats = np.maximum(run_times[-1], 0) * np.maximum(flows[-1], 0)
+        self.repeats = repeats.astype(np.int64)[:, np.newaxis]
+        self.scored = (self.repeats > 0) & (self.delay_avg > 0)
+
+        def best(values, pick, initial):
+            return pick(np.where(self.scored, values, initial), axis=0)
+
+        self.max_score = best(self.score, np.max, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.tput_norm = self.tput / best(self.tput, np.max, 0.0)
+            self.delay_95_norm = self.delay_95 / best(self.delay_95, np.min,
+                                                      999999.0)
+            self.delay_avg_norm = self.delay_avg / best(self.delay_avg,
+                                                        np.min, 999999.0)
+            self.delay_90_norm = self.delay_90 / best(self.delay_90, np.min,
+                                                      999999.0)
+
+        # winners' traces are counted for a scheme when they start with its
+        # name and an underscore, as league.sh grepped them
+        self.counted = np.array(
+            [[winner_trace('', winner).startswith(cc + '_')
+              for winner in schemes] for cc in schemes])
+
+    def winners(self, win_margin):
+        # [scheme, environment, window] mask of the winners
+        return self.scored & (
+            self.max_score * (1 - win_margin / 100.0) <= self.score)
+
+    def wins(self, win_margin):
+        # [scheme, window] count of the games won
+        wins = (self.winners(win_margin) * self.repeats).sum(axis=1)
+        return self.counted.astype(np.int64).dot(wins)
+
+
+class RunScores(object):
+    # sums of the power scores of the flows of every [scheme, environment,
+    # window, run] and their numbers of flows, for bootstrap_wins
+    def __init__(self, flows, counted, run_times, uni_del, shape):
+        score_step = FLOW_STEPS.index('score')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            tput = round_half_up(flows['tput'])
+            power = tput * tput / round_half_up(
+                flows['delay_avg'] + uni_del[:, np.newaxis, np.newaxis])
+        power = np.where(counted > score_step, power, 0)
+
+        num_runs = counted.shape[1]
+        self.sums = power.sum(axis=2).reshape(shape + (num_runs,))
+        self.samples = (counted > 0).sum(axis=2).reshape(shape + (num_runs,))
+        # runs of every environment, which the bootstrap draws from
+        self.runs = run_times.reshape(shape).max(axis=(0, 2))
+
+
+def bootstrap_wins(scores, run_scores, win_margin, resamples, seed=None,
+                   chunk=100):
+    # [resample, scheme] wins of the league over all windows when its
+    # environments, and the runs in each of them, are drawn again with
+    # replacement; a scheme scores the mean power score of its flows in the
+    # runs drawn
+    rng = np.random.RandomState(seed)
+    # [environment, run, scheme, window]
+    sums = run_scores.sums.transpose(1, 3, 0, 2)
+    samples = run_scores.samples.transpose(1, 3, 0, 2)
+    num_envs, num_runs = sums.shape[:2]
+
+    wins = []
+    for start in xrange(0, resamples, chunk):
+        size = min(chunk, resamples - start)
+        envs = rng.randint(num_envs, size=(size, num_envs))
+        runs = run_scores.runs[envs][:, :, np.newaxis]
+        drawn = (rng.random_sample((size, num_envs, num_runs)) *
+                 runs).astype(np.int64)
+        # environments with fewer runs only draw as many
+        kept = (np.arange(num_runs) < runs)[:, :, :, np.newaxis, np.newaxis]
+
+        envs = envs[:, :, np.newaxis]
+        total = (samples[envs, drawn] * kept).sum(axis=2)
+        # [resample, environment, scheme, window] as in LeagueScores
+        repeats = scores.repeats[envs[:, :, 0]][:, :, :, np.newaxis]
+        scored = (repeats > 0) & (total > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score = np.where(
+                scored, (sums[envs, drawn] * kept).sum(axis=2) / total, 0.0)
+        max_score = score.max(axis=2)
+        winners = scored & (max_score[:, :, np.newaxis, :] *
+                            (1 - win_margin / 100.0) <= score)
+        won = (winners * repeats).sum(axis=(1, 3))
+        wins.append(won.dot(scores.counted.T.astype(np.int64)))
+    return np.concatenate(wins)
+
+
+def ranks(wins):
+    # rank of every scheme by its wins, along the last axis; ties share the
+    # best rank
+    return 1 + (wins[..., np.newaxis, :] > wins[..., :, np.newaxis]).sum(
+        axis=-1)
+
+
+class SingleFlowLeague(object):
+    def __init__(self, datadir, schemes, win_margin=10.0, store=None,
+                 grid=None):
+        self.datadir = datadir
+        self.schemes = schemes
+        self.win_margin = win_margin
+        self.store = store
+        self.grid = grid or scenarios.load_grid(GRID)
+
+    def envs(self):
+        # (dir_post, one-way delay) of every environment of the grid
+        return [(scenario['name'], scenario['delay'])
+                for scenario in scenarios.expand(self.grid, league=True)]
+
+    def exp_dir(self, cc, dir_post):
+        return '%s-%s-%s' % (self.grid['prefix'], cc, dir_post)
+
+    def load_flows(self, inputs, envs, windows, cells, report=True):
+        # (run_times, flows, per-flow results, counted) of the [scheme,
+        # environment, window] cells, as aggregate_flows takes them; report
+        # prints the flows with no valid data
+        run_times = np.zeros(len(cells), dtype=np.int64)
+        flow_counts = np.zeros(len(cells), dtype=np.int64)
+        metas = []
+        for i, (s, e, w) in enumerate(cells):
+            dir_name = self.exp_dir(self.schemes[s], envs[e][0])
+            info = inputs.metadata(dir_name)
+            run_times[i] = info['run_times']
+            flow_counts[i] = info['flows']
+            metas.append(inputs.results(windows[w], dir_name))
+
+        shape = (len(cells), max(run_times.max(), 0),
+                 max(flow_counts.max(), 0))
+        flows = dict((name, np.full(shape, np.nan)) for name in FLOW_METRICS)
+        counted = np.zeros(shape, dtype=np.int64)
+        for i, (s, e, w) in enumerate(cells):
+            cc = self.schemes[s]
+            for run in xrange(run_times[i]):
+                for flow in xrange(flow_counts[i]):
+                    try:
+                        flow_data = metas[i][cc][str(run + 1)][str(flow + 1)]
+                        if not flow_data['delay_avg'] > 0:
+                            continue
+                    except (KeyError, TypeError):
+                        flow_data = None
+
+                    if flow_data is not None:
+                        for name in FLOW_METRICS:
+                            if flow_data.get(name) is not None:
+                                flows[name][i, run, flow] = flow_data[name]
+                        missing = [step for step, name in enumerate(FLOW_STEPS)
+                                   if flow_data.get(STEP_METRICS.get(
+                                       name, 'delay_avg')) is None]
+                        counted[i, run, flow] = min(missing +
+                                                    [len(FLOW_STEPS)])
+                    if report and (flow_data is None or missing):
+                        print('calculating stuff @' + path.join(
+                            self.datadir, self.exp_dir(cc, envs[e][0])) +
+                            ':no valid data for ' + cc)
+
+        return run_times, flow_counts, flows, counted
+
+    def score_flows(self, inputs, envs, windows, cells, aggregates):
+        # aggregates of the [scheme, environment, window] cells from the
+        # per-flow results of their experiments
+        run_times, flow_counts, flows, counted = self.load_flows(
+            inputs, envs, windows, cells)
+        uni_del = np.array([envs[e][1] for _, e, _ in cells])
+        sums = aggregate_flows(flows, counted, run_times, uni_del)
+        for i, (s, e, w) in enumerate(cells):
+            aggregate = dict((name, sums[name][i].item())
+                             for name in AGGREGATE_METRICS)
+            aggregate['run_times'] = int(run_times[i])
+            aggregate['flows'] = int(flow_counts[i])
+            for name, value in aggregate.items():
+                aggregates[name][s, e, w] = value
+            inputs.save_aggregate(
+                windows[w], self.exp_dir(self.schemes[s], envs[e][0]),
+                aggregate)
+
+    def score(self, envs, windows, per_run=False):
+        # LeagueScores of every scheme, environment and window; with per_run,
+        # also the RunScores of their runs for bootstrap_wins
+        inputs = LeagueInputs(self.datadir, windows, self.store)
+        shape = (len(self.schemes), len(envs), len(windows))
+        aggregates = dict((name, np.zeros(shape)) for name in
+                          AGGREGATE_METRICS + ['run_times', 'flows'])
+
+        cells = []
+        for s, cc in enumerate(self.schemes):
+            for e, (dir_post, _) in enumerate(envs):
+                for w, window in enumerate(windows):
+                    aggregate = inputs.aggregate(window,
+                                                 self.exp_dir(cc, dir_post))
+                    if aggregate is None:
+                        cells.append((s, e, w))
+                        continue
+                    for name, value in aggregate.items():
+                        aggregates[name][s, e, w] = value
+        if cells:
+            self.score_flows(inputs, envs, windows, cells, aggregates)
+
+        # experiments are the same in every window
+        scores = LeagueScores(self.schemes, aggregates,
+                              aggregates['run_times'][:, :, 0],
+                              aggregates['flows'][:, :, 0])
+        if not per_run:
+            inputs.close()
+            return scores
+
+        cells = [(s, e, w) for s in xrange(shape[0])
+                 for e in xrange(shape[1]) for w in xrange(shape[2])]
+        run_times, _, flows, counted = self.load_flows(
+            inputs, envs, windows, cells, report=False)
+        inputs.close()
+        uni_del = np.array([envs[e][1] for _, e, _ in cells])
+        return scores, RunScores(flows, counted, run_times, uni_del, shape)
+
+    def write_env(self, log_path, dir_post, rows, winners):
+        header = ['scheme', 'throughput', 'dela_avg', 'delay_95']
+        for suffix, env_rows in zip(['-sum', '-sum-abs'], rows):
+            with open(path.join(log_path, 'dataset-gen-all-' + dir_post +
+                                suffix), 'w') as sum_file:
+                sum_file.write(league_ranking.column_t([header] + env_rows))
+
+        if winners:
+            with open(path.join(log_path, 'dataset-gen-winner-' + dir_post),
+                      'w') as winner_file:
+                winner_file.write(''.join(w + '\n' for w in winners))
+
+    def write_window(self, scores, envs, w, win_start, win_end):
+        # writes the league directory of window w; returns its environments
+        # and what it has to print
+        output = []
+        dataset_path = league_dir(self.datadir, win_start, win_end)
+        log_path = path.join(dataset_path, 'log')
+        if path.isdir(log_path):
+            shutil.rmtree(log_path)
+        os.makedirs(log_path)
+
+        winners_mask = scores.winners(self.win_margin)[:, :, w]
+        repeats = scores.repeats[:, 0]
+        env_winners = []
+        for e, (dir_post, _) in enumerate(envs):
+            winners = []
+            for s, cc in enumerate(self.schemes):
+                if winners_mask[s, e]:
+                    winners += [cc] * repeats[e]
+            output.append('%s -> winners:%s\n' % (dir_post, winners))
+
+            rows = ([], [])
+            for s, cc in enumerate(self.schemes):
+                if scores.delay_avg_norm[s, e, w] > 0:
+                    rows[0].append([cc] + ['%.3f' % values[s, e, w] for values
+                                           in [scores.tput_norm,
+                                               scores.delay_avg_norm,
+                                               scores.delay_95_norm]])
+                if scores.delay_avg[s, e, w] > 0:
+                    rows[1].append([cc] + ['%.3f' % values[s, e, w] for values
+                                           in [scores.tput, scores.delay_avg,
+                                               scores.delay_95]])
+            self.write_env(log_path, dir_post, rows, winners)
+            if winners:
+                env_winners.append((dir_post, winners))
+
+        # cwnd traces of the winners, in the order of their winner files
+        variants = scenarios.variants(self.grid)
+        traces = [winner_trace(dir_post, winner, variants)
+                  for dir_post, winners in sorted(env_winners)
+                  for winner in winners]
+        with open(path.join(dataset_path, 'winners'), 'w') as winners_file:
+            winners_file.write(''.join(trace + '\n' for trace in traces))
+
+        num_env = len(envs)
+        with open(path.join(dataset_path, 'num_env'), 'w') as num_env_file:
+            num_env_file.write('total %d\nnoloss %d\n' % (num_env, num_env))
+
+        charts = league_ranking.write_charts(
+            dataset_path, self.schemes, scores.wins(self.win_margin)[:, w],
+            num_env)
+        output.append(dataset_path + '\n' + charts)
+
+        return num_env, ''.join(output)
+
+    def write_ranking(self, win_margin, wins, num_envs, windows):
+        # ranks the schemes by their share of the wins in all the games, with
+        # wins[scheme, window]
+        sys.stdout.write(league_ranking.write_ranking(
+            self.ranking_path(win_margin), self.schemes, wins.tolist(),
+            num_envs, windows))
+
+    def ranking_path(self, win_margin):
+        return path.join(self.datadir, '%s-%g' % (league_ranking.SINGLE_OUTPUT,
+                                                  win_margin))
+
+    def write_bootstrap(self, win_margin, wins, resampled, total,
+                        confidence):
+        # the ranking with the confidence interval of the share of the wins
+        # of every scheme, and how often it keeps its rank, in the resamples
+        tail = (100 - confidence) / 2.0
+        low, high = np.percentile(100.0 * resampled / total,
+                                  [tail, 100 - tail], axis=0)
+        stable = (ranks(resampled) == ranks(wins)).mean(axis=0)
+
+        rows = []
+        for s, cc in enumerate(self.schemes):
+            norm = league_ranking.win_percent(wins[s], total)
+            rows.append([cc, str(wins[s]), '%.2f' % norm, '%.2f' % low[s],
+                         '%.2f' % high[s], '%.3f' % stable[s], str(total)])
+
+        ranking = ('scheme wins % ci_low ci_high p_rank num_games\n' +
+                   league_ranking.column_t(league_ranking.sort_wins(rows,
+                                                                    ' ')))
+        with open(self.ranking_path(win_margin) + '-bootstrap',
+                  'w') as ranking_file:
+            ranking_file.write(ranking)
+        sys.stdout.write(ranking)
+
+    def run(self, windows=None, ranking=True, sweep_margins=(), jobs=None,
+            bootstrap=0, confidence=95.0, seed=None):
+        # runs the league of every window (by default those of the grid),
+        # then ranks the schemes over all windows with win_margin and each of
+        # sweep_margins, and with bootstrap resamples of the environments
+        # and runs, their confidence intervals too
+        if windows is None:
+            windows = scenarios.windows(self.grid)
+        envs = self.envs()
+        if bootstrap and ranking:
+            scores, run_scores = self.score(envs, windows, per_run=True)
+        else:
+            scores = self.score(envs, windows)
+
+        # the windows are written by jobs worker processes
+        tasks = [(self, scores, envs, w, win_start, win_end)
+                 for w, (win_start, win_end) in enumerate(windows)]
+        jobs = min(jobs or multiprocessing.cpu_count(), len(tasks))
+        if jobs > 1:
+            pool = multiprocessing.Pool(processes=jobs)
+            results = pool.map(write_window, tasks)
+            pool.close()
+            pool.join()
+        else:
+            results = map(write_window, tasks)
+
+        num_envs = []
+        for num_env, output in results:
+            num_envs.append(num_env)
+            sys.stdout.write(output)
+
+        if not ranking:
+            return
+        total = sum(num_envs)
+        for win_margin in [self.win_margin] + list(sweep_margins):
+            window_wins = scores.wins(win_margin)
+            self.write_ranking(win_margin, window_wins, num_envs, windows)
+            if bootstrap:
+                wins = window_wins.sum(axis=1)
+                self.write_bootstrap(
+                    win_margin, wins, bootstrap_wins(
+                        scores, run_scores, win_margin, bootstrap, seed),
+                    total, confidence)
+
+    def run_window(self, win_start, win_end):
+        self.run([(win_start, win_end)], ranking=False, jobs=1)
+
+
+def write_window(task):
+    # runs in a worker, with the scores of every window made once before
+    league, scores, envs, w, win_start, win_end = task
+    return league.write_window(scores, envs, w, win_start, win_end)
+
+
+def main():
+    args = arg_parser.parse_league()
+
+    league = SingleFlowLeague(args.datadir, args.schemes.split(),
+                              win_margin=args.win_margin, store=args.store,
+                              grid=scenarios.load_grid(args.grid))
+    windows = None
+    if args.windows:
+        windows = [(int(win_start), int(win_end))
+                   for win_start, win_end in args.windows]
+    league.run(windows, sweep_margins=args.sweep_margins or [],
+               jobs=args.jobs, bootstrap=args.bootstrap,
+               confidence=args.confidence, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import sys
+import json
+from os import path
+
+import arg_parser
+import context
+from helpers import scenarios
+
+# the rankings of the leagues: the wins of every scheme in each window (the
+# charts of its league directory) and over all windows, written as a table
+# and as <ranking>.json. league.py makes them from its scores in memory;
+# "league_ranking.py --grid two-flow" makes them from the winners and num_env
+# files that league-piecewise-2flows.py leaves in every league directory.
+LEAGUE_PREFIX = 'dataset-gen-league-'
+MULTI_LEAGUE_PREFIX = 'dataset-gen-league-multiflows-'
+SINGLE_OUTPUT = 'charts-overall-ranking-single-flow'
+MULTI_OUTPUT = 'charts-overall-ranking-multi'
+
+
+def column_t(rows):
+    # rows of fields aligned like "column -t" does
+    widths = {}
+    for row in rows:
+        for i, field in enumerate(row):
+            widths[i] = max(widths.get(i, 0), len(field))
+
+    lines = []
+    for row in rows:
+        lines.append('  '.join(
+            field.ljust(widths[i]) if i < len(row) - 1 else field
+            for i, field in enumerate(row)))
+    return ''.join(line + '\n' for line in lines)
+
+
+def sort_wins(rows, sep):
+    # like "sort -k2 -rh" of the rows joined by sep: most wins first, then by
+    # the whole line, reversed
+    return sorted(rows, key=lambda row: (int(row[1]), sep.join(row)),
+                  reverse=True)
+
+
+def win_percent(wins, total):
+    # percentage truncated to 1e-9 and rounded to 2 decimals
+    return float('%de-9' % (1000000000 * 100 * wins / total))
+
+
+def count_wins(traces, schemes, tag=''):
+    # wins of every scheme in a window from the cwnd traces of its winners;
+    # a trace counts for a scheme when it starts with its name, an underscore
+    # and tag, as the league scripts grepped them
+    return [sum(1 for trace in traces if trace.startswith(cc + '_' + tag))
+            for cc in schemes]
+
+
+def write_charts(dataset_path, schemes, wins, num_env):
+    # the wins of every scheme in one window and their share of its
+    # environments; returns the charts
+    rows = sort_wins([[cc, str(wins[s]), '%.6g' % (float(wins[s]) / num_env)]
+                      for s, cc in enumerate(schemes)], '\t ')
+    charts = ''.join('\t '.join(row) + '\n' for row in rows)
+    with open(path.join(dataset_path, 'charts'), 'w') as charts_file:
+        charts_file.write(charts)
+    return charts
+
+
+def write_ranking(ranking_path, schemes, wins, num_envs, windows):
+    # ranks the schemes by their share of the wins in all the games of the
+    # windows, with wins[scheme][window] and num_envs[window]; returns the
+    # ranking
+    total = sum(num_envs)
+    sums = [sum(scheme_wins) for scheme_wins in wins]
+
+    rows = [[cc, str(sums[s]), '%.2f' % win_percent(sums[s], total),
+             str(total)] for s, cc in enumerate(schemes)]
+    ranking = 'scheme wins % num_games\n' + column_t(sort_wins(rows, ' '))
+    with open(ranking_path, 'w') as ranking_file:
+        ranking_file.write(ranking)
+
+    ranking_json = {
+        'total': total,
+        'schemes': dict((cc, {'wins': sums[s],
+                              'percent': win_percent(sums[s], total)})
+                        for s, cc in enumerate(schemes)),
+        'windows': [{'start': win_start, 'end': win_end,
+                     'num_env': num_envs[w],
+                     'wins': dict((cc, wins[s][w])
+                                  for s, cc in enumerate(schemes))}
+                    for w, (win_start, win_end) in enumerate(windows)],
+    }
+    with open(ranking_path + '.json', 'w') as json_file:
+        json.dump(ranking_json, json_file, sort_keys=True, indent=4,
+                  separators=(',', ': '))
+    return ranking
+
+
+def read_window(dataset_path):
+    # (winners' cwnd traces, number of environments) of a league directory
+    with open(path.join(dataset_path, 'winners')) as winners_file:
+        traces = winners_file.read().split()
+
+    num_env = 0
+    with open(path.join(dataset_path, 'num_env')) as num_env_file:
+        for line in num_env_file:
+            fields = line.split()
+            if len(fields) == 2 and fields[0] == 'total':
+                num_env = int(fields[1])
+    return traces, num_env
+
+
+def rank_league(datadir, schemes, grid, output=None):
+    # writes the charts of every league window of the grid and the overall
+    # ranking from the league directories under datadir
+    multi = grid['flows'] > 1
+    prefix = MULTI_LEAGUE_PREFIX if multi else LEAGUE_PREFIX
+    tag = '%d' % grid['flows'] if multi else ''
+    output = output or (MULTI_OUTPUT if multi else SINGLE_OUTPUT)
+
+    windows = scenarios.windows(grid, league=True)
+    wins = [[] for cc in schemes]
+    num_envs = []
+    for win_start, win_end in windows:
+        dataset_path = path.join(datadir, '%s%d_%d' % (prefix, win_start,
+                                                       win_end))
+        if not path.isdir(dataset_path):
+            sys.exit('%s does not exist; run the league of its window first'
+                     % dataset_path)
+
+        traces, num_env = read_window(dataset_path)
+        window_wins = count_wins(traces, schemes, tag)
+        for s, scheme_wins in enumerate(window_wins):
+            wins[s].append(scheme_wins)
+        num_envs.append(num_env)
+        print(dataset_path + '\n' + write_charts(dataset_path, schemes,
+                                                 window_wins, num_env),
+              end='')
+
+    sys.stdout.write(write_ranking(path.join(datadir, output), schemes, wins,
+                                   num_envs, windows))
+
+
+def main():
+    args = arg_parser.parse_league_ranking()
+    rank_league(args.datadir, args.schemes.split(),
+                scenarios.load_grid(args.grid), args.output)
+
+
+if __name__ == '__main__':
+    main()
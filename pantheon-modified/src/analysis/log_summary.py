@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import os
+import json
+
+import tunnel_log
+import stream_stats
+
+# "merge_tunnel_logs.py multiple --summary" writes the statistics of the
+# merged log to <log>.summary.json while merging, so that the analysis
+# does not have to read the log again. By default its delay percentiles and
+# jitter come from bounded histograms (as with --approx-delay), so merging
+# takes the same memory however long the log is, and only analysis run with
+# --approx-delay uses them; with --exact-delay every per-packet delay of the
+# log and of each window is kept until the end of the merge instead
+SUMMARY_SUFFIX = '.summary.json'
+SUMMARY_VERSION = 1
+
+# TunnelGraph attributes that plot_throughput_graph() needs
+GRAPH_ATTRS = ['flows', 'avg_capacity', 'link_capacity', 'link_capacity_t',
+               'avg_ingress', 'avg_egress', 'ingress_tput', 'ingress_t',
+               'egress_tput', 'egress_t']
+
+
+class LogSummarizer(object):
+    # accumulates the summary of the whole log and of every (start, end)
+    # window in seconds from the blocks of lines written to a merged log
+    def __init__(self, windows=None, ms_per_bin=500, exact_delay=False):
+        self.windows = windows or []
+        self.ms_per_bin = ms_per_bin
+        self.exact_delay = exact_delay
+        self.summary = stream_stats.TunnelSummary(exact_delay, ms_per_bin)
+        self.window_summaries = dict(
+            (window, stream_stats.TunnelSummary(exact_delay))
+            for window in self.windows)
+
+    def add(self, lines):
+        parsed = tunnel_log.parse_block('\n'.join(lines) + '\n')
+        if parsed is None:
+            return
+
+        log = tunnel_log.TunnelLog(*parsed)
+        self.summary.add(log)
+        for (win_start, win_end), summary in self.window_summaries.items():
+            summary.add(log.window(win_start * 1000, win_end * 1000))
+
+    def save(self, tunnel_log_path):
+        # both modules load summaries through this one
+        import tunnel_graph
+        import parse_piecewise
+
+        graph = tunnel_graph.TunnelGraph(tunnel_log_path,
+                                         ms_per_bin=self.ms_per_bin,
+                                         exact_delay=self.exact_delay)
+        results = graph.run(summary=self.summary)
+
+        piecewise = []
+        for win_start, win_end in self.windows:
+            parser = parse_piecewise.ParsePiecewise(
+                tunnel_log_path, win_start, win_end,
+                exact_delay=self.exact_delay)
+            piecewise.append(
+                [win_start, win_end,
+                 parser.run(summary=self.window_summaries[(win_start,
+                                                           win_end)])])
+
+        save_summary(tunnel_log_path, {
+            'ms_per_bin': self.ms_per_bin,
+            'exact_delay': self.exact_delay,
+            'tunnel_graph': {
+                'results': results,
+                'graph': dict((attr, getattr(graph, attr))
+                              for attr in GRAPH_ATTRS)},
+            'piecewise': piecewise})
+
+
+def summary_stamp(tunnel_log_path):
+    st = os.stat(tunnel_log.stored_path(tunnel_log_path))
+    return {'version': SUMMARY_VERSION,
+            'size': st.st_size,
+            'mtime': st.st_mtime}
+
+
+def int_keys(d):
+    # JSON turns the integer flow ids used as keys into strings
+    return dict((int(k) if k.isdigit() else k, v) for k, v in d.items())
+
+
+def save_summary(tunnel_log_path, data):
+    data['source'] = summary_stamp(tunnel_log_path)
+
+    summary_path = tunnel_log.stored_path(tunnel_log_path) + SUMMARY_SUFFIX
+    tmp_path = summary_path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as summary_fh:
+            json.dump(data, summary_fh)
+        os.rename(tmp_path, summary_path)
+    except (IOError, OSError):
+        pass
+
+
+def load_summary(tunnel_log_path, exact_delay=False):
+    # a summary of approximate delays does not do for exact_delay readers;
+    # those written before it was an option kept exact delays
+    try:
+        with open(tunnel_log.stored_path(tunnel_log_path) +
+                  SUMMARY_SUFFIX) as summary_fh:
+            data = json.load(summary_fh)
+        if data['source'] != summary_stamp(tunnel_log_path):
+            return None
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    if exact_delay and not data.get('exact_delay', True):
+        return None
+
+    return data
+
+
+def graph_summary(tunnel_log_path, ms_per_bin, exact_delay=False):
+    # (results of TunnelGraph.run(), attributes for plotting) or None
+    data = load_summary(tunnel_log_path, exact_delay)
+    if data is None or data['ms_per_bin'] != ms_per_bin:
+        return None
+
+    results = data['tunnel_graph']['results']
+    results['flow_data'] = int_keys(results['flow_data'])
+
+    graph = data['tunnel_graph']['graph']
+    for attr in GRAPH_ATTRS:
+        if isinstance(graph[attr], dict):
+            graph[attr] = int_keys(graph[attr])
+    graph['flows'] = dict.fromkeys(graph['flows'], True)
+
+    return results, graph
+
+
+def piecewise_summary(tunnel_log_path, exact_delay=False):
+    # {(start, end): results of ParsePiecewise.run()}, empty if none
+    data = load_summary(tunnel_log_path, exact_delay)
+    if data is None:
+        return {}
+
+    ret = {}
+    for win_start, win_end, results in data['piecewise']:
+        results['flow_data'] = int_keys(results['flow_data'])
+        ret[(win_start, win_end)] = results
+    return ret
@@ -2,28 +2,369 @@ from __future__ import print_function, division
 import numpy as np
 import pandas as pd
 import sys
-import bisect
+from os import path
+import itertools
 
-def analyze_trace_file(filename):
-    print('READING:', filename)
+import arg_parser
+import context
+from helpers import compressed_log
+import tunnel_log
+
+# default directory of the cwnd timestamps and of the features written
+DATASET_DIR = '/d1/ccBench/pantheon-modified/third_party/tcpdatagen/dataset'
+
+# output format -> file extension
+OUTPUT_FORMATS = {'csv': '.csv', 'npz': '.npz', 'parquet': '.parquet'}
+
+# window size (ms) of the features
+DEFAULT_TIME_STEP = 10.0
+
+
+def read_trace_blocks(filename, chunk_bytes=tunnel_log.CHUNK_BYTES):
+    # columns of the events in a trace block by block, skipping header
+    # (first 7 lines) and footer (last line); the trace may be stored
+    # compressed
+    with compressed_log.open_log(filename, 'rb') as f:
+        header_lines = 7
+        pending = ''
+        while True:
+            data = f.read(chunk_bytes)
+            pending += data
+            while header_lines and '\n' in pending:
+                pending = pending[pending.index('\n') + 1:]
+                header_lines -= 1
+
+            if not header_lines:
+                # the last line might be the footer, so it is held back
+                # until the end of the trace
+                cut = pending.rfind('\n', 0, len(pending) - 1) + 1
+                body, pending = pending[:cut], pending[cut:]
+                parsed = tunnel_log.parse_block(body) if body else None
+                if parsed is not None:
+                    yield parsed[:4]
+
+            if not data:
+                return
+
+
+def read_trace(filename):
+    blocks = list(read_trace_blocks(filename))
+    if not blocks:
+        return (np.zeros(0), np.zeros(0, dtype=np.int8),
+                np.zeros(0, dtype=np.int32), np.zeros(0))
+    return tuple(np.concatenate(c) for c in zip(*blocks))
+
+
+def prefix_sum(values):
+    return np.concatenate(([0], np.cumsum(values)))
+
+
+class TraceSums(object):
+    # prefix sums over the sorted events of a trace, or of a part of it;
+    # every window is a slice of the events, so its sums, counts and moments
+    # are differences of these, whatever the window size. The windows end at
+    # the cwnd timestamps, which are not evenly spaced, so the windows of a
+    # coarser step are not unions of those of a finer one; these per-event
+    # aggregates are the finest level every window is derived from
+    def __init__(self, ts, event, size, delay, drop_before=False):
+        # drop_before: the last drop or egress before ts[0] was a drop
+        self.ts = ts
+
+        channel = event == tunnel_log.CAPACITY
+        egress = event == tunnel_log.DEPARTURE
+        drop = event == tunnel_log.DROP
+        ingress = event == tunnel_log.ARRIVAL
+
+        delay = np.where(egress & ~np.isnan(delay), delay, 0).astype(np.int64)
+        size = size.astype(np.int64)
+
+        self.channel_bytes = prefix_sum(np.where(channel, size, 0))
+        self.egress_pkts = prefix_sum(egress)
+        self.delay = prefix_sum(delay)
+        self.drops = prefix_sum(drop)
+        self.ingress_pkts = prefix_sum(ingress)
+        self.rec_bytes = prefix_sum(np.where(egress, size, 0))
+
+        # distinct milliseconds with a delivery opportunity: the first event
+        # of every millisecond, plus the first one in the window
+        channel_ms = np.floor(ts[channel])
+        new_ms = np.ones(len(channel_ms), dtype=bool)
+        new_ms[1:] = channel_ms[1:] != channel_ms[:-1]
+        self.channel = prefix_sum(channel)
+        self.new_ms = prefix_sum(new_ms)
+
+        # loss bursts are runs of drops not broken by an egress; a run that
+        # started before the window counts as a new burst in it
+        lossy = egress | drop
+        self.lossy_drop = np.append(drop[lossy], False)
+        self.run_start = self.lossy_drop.copy()
+        self.run_start[1:] &= ~self.lossy_drop[:-1]
+        self.run_start[0] &= not drop_before
+        self.lossy = prefix_sum(lossy)
+        self.run_starts = prefix_sum(self.run_start[:-1])
+
+        # inter-arrival times of the egress packets, and their first two
+        # moments; mm-link times are whole milliseconds, which keeps the
+        # moments exact integers, otherwise they are taken about the mean to
+        # keep the differences of the sums of squares accurate
+        self.arrival_diffs = np.diff(ts[egress])
+        diffs = self.arrival_diffs
+        if np.array_equal(diffs, np.floor(diffs)):
+            diffs = diffs.astype(np.int64)
+        else:
+            diffs = diffs - diffs.mean()
+        self.diff_moments = prefix_sum(diffs)
+        self.diff_sq_moments = prefix_sum(diffs * diffs)
+
+    def windows(self, times, time_step):
+        # event index ranges [left, right) of the windows [t - time_step, t)
+        return (np.searchsorted(self.ts, times - time_step, side='left'),
+                np.searchsorted(self.ts, times, side='left'))
+
+
+class BufferOccupancy(object):
+    # packets in the buffer at every cwnd timestamp t: as in the original
+    # script, those that entered minus those that left in [t - 10 ms, t) are
+    # added to it, within [0, capacity]. It is a state of the queue, not an
+    # aggregate of a window, so it is tracked once at the 10 ms step and the
+    # features of every time step sample it. It carries over from one group
+    # of timestamps to the next
+    def __init__(self, capacity_pkts, time_step=DEFAULT_TIME_STEP):
+        self.capacity_pkts = capacity_pkts
+        self.time_step = time_step
+        self.occupancy_pkts = 0
+
+    def track(self, sums, times):
+        left, right = sums.windows(times, self.time_step)
+        net_pkts = ((sums.ingress_pkts[right] - sums.ingress_pkts[left]) -
+                    (sums.egress_pkts[right] - sums.egress_pkts[left]))
+
+        occupancies = np.zeros(len(times))
+        occupancy_pkts = self.occupancy_pkts
+        for i, net in enumerate(net_pkts.tolist()):
+            occupancy_pkts = min(max(occupancy_pkts + net, 0),
+                                 self.capacity_pkts)
+            occupancies[i] = occupancy_pkts
+        self.occupancy_pkts = occupancy_pkts
+        return occupancies
+
+
+class WindowFeatures(object):
+    # features of the events in [t - time_step, t) for every cwnd timestamp
+    # t, computed for consecutive groups of timestamps, given the buffer
+    # occupancy at each. The last queueing delay carries over from one group
+    # to the next.
+    #
+    # exact_jitter gathers the inter-arrival times of every window to take
+    # their standard deviation in two passes; otherwise it comes from the
+    # moments of the window, which does not grow with the window size
+    def __init__(self, capacity_pkts, mRTT, T_end,
+                 time_step=DEFAULT_TIME_STEP, exact_jitter=True):
+        self.capacity_pkts = capacity_pkts
+        self.mRTT = mRTT
+        self.T_end = T_end
+        self.time_step = time_step
+        self.exact_jitter = exact_jitter
+
+        self.last_avg_delay = None
+
+    def jitter(self, sums, lo, hi):
+        # standard deviation of the inter-arrival times of the egress
+        # packets [lo, hi) of each window
+        num_points = len(lo)
+        num_diffs = np.maximum(hi - lo - 1, 0)
+        denom = np.maximum(num_diffs, 1)
+
+        if not self.exact_jitter:
+            start = np.minimum(lo, len(sums.arrival_diffs))
+            end = start + num_diffs
+            diff_sum = sums.diff_moments[end] - sums.diff_moments[start]
+            sq_sum = sums.diff_sq_moments[end] - sums.diff_sq_moments[start]
+            var_diff = np.maximum(num_diffs * sq_sum - diff_sum * diff_sum,
+                                  0) / (denom * denom)
+            return np.where(num_diffs > 0, np.sqrt(var_diff), 0)
+
+        # over the gathered diffs of all windows
+        first_diff = np.cumsum(num_diffs) - num_diffs
+        diff_index = (np.repeat(lo - first_diff, num_diffs) +
+                      np.arange(num_diffs.sum()))
+        diff_window = np.repeat(np.arange(num_points), num_diffs)
+        diffs = sums.arrival_diffs[diff_index]
+        mean_diff = np.bincount(diff_window, diffs,
+                                minlength=num_points) / denom
+        var_diff = np.bincount(diff_window,
+                               (diffs - mean_diff[diff_window]) ** 2,
+                               minlength=num_points) / denom
+        return np.where(num_diffs > 0, np.sqrt(var_diff), 0)
+
+    def compute(self, sums, times, buffer_occupancies_bytes):
+        capacity_pkts = self.capacity_pkts
+        time_step = self.time_step
+        num_points = len(times)
+
+        left, right = sums.windows(times, time_step)
+
+        def window_sum(prefix):
+            return prefix[right] - prefix[left]
+
+        channel_bytes = window_sum(sums.channel_bytes)
+        egress_pkts = window_sum(sums.egress_pkts)
+        delay_sum = window_sum(sums.delay)
+        drops = window_sum(sums.drops)
+        ingress_pkts = window_sum(sums.ingress_pkts)
+        rec_bytes = window_sum(sums.rec_bytes)
+
+        lo, hi = sums.channel[left], sums.channel[right]
+        busy_ms = np.where(
+            hi > lo,
+            1 + sums.new_ms[hi] - sums.new_ms[np.minimum(lo + 1, hi)], 0)
 
-    # Read trace, skipping header (first 7) and footer (last line)
-    with open(filename, 'r') as f:
-        raw_lines = f.readlines()[7:-1]
-    print('FINISHED READING TRACE')
-
-    # Parse trace lines
-    parsed_lines = []
-    timestamps = []
-    for line in raw_lines:
-        parts = line.rstrip().split()
-        t = float(parts[0])
-        label = parts[1]
-        size = int(parts[2]) if len(parts) > 2 else 0
-        delay = int(parts[3]) if len(parts) > 3 else 0
-        parsed_lines.append((t, label, size, delay))
-        timestamps.append(t)
+        lo, hi = sums.lossy[left], sums.lossy[right]
+        bursts = (sums.run_starts[hi] - sums.run_starts[lo] +
+                  ((hi > lo) & sums.lossy_drop[lo] & ~sums.run_start[lo]))
 
+        inter_arrival_jitter_ms = self.jitter(
+            sums, sums.egress_pkts[left], sums.egress_pkts[right])
+
+        net_pkts = ingress_pkts - egress_pkts
+        free_buffer_pkts = capacity_pkts - buffer_occupancies_bytes
+
+        # occupancy only changes between windows, so it does not vary in one
+        queue_length_var_bytes = np.zeros(num_points)
+
+        # Original metric computations
+        channel_capacities = (channel_bytes / time_step) * 8 * 1000 / 1e6
+        avg_queuing_delays = np.where(
+            egress_pkts > 0, delay_sum / np.maximum(egress_pkts, 1), 0)
+        previous_delays = np.concatenate((
+            [avg_queuing_delays[0] if self.last_avg_delay is None
+             else self.last_avg_delay], avg_queuing_delays[:-1]))
+        queueing_delay_gradients = avg_queuing_delays - previous_delays
+        self.last_avg_delay = avg_queuing_delays[-1]
+        drop_rates = np.where(drops + egress_pkts > 0,
+                              drops / np.maximum(drops + egress_pkts, 1), 0)
+        loss_burst_length_pkts = np.where(bursts > 0,
+                                          drops / np.maximum(bursts, 1), 0)
+        rec_rates = (rec_bytes / time_step) * 8 * 1000 / 1e6
+
+        # time to buffer full (ms), capped at end of trace
+        until_end = self.T_end - times
+        fill_rate = np.where(net_pkts > 0, net_pkts, 1) / time_step
+        time_to_buffer_full_ms = np.where(
+            net_pkts > 0,
+            np.minimum(free_buffer_pkts / fill_rate, until_end), until_end)
+
+        # link busyness fraction in this window
+        link_busyness_fraction = busy_ms / time_step
+
+        times_df = times.astype(np.float64)
+        mRTTs = np.full(num_points, self.mRTT)
+
+        return {
+            'time_ms':                    times_df,
+            'channel_capacity_Mbps':      channel_capacities,
+            'avg_queuing_delay_ms':       avg_queuing_delays,
+            'queueing_delay_gradient_ms': queueing_delay_gradients,
+            'free_buffer_pkts':           free_buffer_pkts,
+            'buffer_occupancy_pkts':      buffer_occupancies_bytes,
+            'queue_length_var_pkts':      queue_length_var_bytes,
+            'drop_rate':                  drop_rates,
+            'loss_burst_length_pkts':     loss_burst_length_pkts,
+            'rec_rate_Mbps':              rec_rates,
+            'inter_arrival_jitter_ms':    inter_arrival_jitter_ms,
+            # 'time_to_buffer_full_ms':  time_to_buffer_full_ms,
+            'link_busyness_fraction':     link_busyness_fraction,
+            'mRTT_ms':                    mRTTs
+        }
+
+
+def compute_levels(sums, times, buffer, levels):
+    # one set of columns per WindowFeatures in levels, which all sample the
+    # same buffer occupancy
+    occupancies = buffer.track(sums, times)
+    return [features.compute(sums, times, occupancies) for features in levels]
+
+
+def stream_features(blocks, times, buffer, levels):
+    # computes each window as soon as an event at or after its end has been
+    # read, and drops the events before the start of every later window of
+    # the longest time step; one set of columns per WindowFeatures in levels
+    longest_step = max([buffer.time_step] +
+                       [features.time_step for features in levels])
+    ready_times = np.maximum.accumulate(times)
+    later_starts = np.minimum.accumulate(times[::-1])[::-1] - longest_step
+
+    columns = [[] for _ in levels]
+    buf = None
+    drop_before = False
+    done = 0
+    for block in itertools.chain(blocks, [None]):
+        if block is not None:
+            if buf is not None:
+                block = tuple(np.concatenate(c) for c in zip(buf, block))
+            buf = block
+            if not len(buf[0]):
+                continue
+            ready = np.searchsorted(ready_times, buf[0][-1], side='right')
+        else:
+            ready = len(times)
+            if buf is None:
+                buf = (np.zeros(0), np.zeros(0, dtype=np.int8),
+                       np.zeros(0, dtype=np.int32), np.zeros(0))
+
+        if ready > done:
+            sums = TraceSums(*buf, drop_before=drop_before)
+            for level, level_columns in zip(
+                    compute_levels(sums, times[done:ready], buffer, levels),
+                    columns):
+                level_columns.append(level)
+            done = ready
+        if done == len(times):
+            break
+
+        keep = np.searchsorted(buf[0], later_starts[done], side='left')
+        if keep:
+            event = buf[1][:keep]
+            lossy = np.flatnonzero((event == tunnel_log.DEPARTURE) |
+                                   (event == tunnel_log.DROP))
+            if len(lossy):
+                drop_before = event[lossy[-1]] == tunnel_log.DROP
+            buf = tuple(c[keep:] for c in buf)
+
+    return [dict((name, np.concatenate([c[name] for c in level_columns]))
+                 for name in level_columns[0])
+            for level_columns in columns]
+
+
+def write_features(columns, out_path, output_format):
+    print('WRITING:', out_path)
+    if output_format == 'npz':
+        np.savez_compressed(out_path, **columns)
+        return
+
+    df_out = pd.DataFrame(columns)
+    if output_format == 'csv':
+        df_out.to_csv(out_path, index=False)
+        return
+
+    try:
+        df_out.to_parquet(out_path)
+    except ImportError as exception:
+        sys.exit('Parquet output needs pyarrow or fastparquet: %s'
+                 % exception)
+
+
+def output_name(cwnd_id, time_step, output_format):
+    # the 10 ms features keep their original name, <id>.csv; the other
+    # time steps go to <id>-<step>ms.csv
+    if time_step == DEFAULT_TIME_STEP:
+        return cwnd_id + OUTPUT_FORMATS[output_format]
+    return '%s-%gms%s' % (cwnd_id, time_step, OUTPUT_FORMATS[output_format])
+
+
+def analyze_trace_file(filename, stream=False, output_format='csv',
+                       output_dir=DATASET_DIR, cwnd_dir=DATASET_DIR,
+                       time_steps=None):
     # Extract scenario parameters from parent directory
     dirname = filename.split('/')[-2]  # e.g. "single-flow-scenario-100-200"
     capacity_pkts = int(dirname.split('-')[-2])  # buffer capacity in packets
@@ -31,155 +372,44 @@ def analyze_trace_file(filename):
 
     # Read cwnd timestamps (ms)
     cwnd_id = dirname.replace("single-flow-scenario-", "")
-    cwnd_file = '/d1/ccBench/pantheon-modified/third_party/tcpdatagen/dataset/{0}-cwnd.txt'.format(cwnd_id)
+    cwnd_file = path.join(cwnd_dir, '{0}-cwnd.txt'.format(cwnd_id))
     with open(cwnd_file, 'r') as f:
         times = np.array([float(line.split()[0]) * 1000 for line in f])  # ms
 
-    time_step = 10.0  # ms
-    num_points = len(times)
-    T_end = times[-1]
-
-    # Pre-allocate arrays for metrics
-    times_df                   = np.zeros(num_points)
-    channel_capacities         = np.zeros(num_points)
-    avg_queuing_delays         = np.zeros(num_points)
-    queueing_delay_gradients   = np.zeros(num_points)
-    free_buffer_pkts           = np.zeros(num_points)
-    buffer_occupancies_bytes   = np.zeros(num_points)
-    queue_length_var_bytes     = np.zeros(num_points)
-    drop_rates                 = np.zeros(num_points)
-    loss_burst_length_pkts     = np.zeros(num_points)
-    rec_rates                  = np.zeros(num_points)
-    inter_arrival_jitter_ms    = np.zeros(num_points)
-    mRTTs                      = np.full(num_points, mRTT)
-    time_to_buffer_full_ms     = np.zeros(num_points)
-    link_busyness_fraction     = np.zeros(num_points)
-
-    # State for occupancy tracking
-    occupancy_pkts = 0
-
-    for i in range(num_points):
-        start_t = times[i] - time_step
-        end_t   = times[i]
-
-        # select events in [start_t, end_t)
-        left  = bisect.bisect_left(timestamps, start_t)
-        right = bisect.bisect_left(timestamps, end_t)
-        window_events = parsed_lines[left:right]
-
-        # Trackers for new metrics
-        burst_lengths = []
-        current_burst = 0
-        arrival_times = []
-        occupancy_samples = []
-        busy_ms_set = set()
-
-        # Original accumulators
-        channel_bytes = 0
-        egress_pkts   = 0
-        delay_sum     = 0
-        drops         = 0
-        ingress_pkts  = 0
-        rec_bytes     = 0
-
-        for (t, label, size, delay) in window_events:
-            # channel throughput marker
-            if '#' in label:
-                channel_bytes += size
-                busy_ms_set.add(int(t))  # mark this ms as busy
-
-            # successful egress ('-')
-            if '-' in label:
-                egress_pkts += 1
-                delay_sum += delay
-                rec_bytes += size
-                arrival_times.append(t)
-                # end any loss burst
-                if current_burst > 0:
-                    burst_lengths.append(current_burst)
-                    current_burst = 0
-
-            # drop ('d')
-            elif 'd' in label:
-                drops += 1
-                current_burst += 1
-
-            # ingress ('+')
-            elif '+' in label:
-                ingress_pkts += 1
-
-            occupancy_samples.append(occupancy_pkts)
-
-        # finalize any ongoing burst
-        if current_burst > 0:
-            burst_lengths.append(current_burst)
-
-        # Update occupancy (packets)
-        net_pkts = ingress_pkts - egress_pkts
-        occupancy_pkts = min(max(occupancy_pkts + net_pkts, 0), capacity_pkts)
-        free_pkts = capacity_pkts - occupancy_pkts
+    # all time steps are computed from the same pass over the trace; only
+    # the finest one pays for gathering the inter-arrival times
+    time_steps = sorted(set(time_steps or [DEFAULT_TIME_STEP]))
+    buffer = BufferOccupancy(capacity_pkts)
+    levels = [WindowFeatures(capacity_pkts, mRTT, times[-1], time_step,
+                             exact_jitter=time_step == time_steps[0])
+              for time_step in time_steps]
+
+    print('READING:', filename)
+    if stream:
+        # the trace is never held in memory as a whole
+        level_columns = stream_features(read_trace_blocks(filename), times,
+                                        buffer, levels)
+    else:
+        sums = TraceSums(*read_trace(filename))
+        print('FINISHED READING TRACE')
+        level_columns = compute_levels(sums, times, buffer, levels)
+
+    for time_step, columns in zip(time_steps, level_columns):
+        write_features(columns, path.join(
+            output_dir, output_name(cwnd_id, time_step, output_format)),
+            output_format)
+
+
+def main():
+    args = arg_parser.parse_network_oracle()
+
+    analyze_trace_file(args.trace_base + 'tcpdatagen_mm_datalink_run1.log',
+                       stream=args.stream,
+                       output_format=args.output_format,
+                       output_dir=args.output_dir or DATASET_DIR,
+                       cwnd_dir=args.cwnd_dir or DATASET_DIR,
+                       time_steps=args.time_steps)
 
-        # Original metric computations
-        channel_capacity_mbps = (channel_bytes / time_step) * 8 * 1000 / 1e6
-        avg_q_delay_ms        = delay_sum / egress_pkts if egress_pkts else 0
-        drop_rate_val         = drops / (drops + egress_pkts) if (drops + egress_pkts) else 0
-        rec_rate_mbps         = (rec_bytes / time_step) * 8 * 1000 / 1e6
-
-        # New metric: time to buffer full (ms), capped at end of trace
-        if net_pkts > 0:
-            remaining_pkts = capacity_pkts - occupancy_pkts
-            ttf = remaining_pkts / (net_pkts / time_step)
-            ttf = min(ttf, T_end - times[i])
-        else:
-            ttf = T_end - times[i]
-
-        # New metric: link busyness fraction in this window
-        busy_ms = len(busy_ms_set)
-        busyness = busy_ms / time_step
-
-        # Store into arrays
-        times_df[i]                   = end_t
-        channel_capacities[i]         = channel_capacity_mbps
-        avg_queuing_delays[i]         = avg_q_delay_ms
-        queueing_delay_gradients[i]   = (avg_q_delay_ms - avg_queuing_delays[i-1]) if i > 0 else 0
-        free_buffer_pkts[i]           = free_pkts
-        buffer_occupancies_bytes[i]   = occupancy_pkts
-        queue_length_var_bytes[i]     = np.var(occupancy_samples) if occupancy_samples else 0
-        drop_rates[i]                 = drop_rate_val
-        loss_burst_length_pkts[i]     = np.mean(burst_lengths) if burst_lengths else 0
-        rec_rates[i]                  = rec_rate_mbps
-        inter_arrival_jitter_ms[i]    = np.std(np.diff(arrival_times)) if len(arrival_times) > 1 else 0
-        mRTTs[i]                      = mRTT
-        time_to_buffer_full_ms[i]     = ttf
-        link_busyness_fraction[i]     = busyness
-
-    # Assemble DataFrame
-    df_out = pd.DataFrame({
-        'time_ms':                    times_df,
-        'channel_capacity_Mbps':      channel_capacities,
-        'avg_queuing_delay_ms':       avg_queuing_delays,
-        'queueing_delay_gradient_ms': queueing_delay_gradients,
-        'free_buffer_pkts':           free_buffer_pkts,
-        'buffer_occupancy_pkts':      buffer_occupancies_bytes,
-        'queue_length_var_pkts':      queue_length_var_bytes,
-        'drop_rate':                  drop_rates,
-        'loss_burst_length_pkts':     loss_burst_length_pkts,
-        'rec_rate_Mbps':              rec_rates,
-        'inter_arrival_jitter_ms':    inter_arrival_jitter_ms,
-        # 'time_to_buffer_full_ms':  time_to_buffer_full_ms,
-        'link_busyness_fraction':     link_busyness_fraction,
-        'mRTT_ms':                    mRTTs
-    })
-
-    # Write CSV
-    output_name = dirname.replace('single-flow-scenario-', '') + '.csv'
-    out_path = '/d1/ccBench/pantheon-modified/third_party/tcpdatagen/dataset/{0}'.format(output_name)
-    print('WRITING:', out_path)
-    df_out.to_csv(out_path, index=False)
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <trace_file_base_without_.log>")
-        sys.exit(1)
-    base = sys.argv[1]
-    analyze_trace_file(base + 'tcpdatagen_mm_datalink_run1.log')
+    main()
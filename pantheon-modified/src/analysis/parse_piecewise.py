@@ -5,137 +5,80 @@ import sys
 import itertools
 import numpy as np
 import arg_parser
+import tunnel_log
+import stream_stats
+import log_summary
 
 class ParsePiecewise(object):
-    def __init__(self, tunnel_log,win_start_time_s=0,win_end_time_s=100):
+    def __init__(self, tunnel_log,win_start_time_s=0,win_end_time_s=100,
+                 windows=None, cache=True, stream=False, exact_delay=True):
         self.tunnel_log = tunnel_log
         self.win_start_time_s = win_start_time_s
         self.win_end_time_s = win_end_time_s
 
-    def parse_tunnel_log(self):
-        tunlog = open(self.tunnel_log)
+        # without the parsed-log cache, seek into the text log instead
+        self.cache = cache
 
-        self.flows = {}
-        first_ts = None
-        capacities = 0
+        # stream=True keeps memory bounded by not holding the whole window;
+        # exact_delay=False estimates delay percentiles and jitter from a
+        # histogram instead of keeping every per-packet delay
+        self.stream = stream
+        self.exact_delay = exact_delay
 
-        arrivals = {}
-        departures = {}
-        self.delays_t = {}
-        self.delays = {}
-
-        first_capacity = None
-        last_capacity = None
-        first_arrival = {}
-        last_arrival = {}
-        first_departure = {}
-        last_departure = {}
-
-        total_first_departure = None
-        total_last_departure = None
-        total_arrivals = 0
-        total_departures = 0
-
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
-
-            if line.startswith('#'):
-                continue
-
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
-
-            if ts<=self.win_start_time_s*1000:
-                continue
-            if ts>=self.win_end_time_s*1000:
-                break
-
-            if first_ts is None:
-                first_ts = ts
-
-            if event_type == '#':
-                capacities = capacities + num_bits
-
-                if first_capacity is None:
-                    first_capacity = ts
-
-                if last_capacity is None or ts > last_capacity:
-                    last_capacity = ts
-
-            elif event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                self.flows[flow_id] = True
-
-                if flow_id not in arrivals:
-                    arrivals[flow_id] = 0
-                    first_arrival[flow_id] = ts
-
-                if flow_id not in last_arrival:
-                    last_arrival[flow_id] = ts
-                else:
-                    if ts > last_arrival[flow_id]:
-                        last_arrival[flow_id] = ts
-
-                arrivals[flow_id] = arrivals[flow_id] + num_bits
-                total_arrivals += num_bits
-
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                self.flows[flow_id] = True
-
-                if flow_id not in departures:
-                    departures[flow_id] = 0
-                    first_departure[flow_id] = ts
-
-                if flow_id not in last_departure:
-                    last_departure[flow_id] = ts
-                else:
-                    if ts > last_departure[flow_id]:
-                        last_departure[flow_id] = ts
+        # list of (start, end) windows evaluated by run_windows()
+        if windows is None:
+            windows = [(win_start_time_s, win_end_time_s)]
+        self.windows = windows
 
-                departures[flow_id] = departures[flow_id] + num_bits
-                total_departures += num_bits
+    def parse_tunnel_log(self, log=None, summary=None):
+        win_start_ms = self.win_start_time_s * 1000
+        win_end_ms = self.win_end_time_s * 1000
 
-                # update total variables
-                if total_first_departure is None:
-                    total_first_departure = ts
-                if (total_last_departure is None or
-                        ts > total_last_departure):
-                    total_last_departure = ts
-
-                # store delays in a list for each flow and sort later
-                delay = float(items[3])
-                if flow_id not in self.delays:
-                    self.delays[flow_id] = []
-                    self.delays_t[flow_id] = []
-                self.delays[flow_id].append(delay)
-                self.delays_t[flow_id].append((ts - first_ts) / 1000.0)
+        self.delays_t = {}
+        self.delays = {}
 
-        tunlog.close()
+        if summary is None:
+            summary = stream_stats.TunnelSummary(self.exact_delay)
 
+            if log is None and self.stream:
+                # one pass over blocks of the log in bounded memory
+                for block in tunnel_log.iter_tunnel_log(
+                        self.tunnel_log, start_ts=win_start_ms,
+                        end_ts=win_end_ms, cache=self.cache):
+                    summary.add(block.window(win_start_ms, win_end_ms))
+            else:
+                if log is None:
+                    log = tunnel_log.load_tunnel_log(self.tunnel_log,
+                                                     start_ts=win_start_ms,
+                                                     end_ts=win_end_ms,
+                                                     cache=self.cache)
+
+                # keep events after the window start, up to the first event
+                # at or beyond the window end
+                log = log.window(win_start_ms, win_end_ms)
+                summary.add(log)
+
+                # store delays in an array for each flow
+                departure = log.event == tunnel_log.DEPARTURE
+                for flow_id in summary.delays:
+                    flow_departure = departure & (log.flow_id == flow_id)
+                    self.delays[flow_id] = log.delay[flow_departure]
+                    self.delays_t[flow_id] = (
+                        log.ts[flow_departure] - summary.first_ts) / 1000.0
+
+        self.flows = dict.fromkeys(summary.flows, True)
 
         self.avg_capacity = None
         self.link_capacity = []
         self.link_capacity_t = []
-        if capacities:
+        capacity = summary.capacity
+        if capacity.any():
             # calculate average capacity
-            if last_capacity == first_capacity:
+            if capacity.last_ts == capacity.first_ts:
                 self.avg_capacity = 0
             else:
-                delta = 1000.0 * (last_capacity - first_capacity)
-                self.avg_capacity = capacities / delta
+                delta = 1000.0 * (capacity.last_ts - capacity.first_ts)
+                self.avg_capacity = capacity.bits / delta
 
         # calculate ingress and egress throughput for each flow
         self.avg_ingress = {}
@@ -148,36 +91,29 @@ class ParsePiecewise(object):
         self.avg_gput = {}
         self.jitter = {}
 
-        total_delays = []
+        total_delays = stream_stats.DelayStats(self.exact_delay)
 
         for flow_id in self.flows:
             self.avg_ingress[flow_id] = 0
             self.avg_egress[flow_id] = 0
 
-            if flow_id in arrivals:
-                # calculate average ingress and egress throughput
-                first_arrival_ts = first_arrival[flow_id]
-                last_arrival_ts = last_arrival[flow_id]
+            arrivals = summary.flow_arrivals[flow_id]
+            departures = summary.flow_departures[flow_id]
 
-                if last_arrival_ts == first_arrival_ts:
+            if arrivals.any():
+                # calculate average ingress and egress throughput
+                if arrivals.last_ts == arrivals.first_ts:
                     self.avg_ingress[flow_id] = 0
                 else:
-                    delta = 1000.0 * (last_arrival_ts - first_arrival_ts)
-                    #flow_arrivals = sum(arrivals[flow_id].values())
-                    flow_arrivals = arrivals[flow_id]
-                    self.avg_ingress[flow_id] = flow_arrivals / delta
-
-            if flow_id in departures:
-                first_departure_ts = first_departure[flow_id]
-                last_departure_ts = last_departure[flow_id]
+                    delta = 1000.0 * (arrivals.last_ts - arrivals.first_ts)
+                    self.avg_ingress[flow_id] = arrivals.bits / delta
 
-                if last_departure_ts == first_departure_ts:
+            if departures.any():
+                if departures.last_ts == departures.first_ts:
                     self.avg_egress[flow_id] = 0
                 else:
-                    delta = 1000.0 * (last_departure_ts - first_departure_ts)
-                    #flow_departures = sum(departures[flow_id].values())
-                    flow_departures = departures[flow_id]
-                    self.avg_egress[flow_id] = flow_departures / delta
+                    delta = 1000.0 * (departures.last_ts - departures.first_ts)
+                    self.avg_egress[flow_id] = departures.bits / delta
 
             # calculate 95th percentile per-packet one-way delay
             self.percentile_delay_90th[flow_id] = None
@@ -185,32 +121,29 @@ class ParsePiecewise(object):
             self.mean_delay[flow_id] = None
             self.percentile_delay[flow_id] = None
             self.jitter[flow_id] = None
-            if flow_id in self.delays:
-                self.percentile_delay_90th[flow_id] = np.percentile(
-                    self.delays[flow_id], 90, interpolation='higher')
-                self.percentile_delay[flow_id] = np.percentile(
-                    self.delays[flow_id], 95, interpolation='higher')
-                self.avg_delay[flow_id] = np.average(self.delays[flow_id])
-                self.mean_delay[flow_id] = np.mean(self.delays[flow_id])
-
-                tmp = np.array(self.delays[flow_id])
-                tmp -= self.avg_delay[flow_id]
-                delta_times_from_avg = np.absolute(tmp)
-                self.jitter[flow_id] = np.average(delta_times_from_avg)
+            if flow_id in summary.delays:
+                delays = summary.delays[flow_id]
+                self.percentile_delay_90th[flow_id] = delays.percentile(90)
+                self.percentile_delay[flow_id] = delays.percentile(95)
+                self.avg_delay[flow_id] = delays.mean()
+                self.mean_delay[flow_id] = delays.mean()
+                self.jitter[flow_id] = delays.jitter()
 
-                total_delays += self.delays[flow_id]
+                total_delays.merge(delays)
 
             # calculate loss rate for each flow
-            if flow_id in arrivals and flow_id in departures:
-                flow_arrivals = arrivals[flow_id]
-                flow_departures = departures[flow_id]
-
+            if arrivals.any() and departures.any():
                 self.loss_rate[flow_id] = None
-                if flow_arrivals > 0:
+                if arrivals.bits > 0:
                     self.loss_rate[flow_id] = (
-                        1 - 1.0 * flow_departures / flow_arrivals)
+                        1 - 1.0 * departures.bits / arrivals.bits)
                     self.avg_gput[flow_id] = self.avg_egress[flow_id]*(1.0-self.loss_rate[flow_id])
 
+        total_arrivals = summary.arrivals.bits
+        total_departures = summary.departures.bits
+        total_first_departure = summary.departures.first_ts
+        total_last_departure = summary.departures.last_ts
+
         self.total_loss_rate = None
         if total_arrivals > 0:
             self.total_loss_rate = 1 - 1.0 * total_departures / total_arrivals
@@ -229,37 +162,22 @@ class ParsePiecewise(object):
             self.total_avg_gput = self.total_avg_egress*(1.0-self.total_loss_rate)
 
         self.total_percentile_delay = None
-        if total_delays:
-            self.total_percentile_delay = np.percentile(
-                #total_delays, 95, interpolation='nearest')
-                total_delays, 95, interpolation='higher')
-
         self.total_avg_delay = None
-        if total_delays:
-            self.total_avg_delay = np.average(total_delays)
-
         self.total_mean_delay = None
-        if total_delays:
-            self.total_mean_delay = np.mean(total_delays)
-
         self.total_90th_delay = None
-        if total_delays:
-            self.total_90th_delay = np.percentile(
-                #total_delays, 90, interpolation='nearest')
-                total_delays, 90, interpolation='higher')
-
-            self.total_jitter = None
-        if total_delays:
-            tmp = np.array(total_delays)
-            tmp -= self.total_avg_delay
-            delta_times_from_avg = np.absolute(tmp)
-            self.total_jitter = np.average(delta_times_from_avg)
+        self.total_jitter = None
+        if total_delays.count:
+            self.total_percentile_delay = total_delays.percentile(95)
+            self.total_avg_delay = total_delays.mean()
+            self.total_mean_delay = total_delays.mean()
+            self.total_90th_delay = total_delays.percentile(90)
+            self.total_jitter = total_delays.jitter()
 
     def flip(self, items, ncol):
         return list(itertools.chain(*[items[i::ncol] for i in range(ncol)]))
 
-    def run(self):
-        self.parse_tunnel_log()
+    def run(self, log=None, summary=None):
+        self.parse_tunnel_log(log, summary)
 
         tunnel_results = {}
         tunnel_results['duration'] = self.total_duration
@@ -281,11 +199,61 @@ class ParsePiecewise(object):
 
         return tunnel_results
 
+    def run_windows(self):
+        if self.cache:
+            # results the merge step saved for these windows, if any
+            saved = log_summary.piecewise_summary(self.tunnel_log,
+                                                  self.exact_delay)
+            if all(window in saved for window in self.windows):
+                return dict((window, saved[window])
+                            for window in self.windows)
+
+        # read the log once, from the first window start to the last window end
+        start_ts = min([win_start for win_start, _ in self.windows]) * 1000
+        end_ts = max([win_end for _, win_end in self.windows]) * 1000
+
+        parsers = {}
+        for win_start, win_end in self.windows:
+            parsers[(win_start, win_end)] = ParsePiecewise(
+                self.tunnel_log, win_start, win_end, cache=self.cache,
+                stream=self.stream, exact_delay=self.exact_delay)
+
+        if not self.stream:
+            log = tunnel_log.load_tunnel_log(self.tunnel_log,
+                                             start_ts=start_ts, end_ts=end_ts,
+                                             cache=self.cache)
+            return dict((window, parser.run(log))
+                        for window, parser in parsers.items())
+
+        # feed every block to the summary of each window it overlaps
+        summaries = dict((window, stream_stats.TunnelSummary(self.exact_delay))
+                         for window in parsers)
+        for block in tunnel_log.iter_tunnel_log(
+                self.tunnel_log, start_ts=start_ts, end_ts=end_ts,
+                cache=self.cache):
+            for (win_start, win_end), summary in summaries.items():
+                summary.add(block.window(win_start * 1000, win_end * 1000))
+
+        return dict((window, parser.run(summary=summaries[window]))
+                    for window, parser in parsers.items())
+
 def main():
     args = arg_parser.parse_tunnel_piecewise()
 
+    if args.windows:
+        parsed_piecewise = ParsePiecewise(tunnel_log=args.tunnel_log,
+                                          windows=args.windows,
+                                          cache=not args.no_log_cache,
+                                          stream=args.stream,
+                                          exact_delay=not args.approx_delay)
+        for window, results in sorted(parsed_piecewise.run_windows().items()):
+            sys.stderr.write('%s: %s\n' % (str(window), str(results)))
+        return
+
     parsed_piecewise = ParsePiecewise(tunnel_log=args.tunnel_log,
-            win_start_time_s=args.win_start,win_end_time_s=args.win_end)
+            win_start_time_s=args.win_start,win_end_time_s=args.win_end,
+            cache=not args.no_log_cache, stream=args.stream,
+            exact_delay=not args.approx_delay)
 
     results = parsed_piecewise.run()
 
@@ -15,12 +15,15 @@ import matplotlib.ticker as ticker
 import arg_parser
 import tunnel_graph
 from helpers import utils
+from helpers import compressed_log
 
 class Plot(object):
     def __init__(self, args):
         self.data_dir = path.abspath(args.data_dir)
         self.include_acklink = args.include_acklink
         self.no_graphs = args.no_graphs
+        self.stream = args.stream
+        self.exact_delay = not args.approx_delay
 
         metadata_path = path.join(self.data_dir, 'pantheon_metadata.json')
         meta = utils.load_test_metadata(metadata_path)
@@ -81,7 +84,7 @@ class Plot(object):
             log_name = log_prefix + '_%s_run%s.log' % (link_t, run_id)
             log_path = path.join(self.data_dir, log_name)
 
-            if not path.isfile(log_path):
+            if compressed_log.find_log(log_path) is None:
                 sys.stderr.write('Warning: %s does not exist\n' % log_path)
                 error = True
                 continue
@@ -101,7 +104,9 @@ class Plot(object):
                 tunnel_results = tunnel_graph.TunnelGraph(
                     tunnel_log=log_path,
                     throughput_graph=tput_graph_path,
-                    delay_graph=delay_graph_path).run()
+                    delay_graph=delay_graph_path,
+                    stream=self.stream,
+                    exact_delay=self.exact_delay).run()
             except Exception as exception:
                 sys.stderr.write('Error: %s\n' % exception)
                 sys.stderr.write('Warning: "tunnel_graph %s" failed but '
@@ -4,10 +4,12 @@ import sys
 from os import path
 import math
 import time
+import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
 import arg_parser
+import tunnel_log
 from helpers import utils
 
 class PlotThroughputTime(object):
@@ -27,70 +29,39 @@ class PlotThroughputTime(object):
         return int((ts - flow_base_ts) / self.ms_per_bin)
 
     def parse_tunnel_log(self, tunnel_log_path):
-        tunlog = open(tunnel_log_path)
+        log = tunnel_log.load_tunnel_log(tunnel_log_path)
+        init_ts = log.init_ts
 
-        # read init timestamp
-        init_ts = None
-        while init_ts is None:
-            line = tunlog.readline()
-            if 'init timestamp' in line:
-                init_ts = float(line.split(':')[1])
-
-        flow_base_ts = {}  # timestamp when each flow sent the first byte
-        departures = {}  # number of bits leaving the tunnel within a bin
-
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
-
-            if '#' in line:
-                continue
-
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
-
-            if event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                if flow_id not in flow_base_ts:
-                    flow_base_ts[flow_id] = ts
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                if flow_id not in departures:
-                    departures[flow_id] = {}
-                else:
-                    bin_id = self.ms_to_bin(ts, flow_base_ts[flow_id])
-                    old_value = departures[flow_id].get(bin_id, 0)
-                    departures[flow_id][bin_id] = old_value + num_bits
-
-        tunlog.close()
+        arrival = log.event == tunnel_log.ARRIVAL
+        departure = log.event == tunnel_log.DEPARTURE
 
         # prepare return values
         us_per_bin = 1000.0 * self.ms_per_bin
         clock_time = {}  # data for x-axis
         throughput = {}  # data for y-axis
-        for flow_id in departures:
-            start_ts = flow_base_ts[flow_id] + init_ts + self.ms_per_bin / 2.0
-            clock_time[flow_id] = []
-            throughput[flow_id] = []
-
-            max_bin_id = max(departures[flow_id].keys())
-            for bin_id in xrange(0, max_bin_id + 1):
-                time_sec = (start_ts + bin_id * self.ms_per_bin) / 1000.0
-                clock_time[flow_id].append(time_sec)
-
-                tput_mbps = departures[flow_id].get(bin_id, 0) / us_per_bin
-                throughput[flow_id].append(tput_mbps)
+        for flow_id in log.flows():
+            flow = log.flow_id == flow_id
+            flow_arrival_ts = log.ts[arrival & flow]
+            flow_departure = departure & flow
+            if not flow_departure.any():
+                continue
+
+            # timestamp when each flow sent the first byte
+            flow_base_ts = flow_arrival_ts[0]
+
+            # number of bits leaving the tunnel within a bin, not counting
+            # the first departure of the flow
+            departure_ts = log.ts[flow_departure][1:]
+            num_bits = log.size[flow_departure][1:] * 8
+            bins = ((departure_ts - flow_base_ts) /
+                    self.ms_per_bin).astype(np.int64)
+            departures = np.bincount(bins, weights=num_bits)
+
+            start_ts = flow_base_ts + init_ts + self.ms_per_bin / 2.0
+            clock_time[flow_id] = [
+                (start_ts + bin_id * self.ms_per_bin) / 1000.0
+                for bin_id in xrange(len(departures))]
+            throughput[flow_id] = (departures / us_per_bin).tolist()
 
         return clock_time, throughput
 
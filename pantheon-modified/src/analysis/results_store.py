@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import glob
+import json
+import sqlite3
+from os import path
+
+import arg_parser
+
+# the league scripts read the piecewise results of every scheme, environment
+# and window from one SQLite file instead of thousands of small JSON files;
+# "results_store.py --datadir DIR" ingests the results saved under DIR into
+# DIR/results.db, skipping the files that did not change since the last time
+STORE_NAME = 'results.db'
+
+METADATA_NAME = 'pantheon_metadata.json'
+PIECEWISE_RE = re.compile(r'^piecewise_perf_(\d+)_(\d+)\.json$')
+
+# per-flow results written by save_piecewise.py; their columns have no type,
+# so that values keep the int or float type they had in the JSON files
+METRICS = ['tput', 'gput', 'delay', 'delay_90', 'delay_avg', 'delay_mean',
+           'jitter', 'loss']
+
+# per-scheme aggregates of the league in each window, which it keeps to only
+# score the experiments that are new or changed; values keep their types too
+AGGREGATES = ['samples', 'tput', 'delay_95', 'delay_90', 'delay_avg',
+              'jindex', 'score', 'run_times', 'flows']
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sources (
+           path TEXT PRIMARY KEY, size INTEGER, mtime REAL)''',
+    '''CREATE TABLE IF NOT EXISTS metadata (
+           dir_name TEXT PRIMARY KEY, run_times INTEGER, flows INTEGER,
+           meta TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS piecewise (
+           win_start INTEGER, win_end INTEGER, dir_name TEXT, scheme TEXT,
+           run_id INTEGER, flow_id INTEGER, %s,
+           PRIMARY KEY (win_start, win_end, dir_name, scheme, run_id,
+                        flow_id))''' % ', '.join(METRICS),
+    '''CREATE TABLE IF NOT EXISTS league_aggregates (
+           win_start INTEGER, win_end INTEGER, dir_name TEXT,
+           version INTEGER, %s,
+           PRIMARY KEY (win_start, win_end, dir_name))'''
+    % ', '.join(AGGREGATES),
+]
+
+
+def default_store(data_dir):
+    return path.join(data_dir, STORE_NAME)
+
+
+class ResultsStore(object):
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.db = sqlite3.connect(store_path)
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+    def close(self):
+        self.db.close()
+
+    def changed(self, source, source_path):
+        # records the size and mtime of source; True if they changed
+        st = os.stat(source_path)
+        row = self.db.execute('SELECT size, mtime FROM sources WHERE path = ?',
+                              (source,)).fetchone()
+        if row is not None and tuple(row) == (st.st_size, st.st_mtime):
+            return False
+        self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+                        (source, st.st_size, st.st_mtime))
+        return True
+
+    def ingest_metadata(self, dir_name, meta_path):
+        with open(meta_path) as meta_fh:
+            meta = json.load(meta_fh)
+        self.db.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)',
+                        (dir_name, meta['run_times'], meta['flows'],
+                         json.dumps(meta)))
+        self.db.execute('DELETE FROM league_aggregates WHERE dir_name = ?',
+                        (dir_name,))
+
+    def ingest_piecewise(self, dir_name, win_start, win_end, perf_path):
+        with open(perf_path) as perf_fh:
+            perf = json.load(perf_fh)
+
+        self.forget_window(dir_name, win_start, win_end)
+        rows = []
+        for scheme, runs in perf.items():
+            for run_id, flows in runs.items():
+                for flow_id, flow_data in flows.items():
+                    rows.append(
+                        [win_start, win_end, dir_name, scheme, int(run_id),
+                         int(flow_id)] +
+                        [flow_data.get(metric) for metric in METRICS])
+        self.db.executemany(
+            'INSERT INTO piecewise VALUES (%s)'
+            % ', '.join(['?'] * (6 + len(METRICS))), rows)
+
+    def forget_window(self, dir_name, win_start, win_end):
+        for table in ['piecewise', 'league_aggregates']:
+            self.db.execute('DELETE FROM %s WHERE win_start = ? AND '
+                            'win_end = ? AND dir_name = ?' % table,
+                            (win_start, win_end, dir_name))
+
+    def forget(self, source):
+        self.db.execute('DELETE FROM sources WHERE path = ?', (source,))
+
+        dir_name, name = source.split('/')
+        if name == METADATA_NAME:
+            for table in ['metadata', 'league_aggregates']:
+                self.db.execute('DELETE FROM %s WHERE dir_name = ?' % table,
+                                (dir_name,))
+            return
+
+        win_start, win_end = PIECEWISE_RE.match(name).groups()
+        self.forget_window(dir_name, int(win_start), int(win_end))
+
+    def ingest(self, data_dir):
+        # ingests the results of every experiment directory in data_dir and
+        # forgets the ones that were removed; returns the number of files read
+        sources = set()
+        read = 0
+        for meta_path in sorted(glob.glob(path.join(data_dir, '*',
+                                                    METADATA_NAME))):
+            exp_dir = path.dirname(meta_path)
+            dir_name = path.basename(exp_dir)
+
+            for name in sorted(os.listdir(exp_dir)):
+                match = PIECEWISE_RE.match(name)
+                if name != METADATA_NAME and match is None:
+                    continue
+
+                source = dir_name + '/' + name
+                sources.add(source)
+                source_path = path.join(exp_dir, name)
+                if not self.changed(source, source_path):
+                    continue
+
+                try:
+                    if match is None:
+                        self.ingest_metadata(dir_name, source_path)
+                    else:
+                        self.ingest_piecewise(dir_name, int(match.group(1)),
+                                              int(match.group(2)),
+                                              source_path)
+                    read += 1
+                except (IOError, ValueError, KeyError, AttributeError):
+                    sys.stderr.write('Warning: cannot ingest %s\n'
+                                     % source_path)
+                    self.forget(source)
+
+        for (source,) in self.db.execute('SELECT path FROM sources').fetchall():
+            if source not in sources:
+                self.forget(source)
+
+        self.db.commit()
+        return read
+
+    def metadata(self):
+        # {dir_name: pantheon_metadata.json}
+        return dict((dir_name, json.loads(meta)) for dir_name, meta in
+                    self.db.execute('SELECT dir_name, meta FROM metadata'))
+
+    def window_results(self, win_start, win_end):
+        # {dir_name: piecewise_perf_<win_start>_<win_end>.json}, with the
+        # same string run and flow ids as the JSON files
+        ret = {}
+        for row in self.db.execute(
+                'SELECT dir_name, scheme, run_id, flow_id, %s FROM piecewise '
+                'WHERE win_start = ? AND win_end = ?' % ', '.join(METRICS),
+                (win_start, win_end)):
+            dir_name, scheme, run_id, flow_id = row[:4]
+            flows = ret.setdefault(dir_name, {}).setdefault(
+                scheme, {}).setdefault(str(run_id), {})
+            flows[str(flow_id)] = dict(zip(METRICS, row[4:]))
+        return ret
+
+    def aggregates(self, win_start, win_end, version):
+        # {dir_name: league aggregates} saved by the same league version
+        return dict((row[0], dict(zip(AGGREGATES, row[1:]))) for row in
+                    self.db.execute(
+                        'SELECT dir_name, %s FROM league_aggregates WHERE '
+                        'win_start = ? AND win_end = ? AND version = ?'
+                        % ', '.join(AGGREGATES), (win_start, win_end, version)))
+
+    def save_aggregates(self, win_start, win_end, version, aggregates):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO league_aggregates VALUES (%s)'
+            % ', '.join(['?'] * (4 + len(AGGREGATES))),
+            [[win_start, win_end, dir_name, version] +
+             [aggregate[name] for name in AGGREGATES]
+             for dir_name, aggregate in aggregates.items()])
+        self.db.commit()
+
+
+def open_store(store_path):
+    # the store of the league, which has to be made by results_store.py
+    if not path.isfile(store_path):
+        sys.exit('%s does not exist; make it with results_store.py'
+                 % store_path)
+    return ResultsStore(store_path)
+
+
+def load_window(store_path, win_start, win_end):
+    # (metadata, results of the window) of every experiment for the league
+    store = open_store(store_path)
+    ret = store.metadata(), store.window_results(win_start, win_end)
+    store.close()
+    return ret
+
+
+def main():
+    args = arg_parser.parse_results_store()
+
+    store_path = args.store or default_store(args.datadir)
+    store = ResultsStore(store_path)
+    read = store.ingest(args.datadir)
+    store.close()
+    sys.stderr.write('Ingested %d changed result files into %s\n'
+                     % (read, store_path))
+
+
+if __name__ == '__main__':
+    main()
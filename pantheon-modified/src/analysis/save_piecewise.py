@@ -8,6 +8,7 @@ from multiprocessing.pool import ThreadPool
 import arg_parser
 import parse_piecewise
 from helpers import utils
+from helpers import compressed_log
 
 
 class Save(object):
@@ -18,6 +19,14 @@ class Save(object):
         self.win_start_time_s = args.win_start
         self.win_end_time_s = args.win_end
 
+        # every window is evaluated from a single read of each log
+        self.windows = args.windows
+        if not self.windows:
+            self.windows = [(self.win_start_time_s, self.win_end_time_s)]
+        self.log_cache = not args.no_log_cache
+        self.stream = args.stream
+        self.exact_delay = not args.approx_delay
+
         metadata_path = path.join(self.data_dir, 'pantheon_metadata.json')
         meta = utils.load_test_metadata(metadata_path)
         self.cc_schemes = utils.verify_schemes_with_meta(args.schemes, meta)
@@ -42,7 +51,7 @@ class Save(object):
             log_name = log_prefix + '_%s_run%s.log' % (link_t, run_id)
             log_path = path.join(self.data_dir, log_name)
 
-            if not path.isfile(log_path):
+            if compressed_log.find_log(log_path) is None:
                 sys.stderr.write('Warning: %s does not exist\n' % log_path)
                 error = True
                 continue
@@ -54,7 +63,10 @@ class Save(object):
             try:
                 piecewise_results = parse_piecewise.ParsePiecewise(
                     tunnel_log=log_path,
-                    win_start_time_s=self.win_start_time_s,win_end_time_s=self.win_end_time_s).run()
+                    windows=self.windows,
+                    cache=self.log_cache,
+                    stream=self.stream,
+                    exact_delay=self.exact_delay).run_windows()
                 #print(str(piecewise_results)+"\n")
 
             except Exception as exception:
@@ -68,7 +80,6 @@ class Save(object):
 
             if link_t == 'datalink':
                 ret = piecewise_results
-                duration = piecewise_results['duration'] / 1000.0
 
         if error:
             return None
@@ -116,20 +127,26 @@ class Save(object):
         data_for_plot_mean = {}
         data_for_json = {}
 
+        for window in self.windows:
+            data_for_json[window] = {}
+
         for cc in perf_data:
-            data_for_json[cc] = {}
+            for window in self.windows:
+                data_for_json[window][cc] = {}
 
             for run_id in perf_data[cc]:
                 if perf_data[cc][run_id] is None:
                     continue
 
-                flow_data = perf_data[cc][run_id]['flow_data']
-                if flow_data is not None:
-                    data_for_json[cc][run_id] = flow_data
+                for window in self.windows:
+                    flow_data = perf_data[cc][run_id][window]['flow_data']
+                    if flow_data is not None:
+                        data_for_json[window][cc][run_id] = flow_data
 
-        perf_path = path.join(self.data_dir, 'piecewise_perf_'+str(int(self.win_start_time_s))+'_'+str(int(self.win_end_time_s))+'.json')
-        with open(perf_path, 'w') as fh:
-            json.dump(data_for_json, fh)
+        for win_start, win_end in self.windows:
+            perf_path = path.join(self.data_dir, 'piecewise_perf_'+str(int(win_start))+'_'+str(int(win_end))+'.json')
+            with open(perf_path, 'w') as fh:
+                json.dump(data_for_json[(win_start, win_end)], fh)
 
 def main():
     args = arg_parser.parse_save_piecewise()
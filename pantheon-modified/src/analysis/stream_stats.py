@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+import math
+import numpy as np
+
+import tunnel_log
+
+# approximate delays are counted in buckets (MIN_DELAY * GAMMA^(k-1),
+# MIN_DELAY * GAMMA^k] and reported as a value within RELATIVE_ACCURACY of
+# every delay in the bucket; delays at or below MIN_DELAY ms count as 0
+RELATIVE_ACCURACY = 0.005
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_DELAY = 1e-3
+MAX_DELAY = 1e6
+NUM_BUCKETS = int(math.ceil(math.log(MAX_DELAY / MIN_DELAY) /
+                            math.log(GAMMA))) + 1
+BUCKET_DELAYS = np.concatenate(
+    ([0.0], 2 * MIN_DELAY * GAMMA ** np.arange(1, NUM_BUCKETS) / (GAMMA + 1)))
+
+
+class DelayStats(object):
+    """Mean, jitter and percentiles of per-packet delays fed in blocks.
+
+    Exact stats keep the delays as float64 arrays, which gives the same
+    results as np.percentile over all of them. Approximate stats only keep
+    a fixed-size histogram, and two of them merge by adding their counts.
+    """
+
+    def __init__(self, exact=True):
+        self.exact = exact
+        self.count = 0
+        self.total = 0.0
+        self.blocks = []
+        self.counts = None if exact else np.zeros(NUM_BUCKETS, dtype=np.int64)
+
+    def add(self, delays):
+        if len(delays) == 0:
+            return
+
+        self.count += len(delays)
+        if self.exact:
+            self.blocks.append(np.asarray(delays, dtype=np.float64))
+            return
+
+        self.total += delays.sum()
+        buckets = np.ceil(np.log(np.maximum(delays, MIN_DELAY) / MIN_DELAY) /
+                          math.log(GAMMA)).astype(np.int64)
+        self.counts += np.bincount(np.minimum(buckets, NUM_BUCKETS - 1),
+                                   minlength=NUM_BUCKETS)
+
+    def merge(self, other):
+        self.count += other.count
+        if self.exact:
+            self.blocks += other.blocks
+        else:
+            self.total += other.total
+            self.counts += other.counts
+
+    def delays(self):
+        if len(self.blocks) != 1:
+            self.blocks = [np.concatenate(self.blocks)]
+        return self.blocks[0]
+
+    def mean(self):
+        if self.exact:
+            return np.mean(self.delays())
+        return self.total / self.count
+
+    def jitter(self):
+        if self.exact:
+            return np.average(np.absolute(self.delays() - self.mean()))
+        return (np.dot(self.counts, np.absolute(BUCKET_DELAYS - self.mean()))
+                / self.count)
+
+    def percentile(self, q):
+        # same rank as np.percentile(..., interpolation='higher')
+        if self.exact:
+            return np.percentile(self.delays(), q, interpolation='higher')
+        rank = int(math.ceil(q / 100.0 * (self.count - 1)))
+        bucket = np.searchsorted(np.cumsum(self.counts), rank, side='right')
+        return BUCKET_DELAYS[bucket]
+
+
+class EventStats(object):
+    """First and last timestamp and bits, in total and per time bin, of a
+    stream of events."""
+
+    def __init__(self):
+        self.first_ts = None
+        self.last_ts = None
+        self.bits = 0
+        self.min_bin = None
+        self.bin_bits = None
+
+    def any(self):
+        return self.first_ts is not None
+
+    def add(self, ts, bits, bins=None):
+        if len(ts) == 0:
+            return
+
+        if self.first_ts is None:
+            self.first_ts = ts[0]
+            self.last_ts = ts.max()
+        else:
+            self.last_ts = max(self.last_ts, ts.max())
+        self.bits += bits.sum()
+
+        if bins is None:
+            return
+
+        min_bin = bins.min()
+        if self.min_bin is not None:
+            min_bin = min(min_bin, self.min_bin)
+        bin_bits = np.bincount(bins - min_bin, weights=bits)
+        if self.min_bin is not None:
+            shift = self.min_bin - min_bin
+            size = max(len(bin_bits), shift + len(self.bin_bits))
+            bin_bits = np.concatenate((bin_bits,
+                                       np.zeros(size - len(bin_bits))))
+            bin_bits[shift:shift + len(self.bin_bits)] += self.bin_bits
+        self.min_bin = min_bin
+        self.bin_bits = bin_bits
+
+
+class TunnelSummary(object):
+    """Per-flow statistics of a tunnel log accumulated block by block, so
+    that the log never has to be held in memory as a whole."""
+
+    def __init__(self, exact=True, ms_per_bin=None):
+        self.exact = exact
+        self.ms_per_bin = ms_per_bin
+
+        self.first_ts = None
+        self.flows = []
+        self.capacity = EventStats()
+        self.arrivals = EventStats()
+        self.departures = EventStats()
+        self.flow_arrivals = {}
+        self.flow_departures = {}
+        self.delays = {}
+
+    def add(self, log):
+        if len(log) == 0:
+            return
+
+        if self.first_ts is None:
+            self.first_ts = log.ts[0]
+
+        bins = None
+        if self.ms_per_bin is not None:
+            bins = ((log.ts - self.first_ts) /
+                    self.ms_per_bin).astype(np.int64)
+
+        arrival = log.event == tunnel_log.ARRIVAL
+        departure = log.event == tunnel_log.DEPARTURE
+        capacity = log.event == tunnel_log.CAPACITY
+        num_bits = log.size * 8
+
+        self.arrivals.add(log.ts[arrival], num_bits[arrival])
+        self.departures.add(log.ts[departure], num_bits[departure])
+        self.capacity.add(log.ts[capacity], num_bits[capacity],
+                          None if bins is None else bins[capacity])
+
+        for flow_id in log.flows():
+            if flow_id not in self.flow_arrivals:
+                self.flows.append(flow_id)
+                self.flow_arrivals[flow_id] = EventStats()
+                self.flow_departures[flow_id] = EventStats()
+
+            flow = log.flow_id == flow_id
+            for mask, stats in [(arrival & flow, self.flow_arrivals[flow_id]),
+                                (departure & flow,
+                                 self.flow_departures[flow_id])]:
+                stats.add(log.ts[mask], num_bits[mask],
+                          None if bins is None else bins[mask])
+
+            flow_departure = departure & flow
+            if flow_departure.any():
+                if flow_id not in self.delays:
+                    self.delays[flow_id] = DelayStats(self.exact)
+                self.delays[flow_id].add(log.delay[flow_departure])
@@ -9,153 +9,77 @@ import matplotlib_agg
 import matplotlib.pyplot as plt
 
 import arg_parser
+import tunnel_log
+import stream_stats
+import log_summary
 
 
 class TunnelGraph(object):
     def __init__(self, tunnel_log, throughput_graph=None, delay_graph=None,
-                 ms_per_bin=500):
+                 ms_per_bin=500, stream=False, exact_delay=True):
         self.tunnel_log = tunnel_log
         self.throughput_graph = throughput_graph
         self.delay_graph = delay_graph
         self.ms_per_bin = ms_per_bin
 
+        # stream=True keeps memory bounded by not holding the whole log;
+        # exact_delay=False estimates delay percentiles and jitter from a
+        # histogram instead of keeping every per-packet delay
+        self.stream = stream
+        self.exact_delay = exact_delay
+
     def ms_to_bin(self, ts, first_ts):
         return int((ts - first_ts) / self.ms_per_bin)
 
     def bin_to_s(self, bin_id):
         return bin_id * self.ms_per_bin / 1000.0
 
-    def parse_tunnel_log(self):
-        tunlog = open(self.tunnel_log)
-
-        self.flows = {}
-        first_ts = None
-        capacities = {}
-
-        arrivals = {}
-        departures = {}
+    def parse_tunnel_log(self, summary=None):
         self.delays_t = {}
         self.delays = {}
 
-        first_capacity = None
-        last_capacity = None
-        first_arrival = {}
-        last_arrival = {}
-        first_departure = {}
-        last_departure = {}
-
-        total_first_departure = None
-        total_last_departure = None
-        total_arrivals = 0
-        total_departures = 0
-
-        while True:
-            line = tunlog.readline()
-            if not line:
-                break
-
-            if line.startswith('#'):
-                continue
-
-            items = line.split()
-            ts = float(items[0])
-            event_type = items[1]
-            num_bits = int(items[2]) * 8
-
-            if first_ts is None:
-                first_ts = ts
-
-            bin_id = self.ms_to_bin(ts, first_ts)
-
-            if event_type == '#':
-                capacities[bin_id] = capacities.get(bin_id, 0) + num_bits
-
-                if first_capacity is None:
-                    first_capacity = ts
-
-                if last_capacity is None or ts > last_capacity:
-                    last_capacity = ts
-            elif event_type == '+':
-                if len(items) == 4:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                self.flows[flow_id] = True
-
-                if flow_id not in arrivals:
-                    arrivals[flow_id] = {}
-                    first_arrival[flow_id] = ts
-
-                if flow_id not in last_arrival:
-                    last_arrival[flow_id] = ts
-                else:
-                    if ts > last_arrival[flow_id]:
-                        last_arrival[flow_id] = ts
-
-                old_value = arrivals[flow_id].get(bin_id, 0)
-                arrivals[flow_id][bin_id] = old_value + num_bits
-
-                total_arrivals += num_bits
-            elif event_type == '-':
-                if len(items) == 5:
-                    flow_id = int(items[-1])
-                else:
-                    flow_id = 0
-
-                self.flows[flow_id] = True
-
-                if flow_id not in departures:
-                    departures[flow_id] = {}
-                    first_departure[flow_id] = ts
-
-                if flow_id not in last_departure:
-                    last_departure[flow_id] = ts
-                else:
-                    if ts > last_departure[flow_id]:
-                        last_departure[flow_id] = ts
-
-                old_value = departures[flow_id].get(bin_id, 0)
-                departures[flow_id][bin_id] = old_value + num_bits
-
-                total_departures += num_bits
-
-                # update total variables
-                if total_first_departure is None:
-                    total_first_departure = ts
-                if (total_last_departure is None or
-                        ts > total_last_departure):
-                    total_last_departure = ts
-
-                # store delays in a list for each flow and sort later
-                delay = float(items[3])
-                if flow_id not in self.delays:
-                    self.delays[flow_id] = []
-                    self.delays_t[flow_id] = []
-                self.delays[flow_id].append(delay)
-                self.delays_t[flow_id].append((ts - first_ts) / 1000.0)
-
-        tunlog.close()
+        if summary is None:
+            summary = stream_stats.TunnelSummary(self.exact_delay,
+                                                 self.ms_per_bin)
 
+            if self.stream:
+                # one pass over blocks of the log in bounded memory; per-packet
+                # delays are not kept, so no delay graph can be plotted
+                for log in tunnel_log.iter_tunnel_log(self.tunnel_log):
+                    summary.add(log)
+            else:
+                log = tunnel_log.load_tunnel_log(self.tunnel_log)
+                summary.add(log)
+
+                # store delays in an array for each flow
+                departure = log.event == tunnel_log.DEPARTURE
+                for flow_id in summary.delays:
+                    flow_departure = departure & (log.flow_id == flow_id)
+                    self.delays[flow_id] = log.delay[flow_departure]
+                    self.delays_t[flow_id] = (
+                        log.ts[flow_departure] - summary.first_ts) / 1000.0
+
+        self.flows = dict.fromkeys(summary.flows, True)
         us_per_bin = 1000.0 * self.ms_per_bin
 
         self.avg_capacity = None
         self.link_capacity = []
         self.link_capacity_t = []
-        if capacities:
+        capacity = summary.capacity
+        if capacity.any():
             # calculate average capacity
-            if last_capacity == first_capacity:
+            if capacity.last_ts == capacity.first_ts:
                 self.avg_capacity = 0
             else:
-                delta = 1000.0 * (last_capacity - first_capacity)
-                self.avg_capacity = sum(capacities.values()) / delta
+                delta = 1000.0 * (capacity.last_ts - capacity.first_ts)
+                self.avg_capacity = capacity.bits / delta
 
             # transform capacities into a list
-            capacity_bins = capacities.keys()
-            for bin_id in xrange(min(capacity_bins), max(capacity_bins) + 1):
-                self.link_capacity.append(
-                    capacities.get(bin_id, 0) / us_per_bin)
-                self.link_capacity_t.append(self.bin_to_s(bin_id))
+            self.link_capacity = (capacity.bin_bits / us_per_bin).tolist()
+            self.link_capacity_t = [
+                self.bin_to_s(bin_id) for bin_id in
+                xrange(capacity.min_bin,
+                       capacity.min_bin + len(capacity.bin_bits))]
 
         # calculate ingress and egress throughput for each flow
         self.ingress_tput = {}
@@ -172,7 +96,7 @@ class TunnelGraph(object):
         self.avg_gput = {}
         self.jitter = {}
 
-        total_delays = []
+        total_delays = stream_stats.DelayStats(self.exact_delay)
 
         for flow_id in self.flows:
             self.ingress_tput[flow_id] = []
@@ -182,44 +106,41 @@ class TunnelGraph(object):
             self.avg_ingress[flow_id] = 0
             self.avg_egress[flow_id] = 0
 
-            if flow_id in arrivals:
-                # calculate average ingress and egress throughput
-                first_arrival_ts = first_arrival[flow_id]
-                last_arrival_ts = last_arrival[flow_id]
+            arrivals = summary.flow_arrivals[flow_id]
+            departures = summary.flow_departures[flow_id]
 
-                if last_arrival_ts == first_arrival_ts:
+            if arrivals.any():
+                # calculate average ingress and egress throughput
+                if arrivals.last_ts == arrivals.first_ts:
                     self.avg_ingress[flow_id] = 0
                 else:
-                    delta = 1000.0 * (last_arrival_ts - first_arrival_ts)
-                    flow_arrivals = sum(arrivals[flow_id].values())
-                    self.avg_ingress[flow_id] = flow_arrivals / delta
-
-                ingress_bins = arrivals[flow_id].keys()
-                for bin_id in xrange(min(ingress_bins), max(ingress_bins) + 1):
-                    self.ingress_tput[flow_id].append(
-                        arrivals[flow_id].get(bin_id, 0) / us_per_bin)
-                    self.ingress_t[flow_id].append(self.bin_to_s(bin_id))
-
-            if flow_id in departures:
-                first_departure_ts = first_departure[flow_id]
-                last_departure_ts = last_departure[flow_id]
-
-                if last_departure_ts == first_departure_ts:
+                    delta = 1000.0 * (arrivals.last_ts - arrivals.first_ts)
+                    self.avg_ingress[flow_id] = arrivals.bits / delta
+
+                self.ingress_tput[flow_id] = (
+                    arrivals.bin_bits / us_per_bin).tolist()
+                self.ingress_t[flow_id] = [
+                    self.bin_to_s(bin_id) for bin_id in
+                    xrange(arrivals.min_bin,
+                           arrivals.min_bin + len(arrivals.bin_bits))]
+
+            if departures.any():
+                if departures.last_ts == departures.first_ts:
                     self.avg_egress[flow_id] = 0
                 else:
-                    delta = 1000.0 * (last_departure_ts - first_departure_ts)
-                    flow_departures = sum(departures[flow_id].values())
-                    self.avg_egress[flow_id] = flow_departures / delta
-
-                egress_bins = departures[flow_id].keys()
+                    delta = 1000.0 * (departures.last_ts - departures.first_ts)
+                    self.avg_egress[flow_id] = departures.bits / delta
 
                 self.egress_tput[flow_id].append(0.0)
-                self.egress_t[flow_id].append(self.bin_to_s(min(egress_bins)))
+                self.egress_t[flow_id].append(
+                    self.bin_to_s(departures.min_bin))
 
-                for bin_id in xrange(min(egress_bins), max(egress_bins) + 1):
-                    self.egress_tput[flow_id].append(
-                        departures[flow_id].get(bin_id, 0) / us_per_bin)
-                    self.egress_t[flow_id].append(self.bin_to_s(bin_id + 1))
+                self.egress_tput[flow_id] += (
+                    departures.bin_bits / us_per_bin).tolist()
+                self.egress_t[flow_id] += [
+                    self.bin_to_s(bin_id + 1) for bin_id in
+                    xrange(departures.min_bin,
+                           departures.min_bin + len(departures.bin_bits))]
 
             # calculate 95th percentile per-packet one-way delay
             self.percentile_delay_90th[flow_id] = None
@@ -227,32 +148,29 @@ class TunnelGraph(object):
             self.mean_delay[flow_id] = None
             self.percentile_delay[flow_id] = None
             self.jitter[flow_id] = None
-            if flow_id in self.delays:
-                self.percentile_delay_90th[flow_id] = np.percentile(
-                    self.delays[flow_id], 90, interpolation='higher')
-                self.percentile_delay[flow_id] = np.percentile(
-                    self.delays[flow_id], 95, interpolation='higher')
-                self.avg_delay[flow_id] = np.average(self.delays[flow_id])
-                self.mean_delay[flow_id] = np.mean(self.delays[flow_id])
-
-                tmp = np.array(self.delays[flow_id])
-                tmp -= self.avg_delay[flow_id]
-                delta_times_from_avg = np.absolute(tmp)
-                self.jitter[flow_id] = np.average(delta_times_from_avg)
+            if flow_id in summary.delays:
+                delays = summary.delays[flow_id]
+                self.percentile_delay_90th[flow_id] = delays.percentile(90)
+                self.percentile_delay[flow_id] = delays.percentile(95)
+                self.avg_delay[flow_id] = delays.mean()
+                self.mean_delay[flow_id] = delays.mean()
+                self.jitter[flow_id] = delays.jitter()
 
-                total_delays += self.delays[flow_id]
+                total_delays.merge(delays)
 
             # calculate loss rate for each flow
-            if flow_id in arrivals and flow_id in departures:
-                flow_arrivals = sum(arrivals[flow_id].values())
-                flow_departures = sum(departures[flow_id].values())
-
+            if arrivals.any() and departures.any():
                 self.loss_rate[flow_id] = None
-                if flow_arrivals > 0:
+                if arrivals.bits > 0:
                     self.loss_rate[flow_id] = (
-                        1 - 1.0 * flow_departures / flow_arrivals)
+                        1 - 1.0 * departures.bits / arrivals.bits)
                     self.avg_gput[flow_id] = self.avg_egress[flow_id]*(1.0-self.loss_rate[flow_id])
 
+        total_arrivals = summary.arrivals.bits
+        total_departures = summary.departures.bits
+        total_first_departure = summary.departures.first_ts
+        total_last_departure = summary.departures.last_ts
+
         self.total_loss_rate = None
         if total_arrivals > 0:
             self.total_loss_rate = 1 - 1.0 * total_departures / total_arrivals
@@ -271,31 +189,16 @@ class TunnelGraph(object):
             self.total_avg_gput = self.total_avg_egress*(1.0-self.total_loss_rate)
 
         self.total_percentile_delay = None
-        if total_delays:
-            self.total_percentile_delay = np.percentile(
-                #total_delays, 95, interpolation='nearest')
-                total_delays, 95, interpolation='higher')
-
         self.total_avg_delay = None
-        if total_delays:
-            self.total_avg_delay = np.average(total_delays)
-
         self.total_mean_delay = None
-        if total_delays:
-            self.total_mean_delay = np.mean(total_delays)
-
         self.total_90th_delay = None
-        if total_delays:
-            self.total_90th_delay = np.percentile(
-                #total_delays, 90, interpolation='nearest')
-                total_delays, 90, interpolation='higher')
-
-            self.total_jitter = None
-        if total_delays:
-            tmp = np.array(total_delays)
-            tmp -= self.total_avg_delay
-            delta_times_from_avg = np.absolute(tmp)
-            self.total_jitter = np.average(delta_times_from_avg)
+        self.total_jitter = None
+        if total_delays.count:
+            self.total_percentile_delay = total_delays.percentile(95)
+            self.total_avg_delay = total_delays.mean()
+            self.total_mean_delay = total_delays.mean()
+            self.total_90th_delay = total_delays.percentile(90)
+            self.total_jitter = total_delays.jitter()
 
     def flip(self, items, ncol):
         return list(itertools.chain(*[items[i::ncol] for i in range(ncol)]))
@@ -501,8 +404,25 @@ class TunnelGraph(object):
 
         return ret
 
-    def run(self):
-        self.parse_tunnel_log()
+    def run(self, summary=None):
+        if summary is None and not self.delay_graph:
+            # the merge step may have saved the results along with the
+            # series to plot; per-packet delays are never saved
+            saved = log_summary.graph_summary(self.tunnel_log,
+                                              self.ms_per_bin,
+                                              self.exact_delay)
+            if saved is not None:
+                tunnel_results, graph = saved
+                for attr, value in graph.items():
+                    setattr(self, attr, value)
+
+                if self.throughput_graph:
+                    self.plot_throughput_graph()
+                plt.close('all')
+
+                return tunnel_results
+
+        self.parse_tunnel_log(summary)
 
         if self.throughput_graph:
             self.plot_throughput_graph()
@@ -559,7 +479,9 @@ def main():
         tunnel_log=args.tunnel_log,
         throughput_graph=args.throughput_graph,
         delay_graph=args.delay_graph,
-        ms_per_bin=args.ms_per_bin)
+        ms_per_bin=args.ms_per_bin,
+        stream=args.stream,
+        exact_delay=not args.approx_delay)
     tunnel_results = tunnel_graph.run()
 
     sys.stderr.write(tunnel_results['stats'])
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import sys
+import math
+import json
+import shutil
+import tempfile
+import numpy as np
+
+import context
+from helpers import compressed_log
+
+# event codes stored in TunnelLog.event
+ARRIVAL = 1
+DEPARTURE = 2
+CAPACITY = 3
+DROP = 4
+
+# event tokens are rewritten into numbers so a block of the log can be
+# handed to np.fromstring in one go; the surrounding spaces keep the
+# replacement from touching timestamps, sizes or delays
+EVENT_TOKENS = [(' + ', ' %d ' % ARRIVAL),
+                (' - ', ' %d ' % DEPARTURE),
+                (' # ', ' %d ' % CAPACITY),
+                (' d ', ' %d ' % DROP)]
+
+CHUNK_BYTES = 1 << 22
+CHUNK_ROWS = 1 << 18
+
+# parsed columns are saved next to the log in <log>.cols/ as .npy files
+# the first time the whole log is read (by the analysis step, whose plots
+# read every log), and later readers memory-map them instead of parsing the
+# text again, decoding only the rows they read. The columns are compact:
+# timestamps and delays with up to 3 decimals are stored as integers in
+# their narrowest type, offset from the first one, delays only for the
+# departures, and sizes and flow ids in the narrowest type that fits, about
+# 8 to 10 bytes an event against some 25 of text
+CACHE_SUFFIX = '.cols'
+CACHE_VERSION = 2
+COLUMNS = ['ts', 'event', 'size', 'delay', 'flow_id']
+INT_TYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32,
+             np.int64]
+
+# sparse timestamp -> byte offset index kept in <log>.idx, written by
+# "merge_tunnel_logs.py multiple" or built here on first use
+INDEX_SUFFIX = '.idx'
+INDEX_STRIDE = 1 << 20
+
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[[ord(c) for c in ' \t\n\r\x0b\x0c']] = True
+
+
+class TunnelLog(object):
+    def __init__(self, ts, event, size, delay, flow_id, init_ts=None):
+        self.ts = ts              # timestamp in ms
+        self.event = event        # one of ARRIVAL, DEPARTURE, CAPACITY, DROP
+        self.size = size          # packet size in bytes
+        self.delay = delay        # one-way delay in ms (NaN if not departure)
+        self.flow_id = flow_id    # 0 if the line carries no flow id
+        self.init_ts = init_ts    # "# init timestamp" of the log if present
+
+    def __len__(self):
+        return len(self.ts)
+
+    def flows(self):
+        mask = (self.event == ARRIVAL) | (self.event == DEPARTURE)
+        return np.unique(self.flow_id[mask]).tolist()
+
+    def select(self, mask):
+        return TunnelLog(self.ts[mask], self.event[mask], self.size[mask],
+                         self.delay[mask], self.flow_id[mask], self.init_ts)
+
+    def window(self, start_ts, end_ts):
+        # events after start_ts, up to the first one at or beyond end_ts;
+        # like the original parsers this relies on sorted timestamps
+        lo = np.searchsorted(self.ts, start_ts, side='right')
+        hi = max(lo, np.searchsorted(self.ts, end_ts, side='left'))
+        return self.select(slice(lo, hi))
+
+
+def strip_comments(block, header):
+    lines = block.split('\n')
+    for line in lines:
+        if line.startswith('#'):
+            header.append(line)
+    return '\n'.join([line for line in lines if not line.startswith('#')])
+
+
+def parse_block(block):
+    for token, code in EVENT_TOKENS:
+        block = block.replace(token, code)
+
+    buf = np.frombuffer(block, dtype=np.uint8)
+    ws = WHITESPACE[buf]
+
+    # number of whitespace-separated items on each line
+    token_start = ~ws
+    token_start[1:] &= ws[:-1]
+    line_starts = np.concatenate(([0], np.flatnonzero(buf == ord('\n')) + 1))
+    line_starts = line_starts[line_starts < len(buf)]
+    if len(line_starts) == 0:
+        return None
+    num_items = np.add.reduceat(token_start, line_starts, dtype=np.intp)
+
+    values = np.fromstring(block, dtype=np.float64, sep=' ')
+    if len(values) != num_items.sum():
+        raise ValueError('malformed line in tunnel log')
+
+    num_items = num_items[num_items > 0]
+    first = np.cumsum(num_items) - num_items
+    if len(first) and num_items.min() < 3:
+        raise ValueError('malformed line in tunnel log')
+
+    ts = values[first]
+    event = values[first + 1].astype(np.int8)
+    size = values[first + 2].astype(np.int32)
+
+    departure = event == DEPARTURE
+    delay = np.full(len(first), np.nan)
+    has_delay = departure & (num_items >= 4)
+    delay[has_delay] = values[first[has_delay] + 3]
+
+    # flow ids are appended by "merge_tunnel_logs.py multiple"
+    flow_id = np.zeros(len(first), dtype=np.int16)
+    has_flow = (((event == ARRIVAL) & (num_items == 4)) |
+                (departure & (num_items == 5)))
+    flow_id[has_flow] = values[first[has_flow] + num_items[has_flow] - 1]
+
+    return ts, event, size, delay, flow_id
+
+
+def stored_path(tunnel_log_path):
+    # <log>, or <log>.gz or <log>.zst if only a compressed log is stored;
+    # caches and indexes are kept next to the stored file
+    return compressed_log.find_log(tunnel_log_path) or tunnel_log_path
+
+
+def source_stamp(tunnel_log_path):
+    st = os.stat(tunnel_log_path)
+    return {'version': CACHE_VERSION,
+            'size': st.st_size,
+            'mtime': st.st_mtime}
+
+
+def narrowest_int(values):
+    lo, hi = (values.min(), values.max()) if len(values) else (0, 0)
+    for dtype in INT_TYPES:
+        if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+
+
+def encode_fixed(values):
+    # (integers, [scale, base]) such that values are (integers + base) /
+    # scale exactly, for values with up to 3 decimals; (values, None) for
+    # any others, which are kept as they are
+    if len(values) and np.isfinite(values).all():
+        for scale in [1, 10, 100, 1000]:
+            scaled = np.round(values * scale)
+            if (np.abs(scaled).max() < 2 ** 52 and
+                    np.array_equal(scaled / scale, values)):
+                base = int(scaled[0])
+                return (narrowest_int(scaled.astype(np.int64) - base),
+                        [scale, base])
+    return values, None
+
+
+def decode_fixed(values, encoding):
+    # the same float64 values the text parses to
+    if encoding is None:
+        return np.array(values, dtype=np.float64)
+    scale, base = encoding
+    return (values.astype(np.int64) + base).astype(np.float64) / scale
+
+
+class CachedLog(object):
+    # the memory-mapped columns of a cached log
+    def __init__(self, cache_dir, meta):
+        self.columns = dict(
+            (col, np.load(path.join(cache_dir, col + '.npy'), mmap_mode='r'))
+            for col in COLUMNS)
+        self.ts_encoding = meta['ts']
+        self.delay_encoding = meta['delay']
+        self.init_ts = meta['init_ts']
+
+    def __len__(self):
+        return len(self.columns['event'])
+
+    def search(self, value, side='left'):
+        # like np.searchsorted on the decoded timestamps
+        ts = self.columns['ts']
+        if self.ts_encoding is None:
+            return np.searchsorted(ts, value, side=side)
+
+        # the smallest stored integer whose timestamp is at or beyond
+        # (left) or beyond (right) value; decoding is monotonic
+        scale, base = self.ts_encoding
+
+        def beyond(i):
+            decoded = float(i + base) / scale
+            return decoded > value if side == 'right' else decoded >= value
+
+        i = int(math.floor(value * scale)) - base
+        while beyond(i - 1):
+            i -= 1
+        while not beyond(i):
+            i += 1
+
+        info = np.iinfo(ts.dtype)
+        if i <= info.min:
+            return 0
+        if i > info.max:
+            return len(ts)
+        return np.searchsorted(ts, i, side='left')
+
+    def departures_before(self, row):
+        return np.count_nonzero(self.columns['event'][:row] == DEPARTURE)
+
+    def rows(self, lo, hi, first_departure=None):
+        # the events [lo, hi) as a TunnelLog; first_departure is the number
+        # of departures before lo, if known
+        if first_departure is None:
+            first_departure = self.departures_before(lo)
+
+        event = np.array(self.columns['event'][lo:hi])
+        departure = event == DEPARTURE
+        delay = np.full(len(event), np.nan)
+        delay[departure] = decode_fixed(
+            self.columns['delay'][first_departure:
+                                  first_departure + departure.sum()],
+            self.delay_encoding)
+
+        return TunnelLog(decode_fixed(self.columns['ts'][lo:hi],
+                                      self.ts_encoding),
+                         event,
+                         self.columns['size'][lo:hi].astype(np.int32),
+                         delay,
+                         self.columns['flow_id'][lo:hi].astype(np.int16),
+                         self.init_ts)
+
+
+def load_cache(tunnel_log_path):
+    cache_dir = tunnel_log_path + CACHE_SUFFIX
+
+    try:
+        with open(path.join(cache_dir, 'meta.json')) as meta_fh:
+            meta = json.load(meta_fh)
+        if meta['source'] != source_stamp(tunnel_log_path):
+            return None
+        return CachedLog(cache_dir, meta)
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def save_cache(tunnel_log_path, log):
+    cache_dir = tunnel_log_path + CACHE_SUFFIX
+    tmp_dir = None
+
+    ts, ts_encoding = encode_fixed(log.ts)
+    delay, delay_encoding = encode_fixed(log.delay[log.event == DEPARTURE])
+    columns = {'ts': ts,
+               'event': log.event,
+               'size': narrowest_int(log.size),
+               'delay': delay,
+               'flow_id': narrowest_int(log.flow_id)}
+
+    try:
+        # build the sidecar aside and rename it into place so that readers
+        # never see a partially written cache
+        tmp_dir = tempfile.mkdtemp(prefix=path.basename(cache_dir) + '.',
+                                   dir=path.dirname(cache_dir))
+        for col in COLUMNS:
+            np.save(path.join(tmp_dir, col + '.npy'), columns[col])
+
+        meta = {'source': source_stamp(tunnel_log_path),
+                'init_ts': log.init_ts,
+                'ts': ts_encoding,
+                'delay': delay_encoding}
+        with open(path.join(tmp_dir, 'meta.json'), 'w') as meta_fh:
+            json.dump(meta, meta_fh)
+
+        if path.isdir(cache_dir):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        os.rename(tmp_dir, cache_dir)
+    except (IOError, OSError) as exception:
+        sys.stderr.write('Warning: failed to cache %s: %s\n'
+                         % (tunnel_log_path, exception))
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def index_stamp(tunnel_log_path):
+    st = os.stat(tunnel_log_path)
+    return '# tunnel log index: %d %.6f' % (st.st_size, st.st_mtime)
+
+
+def load_index(tunnel_log_path):
+    try:
+        with open(tunnel_log_path + INDEX_SUFFIX) as index_fh:
+            if index_fh.readline().rstrip('\n') != index_stamp(
+                    tunnel_log_path):
+                return None
+            index = [line.split() for line in index_fh]
+    except (IOError, OSError):
+        return None
+    if any(len(entry) != 2 for entry in index):
+        return None
+
+    index_ts = np.array([float(ts) for ts, _ in index])
+    offsets = np.array([int(offset) for _, offset in index], dtype=np.int64)
+    return index_ts, offsets
+
+
+def build_index(tunnel_log_path, stride=INDEX_STRIDE):
+    index = []
+
+    with open(tunnel_log_path, 'rb') as tunlog:
+        for offset in xrange(0, os.path.getsize(tunnel_log_path), stride):
+            tunlog.seek(offset)
+            if offset > 0:
+                tunlog.readline()
+
+            # first complete event line after the sampled offset
+            line_offset = tunlog.tell()
+            line = tunlog.readline()
+            while line.startswith('#'):
+                line_offset = tunlog.tell()
+                line = tunlog.readline()
+            if not line.endswith('\n') or not line.strip():
+                continue
+
+            if not index or index[-1][1] != line_offset:
+                index.append((line.split()[0], line_offset))
+
+    tmp_path = tunnel_log_path + INDEX_SUFFIX + '.tmp.%d' % os.getpid()
+    try:
+        with open(tmp_path, 'w') as index_fh:
+            index_fh.write(index_stamp(tunnel_log_path) + '\n')
+            for ts, offset in index:
+                index_fh.write('%s %d\n' % (ts, offset))
+        os.rename(tmp_path, tunnel_log_path + INDEX_SUFFIX)
+    except (IOError, OSError):
+        if path.isfile(tmp_path):
+            os.remove(tmp_path)
+
+    return (np.array([float(ts) for ts, _ in index]),
+            np.array([offset for _, offset in index], dtype=np.int64))
+
+
+def seek_offset(tunnel_log_path, start_ts):
+    index = load_index(tunnel_log_path)
+    if index is None:
+        index = build_index(tunnel_log_path)
+
+    # every line before the last indexed line at or before start_ts has
+    # a timestamp <= start_ts and would be skipped by windowed parsers
+    index_ts, offsets = index
+    i = np.searchsorted(index_ts, start_ts, side='right') - 1
+    if i < 0:
+        return 0
+    return offsets[i]
+
+
+def read_header(tunlog):
+    header = []
+    while True:
+        offset = tunlog.tell()
+        line = tunlog.readline()
+        if not line.startswith('#'):
+            tunlog.seek(offset)
+            return header
+        header.append(line.rstrip('\n'))
+
+
+# with the cache, only the rows from start_ts to end_ts are decoded, and a
+# read of the whole log saves it if there is none yet; without it, windowed
+# reads seek to the indexed offset before start_ts and stop after the first
+# block that reaches end_ts. Callers still trim with TunnelLog.window
+def load_tunnel_log(tunnel_log_path, start_ts=None, end_ts=None, cache=True,
+                    chunk_bytes=CHUNK_BYTES):
+    tunnel_log_path = stored_path(tunnel_log_path)
+    if cache:
+        cached = load_cache(tunnel_log_path)
+        if cached is not None:
+            lo = 0 if start_ts is None else cached.search(start_ts, 'right')
+            hi = (len(cached) if end_ts is None else
+                  max(lo, cached.search(end_ts, 'right')))
+            return cached.rows(lo, hi)
+
+        if start_ts is None and end_ts is None:
+            log = parse_tunnel_log(tunnel_log_path, chunk_bytes=chunk_bytes)
+            save_cache(tunnel_log_path, log)
+            return log
+
+    return parse_tunnel_log(tunnel_log_path, start_ts, end_ts, chunk_bytes)
+
+
+def init_ts_of(header):
+    for line in header:
+        if 'init timestamp' in line:
+            return float(line.split(':')[1])
+    return None
+
+
+# yields the log in blocks for readers that keep bounded memory; cached
+# logs are decoded block by block from the memory-mapped columns, and a
+# missing cache is not built because that would hold the whole log in memory
+def iter_tunnel_log(tunnel_log_path, start_ts=None, end_ts=None, cache=True,
+                    chunk_bytes=CHUNK_BYTES):
+    tunnel_log_path = stored_path(tunnel_log_path)
+    cached = load_cache(tunnel_log_path) if cache else None
+
+    if cached is not None:
+        lo = 0 if start_ts is None else cached.search(start_ts, 'right')
+        departures = cached.departures_before(lo)
+        for i in xrange(lo, len(cached), CHUNK_ROWS):
+            block = cached.rows(i, min(i + CHUNK_ROWS, len(cached)),
+                                departures)
+            departures += np.count_nonzero(block.event == DEPARTURE)
+            yield block
+            if end_ts is not None and block.ts.max() >= end_ts:
+                return
+        return
+
+    header = []
+    for parsed in read_blocks(tunnel_log_path, header, start_ts, end_ts,
+                              chunk_bytes):
+        yield TunnelLog(*parsed, init_ts=init_ts_of(header))
+
+
+def read_blocks(tunnel_log_path, header, start_ts=None, end_ts=None,
+                chunk_bytes=CHUNK_BYTES):
+    tunnel_log_path = stored_path(tunnel_log_path)
+    compressed = compressed_log.compression_of(tunnel_log_path) is not None
+
+    # compressed logs are read from the start since they cannot seek
+    with compressed_log.open_log(tunnel_log_path, 'rb') as tunlog:
+        if start_ts is not None and not compressed:
+            header.extend(read_header(tunlog))
+            offset = seek_offset(tunnel_log_path, start_ts)
+            if offset > tunlog.tell():
+                tunlog.seek(offset)
+
+        leftover = ''
+        while True:
+            data = tunlog.read(chunk_bytes)
+            if not data:
+                block = leftover
+                leftover = ''
+            else:
+                data = leftover + data
+                cut = data.rfind('\n') + 1
+                block, leftover = data[:cut], data[cut:]
+
+            if block:
+                if block.startswith('#') or '\n#' in block:
+                    block = strip_comments(block, header)
+                parsed = parse_block(block)
+                if parsed is not None:
+                    yield parsed
+                    if end_ts is not None and parsed[0].max() >= end_ts:
+                        return
+
+            if not data:
+                return
+
+
+def parse_tunnel_log(tunnel_log_path, start_ts=None, end_ts=None,
+                     chunk_bytes=CHUNK_BYTES):
+    header = []
+    columns = list(read_blocks(tunnel_log_path, header, start_ts, end_ts,
+                               chunk_bytes))
+    init_ts = init_ts_of(header)
+
+    if not columns:
+        return TunnelLog(np.zeros(0), np.zeros(0, dtype=np.int8),
+                         np.zeros(0, dtype=np.int32), np.zeros(0),
+                         np.zeros(0, dtype=np.int16), init_ts)
+
+    return TunnelLog(*[np.concatenate(c) for c in zip(*columns)],
+                     init_ts=init_ts)
+
+
+def main():
+    # builds the <log>.cols cache for the given logs ahead of analysis
+    for tunnel_log_path in sys.argv[1:]:
+        log = load_tunnel_log(tunnel_log_path)
+        sys.stderr.write('%s: %d events, flows %s\n'
+                         % (tunnel_log_path, len(log), log.flows()))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ import argparse
 
 import context
 from helpers import utils
+from helpers import compressed_log
 
 
 def verify_schemes(schemes):
@@ -151,6 +152,23 @@ def parse_test_shared(local, remote, config_args):
 
         mode.add_argument('--srate', default='48M',help='Sending rate for udp traffic (e.g., 48M -> 48Mbps)')
 
+        mode.add_argument(
+            '--summarize', action='store_true',
+            help='summarize the merged tunnel logs while merging them, so '
+            'that analysis does not have to read the logs again')
+        mode.add_argument(
+            '--summary-windows', metavar='"START:END ..."',
+            help='with --summarize, also summarize these windows in seconds')
+        mode.add_argument(
+            '--summary-exact-delay', action='store_true',
+            help='with --summarize, keep every per-packet delay while merging '
+            'so that analysis without --approx-delay can use the summaries '
+            '(default delay histograms, in bounded memory)')
+        mode.add_argument(
+            '--compress-logs', choices=sorted(compressed_log.COMPRESSORS),
+            help='store the merged tunnel logs and mm-link logs compressed; '
+            'analysis reads them transparently')
+
 def parse_test_local(local):
     local.add_argument(
         '--uplink-trace', metavar='TRACE',
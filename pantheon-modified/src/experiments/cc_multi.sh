@@ -28,9 +28,15 @@ down=$downl
 log=${comment}-$scheme-$down-$lat-$qs-$loss-$interval
 echo "************************ Running $log*********************************"
 
+# the merge of the logs also summarizes the windows of the two-flow grid in
+# ../scenarios.yml, which save_piecewise.py --approx-delay reads instead of
+# the logs
+windows=`python ../helpers/scenarios.py two-flow --windows --intervals $interval`
+
 python2.7 test.friendliness.py local --schemes $scheme --uplink-trace traces/$down --downlink-trace traces/$upl -t $time \
     --extra-mm-link-args "--uplink-queue=droptail --uplink-queue-args=\"packets=$qs\" --downlink-queue=droptail --downlink-queue-args=\"packets=$qs" \
     --prepend-mm-cmds " mm-loss uplink $loss mm-loss downlink $loss mm-delay $lat " \
     --setup_time $setup_time --orcalearn 4 --random-order -f $num_of_flows --interval $interval --run-times $num_times --data-dir   data/$log   \
     --save 1 --rm 0 --comment \"${num_of_flows}-cubic-added_${down}_${lat}_${qs}_${loss}_${interval}\" --tcpgen_cc $scheme --bw $bw \
-    --basetime_fld  "$basetimestamp_fld\/$log\/tcpdatagen_mm_acklink_run1.log_init_timestamp" --bw2 $bw2 --trace_period $trace_period --srate "24M"
+    --basetime_fld  "$basetimestamp_fld\/$log\/tcpdatagen_mm_acklink_run1.log_init_timestamp" --bw2 $bw2 --trace_period $trace_period \
+    --summarize --summary-windows "$windows" --srate "24M"
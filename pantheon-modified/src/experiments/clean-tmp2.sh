@@ -2,7 +2,7 @@ for i in data/dataset-gen-*/tcpdatagen_mm_*.log;
 do
     rm $i
 done
-for i in data/dataset-gen-*/*_mm_*.log;
+for i in data/dataset-gen-*/*_mm_*.log data/dataset-gen-*/*_mm_*.log.gz data/dataset-gen-*/*_mm_*.log.zst;
 do
     rm $i
 done
@@ -10,3 +10,16 @@ for i in data/friendliness-multiflow-all-*/*_mm_*.log
 do
     rm $i
 done
+# drop parsed-log caches, indexes and summaries whose source log is gone
+for i in data/*/*.log*.cols
+do
+    [ -d "$i" ] && [ ! -e "${i%.cols}" ] && rm -r $i
+done
+for i in data/*/*.log*.idx
+do
+    [ -f "$i" ] && [ ! -e "${i%.idx}" ] && rm $i
+done
+for i in data/*/*.log*.summary.json
+do
+    [ -f "$i" ] && [ ! -e "${i%.summary.json}" ] && rm $i
+done
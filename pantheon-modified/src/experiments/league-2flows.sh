@@ -6,89 +6,28 @@ schemes="vegas cubic"
 
 output="charts-overall-ranking-multi"
 
-period=30
-setup_time=10
 data="./data/"
-intervals="5"
+# the intervals and windows of the two-flow grid in ../scenarios.yml
+intervals=`python ../helpers/scenarios.py two-flow --list interval`
 win_margin=10           # Any scheme perfomring between [(win_margin/100)% of the best, the best] will be considered as a winner.
 
-starts=`seq 0 $period $((120-period))`
-for s in $starts
-do
-    for interval in $intervals
-    do
-        start=$((s+interval+setup_time))
-        end=$((start+period))
-        python ../analysis/league-piecewise-2flows.py --datadir $data --win-start=$start --win-end=$end --interval=$interval --prefix=dataset-gen --win-margin=$win_margin --schemes="$schemes"
-
-        for j in $data/dataset-gen-league-multiflows-${start}_${end}
-        do
-            rm $j/chart*
-            num_env=`cat $j/num_env | grep total | awk '{print $2}'`
-            for i in $schemes
-            do
-                cat $j/winners | grep -e "^${i}_2" | awk -v s="$i" -v n_env="$num_env" 'END{print s"\t "NR"\t "NR/n_env}' >>$j/chart
-            done
-
-            sort -k2 -rh $j/chart > $j/charts
-            rm $j/chart;#echo $j;cat $j/charts
-        done
-    done
-    echo "Done with date/dataset-gen-league-${start}_${end}/winners-dataset/ ...................."
-done
+# gather the piecewise results of all experiments in one store, which every
+# window below reads instead of the JSON files of each experiment
+store=$data/results.db
+python ../analysis/results_store.py --datadir $data --store $store
 
-declare -A sum
-declare -A norm
-for i in $schemes
+for interval in $intervals
 do
-    sum[$i]=0
-done
-for cc in $schemes
-do
-    for s in $starts
+    for window in `python ../helpers/scenarios.py two-flow --windows --league --intervals $interval`
     do
-        for interval in $intervals
-        do
-            start=$((s+interval+setup_time))
-            end=$((start+period))
-            for i in $data/dataset-gen-league-multiflows-${start}_${end};
-            do
-                d=`cat $i/charts | awk -v sch="$cc" '{if($1==sch)print $2}'`; sum[$cc]=$((sum[$cc]+d));
-            done
-        done
-    done
-done
-total=0
-for cc in $schemes
-do
-    total=$((sum[$cc]+total))
-done
-rm $data/num_env $data/total $data/total_l $data/total_nl
-
-for i in $data/dataset-gen-league-multi*;
-do
-    cat $i/num_env
-    echo "`cat $i/num_env | grep total | awk '{print $2}'`" >> $data/total
-done
-
-total=`cat $data/total | awk 'BEGIN{s=0}{s=s+$1}END{print s}'`
+        start=${window%:*}
+        end=${window#*:}
+        python ../analysis/league-piecewise-2flows.py --datadir $data --store=$store --win-start=$start --win-end=$end --interval=$interval --win-margin=$win_margin --schemes="$schemes"
 
-for cc in $schemes
-do
-    norm[$cc]=`printf %.2f "$((1000000000  *  100*sum[$cc]/total))e-9"`
-done
-rm tmp tmp2
-for cc in $schemes
-do
-    echo "$cc ${sum[$cc]} ${norm[$cc]} $total" >> tmp
+        echo "Done with date/dataset-gen-league-${start}_${end}/winners-dataset/ ...................."
+    done
 done
-sort -k2 -hr tmp > tmp2
-column -t tmp2 > tmp
-
-rm $data/${output}
-echo -e "scheme wins % num_games" >> $data/${output}
-
-cat tmp >> $data/${output}
-cat $data/${output}
-rm tmp*
 
+# the charts of every window, and the overall ranking in $data/${output} and
+# $data/${output}.json
+python ../analysis/league_ranking.py --datadir $data --grid two-flow --output $output --schemes="$schemes"
@@ -1,8 +1,32 @@
 #!/usr/bin/env python
 
+import os
+from os import path
 import sys
 import argparse
 import heapq
+import operator
+import itertools
+import collections
+import numpy as np
+
+import context
+from helpers import compressed_log
+
+# a "timestamp byte-offset" line is written to <output>.idx about every
+# INDEX_STRIDE bytes of a merged log so that windowed readers can seek into
+# it; the format must match analysis/tunnel_log.py
+INDEX_SUFFIX = '.idx'
+INDEX_STRIDE = 1 << 20
+
+# multiple mode reads each log in blocks of MERGE_BLOCK_BYTES and writes
+# the merged log in batches of lines instead of a line at a time
+MERGE_BLOCK_BYTES = 1 << 22
+MERGE_BLOCK_LINES = 1 << 16
+WHITESPACE_RUNS = ['  ', '\t', '\r', '\x0b', '\x0c', ' \n', '\n ']
+
+# must match analysis/log_summary.py
+SUMMARY_SUFFIX = '.summary.json'
 
 
 def parse_arguments():
@@ -29,6 +53,11 @@ def parse_arguments():
     single_parser.add_argument(
         '-e-clock-offset', metavar='MS', type=float,
         help='clock offset on the end where egress log is saved')
+    single_parser.add_argument(
+        '-max-delay', metavar='MS', type=float, default=10000,
+        help='packets not received within this delay are dropped from memory '
+        'and looked up again in the egress log if they show up later '
+        '(default 10000)')
 
     # subparser for multiple mode
     multiple_parser = subparsers.add_parser(
@@ -42,6 +71,22 @@ def parse_arguments():
     multiple_parser.add_argument(
         '-o', action='store', metavar='OUTPUT-LOG', dest='output_log',
         required=True, help='output log after merging')
+    multiple_parser.add_argument(
+        '--summary', action='store_true',
+        help='also write the per-flow statistics and throughput series of '
+        'the output log to OUTPUT-LOG%s while merging' % SUMMARY_SUFFIX)
+    multiple_parser.add_argument(
+        '--windows', metavar='"START:END ..."',
+        help='with --summary, also summarize these windows in seconds')
+    multiple_parser.add_argument(
+        '--exact-delay', action='store_true',
+        help='with --summary, keep every per-packet delay for exact delay '
+        'percentiles and jitter, in memory that grows with the log, instead '
+        'of histograms within 0.5%% in bounded memory')
+    multiple_parser.add_argument(
+        '--compress', choices=sorted(compressed_log.COMPRESSORS),
+        help='write OUTPUT-LOG compressed (as OUTPUT-LOG.gz or .zst) and '
+        'compress LINK-LOG in place after merging')
 
     return parser.parse_args()
 
@@ -51,6 +96,97 @@ def parse_line(line):
     return (float(ts), int(uid), int(size))
 
 
+def read_sent(send_log, send_cal):
+    for line in send_log:
+        (send_ts, send_uid, send_size) = parse_line(line)
+        yield (send_ts + send_cal, send_uid, send_size)
+
+
+def find_sent(egress_log, send_cal, uid):
+    with open(egress_log) as send_log:
+        send_log.readline()
+        for send_ts, send_uid, send_size in read_sent(send_log, send_cal):
+            if send_uid == uid:
+                return (send_ts, send_size)
+    return None
+
+
+def all_sent(egress_log, send_cal):
+    # uid -> (ts, size) of every packet of the egress log
+    with open(egress_log) as send_log:
+        send_log.readline()
+        return dict((send_uid, (send_ts, send_size)) for send_ts, send_uid,
+                    send_size in read_sent(send_log, send_cal))
+
+
+class InFlight(object):
+    # sent packets of the egress log that have not been received yet; only
+    # packets within max_delay of the merge point are held in memory. A
+    # packet received outside of it is looked up in the egress log again;
+    # after MAX_RESCANS of them, e.g. with a small max_delay or clock offsets
+    # that push many packets past it, all sent packets are read into memory
+    # once instead, as the two-pass merge did, to keep the merge linear
+    MAX_RESCANS = 16
+
+    def __init__(self, send_log, send_cal, max_delay):
+        self.sent = read_sent(send_log, send_cal)
+        self.send_cal = send_cal
+        self.max_delay = max_delay
+        self.rescans = 0
+        self.all_pkts = None
+
+        self.pending = collections.deque()    # read but not merged yet
+        self.pkts = collections.OrderedDict()  # uid -> (ts, size)
+        self.read()
+
+    def read(self):
+        send = next(self.sent, None)
+        if send is None:
+            return False
+
+        (send_ts, send_uid, send_size) = send
+        self.pending.append(send)
+        self.pkts[send_uid] = (send_ts, send_size)
+        return True
+
+    def next_sent(self):
+        if not self.pending:
+            self.read()
+        if not self.pending:
+            return None
+        return self.pending[0]
+
+    def pop_sent(self):
+        self.pending.popleft()
+
+    def pop_received(self, egress_log, uid, recv_ts):
+        # forget packets that were probably lost
+        while self.pkts:
+            old_uid = next(self.pkts.iterkeys())
+            if self.pkts[old_uid][0] >= recv_ts - self.max_delay:
+                break
+            del self.pkts[old_uid]
+
+        # a packet can be received before it is logged as sent when the
+        # clock offsets are off, so read ahead for it
+        while uid not in self.pkts:
+            if self.pending and self.pending[-1][0] > recv_ts + self.max_delay:
+                break
+            if not self.read():
+                break
+
+        pkt = self.pkts.pop(uid, None)
+        if pkt is not None:
+            return pkt
+
+        if self.all_pkts is None and self.rescans < self.MAX_RESCANS:
+            self.rescans += 1
+            return find_sent(egress_log, self.send_cal, uid)
+        if self.all_pkts is None:
+            self.all_pkts = all_sent(egress_log, self.send_cal)
+        return self.all_pkts.get(uid)
+
+
 def single_mode(args):
     recv_log = open(args.ingress_log)
     send_log = open(args.egress_log)
@@ -85,38 +221,33 @@ def single_mode(args):
     send_cal = send_init_ts - min_init_ts
     recv_cal = recv_init_ts - min_init_ts
 
-    # construct a hash table using uid as keys
-    send_pkts = {}
-    for line in send_log:
-        (send_ts, send_uid, send_size) = parse_line(line)
-        send_pkts[send_uid] = (send_ts + send_cal, send_size)
-
-    send_log.seek(0)
-    send_log.readline()
+    # pair packets by uid in one pass over both logs
+    in_flight = InFlight(send_log, send_cal, args.max_delay)
 
     # merge two sorted logs into one
-    send_l = send_log.readline()
-    if send_l:
-        (send_ts, send_uid, send_size) = parse_line(send_l)
+    send = in_flight.next_sent()
+    if send:
+        (send_ts_cal, send_uid, send_size) = send
 
     recv_l = recv_log.readline()
     if recv_l:
         (recv_ts, recv_uid, recv_size) = parse_line(recv_l)
 
-    while send_l or recv_l:
-        if send_l:
-            send_ts_cal = send_ts + send_cal
+    while send or recv_l:
         if recv_l:
             recv_ts_cal = recv_ts + recv_cal
 
-        if (send_l and recv_l and send_ts_cal <= recv_ts_cal) or not recv_l:
+        if (send and recv_l and send_ts_cal <= recv_ts_cal) or not recv_l:
             output_log.write('%.3f + %s\n' % (send_ts_cal, send_size))
-            send_l = send_log.readline()
-            if send_l:
-                (send_ts, send_uid, send_size) = parse_line(send_l)
-        elif (send_l and recv_l and send_ts_cal > recv_ts_cal) or not send_l:
-            if recv_uid in send_pkts:
-                (paired_send_ts, paired_send_size) = send_pkts[recv_uid]
+            in_flight.pop_sent()
+            send = in_flight.next_sent()
+            if send:
+                (send_ts_cal, send_uid, send_size) = send
+        elif (send and recv_l and send_ts_cal > recv_ts_cal) or not send:
+            paired = in_flight.pop_received(args.egress_log, recv_uid,
+                                            recv_ts_cal)
+            if paired is not None:
+                (paired_send_ts, paired_send_size) = paired
                 # inconsistent packet size
                 if paired_send_size != recv_size:
                     sys.exit(
@@ -140,52 +271,239 @@ def single_mode(args):
     output_log.close()
 
 
-def push_to_heap(heap, index, log_file, init_ts_delta):
-    line = None
+def format_lines(lines, index, init_ts_delta, normalized, capacity):
+    if normalized:
+        fields = [line.partition(' ') for line in lines]
+        rests = [f[2] for f in fields]
+    else:
+        fields = [line.split(None, 1) for line in lines]
+        rests = [' '.join(f[1].split()) for f in fields]
+    ts = np.array(map(float, [f[0] for f in fields])) + init_ts_delta
+
+    # delivery opportunities are logged 4 bytes larger than their payload
+    if capacity:
+        adjusted = {}
+        for rest in set(rests):
+            if rest.startswith('# '):
+                rest_list = rest.split(' ')
+                rest_list[1] = str(int(rest_list[1]) - 4)
+                adjusted[rest] = ' '.join(rest_list)
+        rests = [adjusted.get(rest, rest) for rest in rests]
+
+    # append flow ids to arrival and departure events
+    line_format = '%.3f %s'
+    if index != -1:
+        line_format += ' %s' % (index + 1)
+
+    return ts, map(line_format.__mod__, itertools.izip(ts.tolist(), rests))
+
+
+def pick(items, order):
+    if len(order) == 1:
+        return [items[order[0]]]
+    return list(operator.itemgetter(*order)(items)) if len(order) else []
+
+
+def format_events(lines, index, init_ts_delta, normalized, capacity):
+    # calibrate and format a block of events the way they appear in the
+    # merged log; returns their timestamps and output lines
+    if index != -1:
+        lines = [line for line in lines if line and line[0] != '#']
+        return format_lines(lines, index, init_ts_delta, normalized,
+                            capacity)
+
+    # keep only the delivery opportunities of an mm-link log; several of
+    # them share each millisecond, so every distinct line is formatted once
+    lines = [line for line in lines if '#' in line and line[0] != '#']
+    distinct = list(set(lines))
+    ts, out = format_lines(distinct, index, init_ts_delta, normalized, True)
+
+    position = dict(itertools.izip(distinct, itertools.count()))
+    order = map(position.__getitem__, lines)
+    return ts[order], pick(out, order)
+
+
+class LogReader(object):
+    # buffered events of one log that is merged in multiple mode
+    def __init__(self, log_file, index, init_ts_delta):
+        self.log_file = log_file
+        self.index = index
+        self.init_ts_delta = init_ts_delta
+
+        self.ts = np.zeros(0)
+        self.lines = []
+        self.leftover = ''
+        self.eof = False
+        self.unsorted = False
+
+    def read(self):
+        data = self.log_file.read(MERGE_BLOCK_BYTES)
+        if not data:
+            self.eof = True
+            block, self.leftover = self.leftover, ''
+        else:
+            data = self.leftover + data
+            cut = data.rfind('\n') + 1
+            block, self.leftover = data[:cut], data[cut:]
+
+        # fields of lines separated by single spaces need no normalizing
+        normalized = not (block.startswith(' ') or
+                          any(ws in block for ws in WHITESPACE_RUNS))
+        ts, lines = format_events(block.split('\n'), self.index,
+                                  self.init_ts_delta, normalized,
+                                  not normalized or ' # ' in block)
+        if len(ts) == 0:
+            return
+
+        if (np.any(ts[1:] < ts[:-1]) or
+                (len(self.ts) and ts[0] < self.ts[-1])):
+            self.unsorted = True
+        self.ts = np.concatenate((self.ts, ts))
+        self.lines += lines
+
+    def read_first(self):
+        while not self.eof and not len(self.ts):
+            self.read()
+        return len(self.ts) > 0
+
+    def take(self, count):
+        ts, self.ts = self.ts[:count], self.ts[count:]
+        lines, self.lines = self.lines[:count], self.lines[count:]
+        return ts, lines
+
+    def events(self):
+        while True:
+            for ts, line in itertools.izip(self.ts.tolist(), self.lines):
+                yield (ts, self.index, line)
+            self.take(len(self.lines))
+
+            if self.eof:
+                return
+            self.read()
+
+
+class MergedLog(object):
+    # output of multiple mode along with its sparse timestamp index, and
+    # optionally a summarizer fed with every batch of lines
+    def __init__(self, output_log, summarizer=None):
+        self.output_log = output_log
+        self.summarizer = summarizer
+        self.offset = output_log.tell()
+        self.index = []
+        self.next_index_offset = 0
+
+    def write(self, lines):
+        if not lines:
+            return
+
+        lengths = np.array(map(len, lines)) + 1
+        starts = self.offset + np.cumsum(lengths) - lengths
+        while True:
+            i = np.searchsorted(starts, self.next_index_offset)
+            if i == len(lines):
+                break
+            self.index.append((lines[i].split(' ', 1)[0], starts[i]))
+            self.next_index_offset = starts[i] + INDEX_STRIDE
+
+        self.output_log.write('\n'.join(lines) + '\n')
+        self.offset = starts[-1] + lengths[-1]
+
+        if self.summarizer is not None:
+            self.summarizer.add(lines)
+
 
+def merge_logs(readers, merged_log):
+    # logs are sorted by timestamp, so every buffered event before the
+    # earliest last buffered timestamp of the unfinished logs can be
+    # merged; ties go to the lower index as with a heap of (ts, index)
+    bound = -np.inf
     while True:
-        line = log_file.readline()
-        if not line:
-            break
+        for reader in readers:
+            while not reader.eof and (not len(reader.ts) or
+                                      reader.ts[-1] <= bound):
+                reader.read()
+
+        if any(reader.unsorted for reader in readers):
+            # an unsorted log is merged exactly like a heap would
+            lines = []
+            for _, _, line in heapq.merge(*[reader.events()
+                                            for reader in readers]):
+                lines.append(line)
+                if len(lines) == MERGE_BLOCK_LINES:
+                    merged_log.write(lines)
+                    lines = []
+            merged_log.write(lines)
+            return
+
+        unfinished = [reader.ts[-1] for reader in readers if not reader.eof]
+        bound = min(unfinished) if unfinished else np.inf
+
+        ts = []
+        indexes = []
+        lines = []
+        for reader in readers:
+            count = np.searchsorted(reader.ts, bound)
+            if not reader.eof and count == 0:
+                continue
+            if reader.eof:
+                count = len(reader.ts)
 
-        if line.startswith('#'):
-            continue
+            reader_ts, reader_lines = reader.take(count)
+            ts.append(reader_ts)
+            indexes.append(np.repeat(reader.index, count))
+            lines += reader_lines
 
-        # if log_file is mm-link-log
-        if index == -1:
-            # find the next delivery opportunity
-            if '#' in line:
-                break
-        else:
-            break
+        if lines:
+            order = np.lexsort((np.concatenate(indexes), np.concatenate(ts)))
+            merged_log.write(pick(lines, order.tolist()))
+
+        if not unfinished:
+            return
 
-    if line:
-        line_list = line.strip().split()
-        calibrated_ts = float(line_list[0]) + init_ts_delta
 
-        line_list[0] = '%.3f' % calibrated_ts
-        if line_list[1] == '#':
-            line_list[2] = str(int(line_list[2]) - 4)
-        line = ' '.join(line_list)
-        heapq.heappush(heap, (calibrated_ts, index, line))
+def write_index(log_name, index):
+    st = os.stat(log_name)
+    with open(log_name + INDEX_SUFFIX, 'w') as index_log:
+        index_log.write('# tunnel log index: %d %.6f\n'
+                        % (st.st_size, st.st_mtime))
+        for ts, offset in index:
+            index_log.write('%s %d\n' % (ts, offset))
 
-    return line
+
+def make_summarizer(windows, exact_delay):
+    # analysis/ goes first on the path since experiments/ has its own
+    # arg_parser module
+    sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)),
+                                 os.pardir, 'analysis'))
+    import arg_parser
+    import log_summary
+
+    try:
+        windows = arg_parser.parse_windows(windows) if windows else None
+    except argparse.ArgumentTypeError as e:
+        sys.exit(str(e))
+
+    return log_summary.LogSummarizer(windows, exact_delay=exact_delay)
 
 
 def multiple_mode(args):
+    summarizer = None
+    if args.summary:
+        summarizer = make_summarizer(args.windows, args.exact_delay)
+
     # open log files
     link_log = None
     if args.link_log:
-        link_log = open(args.link_log)
+        link_log = compressed_log.open_log(args.link_log)
 
     tun_logs = []
     for tun_log_name in args.tunnel_logs:
-        tun_logs.append(open(tun_log_name))
+        tun_logs.append(compressed_log.open_log(tun_log_name))
 
-    output_log = open(args.output_log, 'w')
+    output_log = compressed_log.create_log(args.output_log, args.compress)
 
-    # maintain a min heap to merge sorted logs
-    heap = []
+    # merge sorted logs block by block
+    readers = []
     if link_log:
         # find initial timestamp in the mm-link log
         while True:
@@ -226,34 +544,23 @@ def multiple_mode(args):
         init_ts_delta[i] -= min_init_ts
 
     output_log.write('# init timestamp: %.3f\n' % min_init_ts)
+    merged_log = MergedLog(output_log, summarizer)
 
-    # build the min heap
+    # read the first events of every log
     if link_log:
-        line = push_to_heap(heap, -1, link_log, link_init_ts_delta)
-        if not line:
+        readers.append(LogReader(link_log, -1, link_init_ts_delta))
+        if not readers[-1].read_first():
             sys.exit('Warning: no delivery opportunities found\n')
 
     for i in xrange(len(tun_logs)):
-        line = push_to_heap(heap, i, tun_logs[i], init_ts_delta[i])
-        if not line:
+        readers.append(LogReader(tun_logs[i], i, init_ts_delta[i]))
+        if not readers[-1].read_first():
             sys.exit(
                 'Warning: %s does not contain any arrival or '
                 'departure events\n' % tun_logs[i].name)
 
     # merge all log files
-    while heap:
-        (ts, index, line) = heapq.heappop(heap)
-
-        # append flow ids to arrival and departure events
-        if index != -1:
-            line += ' %s' % (index + 1)
-
-        output_log.write(line + '\n')
-
-        if index == -1:
-            push_to_heap(heap, index, link_log, link_init_ts_delta)
-        else:
-            push_to_heap(heap, index, tun_logs[index], init_ts_delta[index])
+    merge_logs(readers, merged_log)
 
     # close log files
     if link_log:
@@ -262,6 +569,21 @@ def multiple_mode(args):
         tun_log.close()
     output_log.close()
 
+    if args.compress is None:
+        write_index(args.output_log, merged_log.index)
+    else:
+        # a compressed log cannot seek, so it gets no index; the mm-link log
+        # is compressed too unless it already was
+        if link_log and compressed_log.compression_of(link_log.name) is None:
+            compressed_log.compress_log(args.link_log, args.compress)
+
+    if summarizer is not None:
+        if any(reader.unsorted for reader in readers):
+            sys.stderr.write('Warning: %s is not sorted by timestamp, '
+                             'no summary is written\n' % args.output_log)
+        else:
+            summarizer.save(args.output_log)
+
 
 def main():
     args = parse_arguments()
@@ -11,36 +11,36 @@ data="./data"
 
 pids=""
 cnt=0
-setup_time=10
 sys_cpu_cnt=`lscpu | grep "^CPU(s):" | awk '{print $2}'`
 cpu_num=$((sys_cpu_cnt))
 
-for period in 30 120
+# the intervals and windows of the two-flow grid in ../scenarios.yml
+for interval in `python ../helpers/scenarios.py two-flow --list interval`
 do
-    for s in `seq 0 $period 119 `
-    do
-        for interval in 5
-        do
-            start=$((s+interval+setup_time))
-            end=$((start+period))
-            cc=$schemes
+    windows=`python ../helpers/scenarios.py two-flow --windows --intervals $interval`
+    cc=$schemes
 
-            for log in $data/dataset-gen*-added-${cc}-*$interval
+    # All windows of a data dir are saved from a single read of its logs, or
+    # from the summaries cc_multi.sh saved while merging them, whose delay
+    # percentiles and jitter are approximate (--approx-delay)
+    for log in `python ../helpers/scenarios.py two-flow --schemes $cc --intervals $interval --fields dir`
+    do
+        if [ ! -d $data/$log ]
+        then
+            continue
+        fi
+        python ../analysis/save_piecewise.py --data-dir $data/$log --windows="$windows" --approx-delay &
+        pids="$pids $!"
+        cnt=$((cnt+1))
+        if [ $cnt -gt $cpu_num ]
+        then
+            for pid in $pids
             do
-                python ../analysis/save_piecewise.py --data-dir $log --win-start=${start} --win-end=${end} &
-                pids="$pids $!"
-                cnt=$((cnt+1))
-                if [ $cnt -gt $cpu_num ]
-                then
-                    for pid in $pids
-                    do
-                        wait $pid
-                    done
-                    cnt=0
-                    pids=""
-                fi
-           done
-        done
+                wait $pid
+            done
+            cnt=0
+            pids=""
+        fi
     done
 done
 
@@ -11,37 +11,31 @@ pids=""
 sys_cpu_cnt=`lscpu | grep "^CPU(s):" | awk '{print $2}'`
 cpu_num=$sys_cpu_cnt
 cnt=0
-period=7
+# the windows of the single-flow grid in ../scenarios.yml: the first ([0-3]s
+# after the setup time) is dedicated to slow-start comparisons, the others to
+# the "changing" conditions
+windows=`python ../helpers/scenarios.py single-flow --windows`
 
-setup_time=10
-end_of_ss_comp_segment=3
-# We have 4 segments, in single-flow scenario:
-# The first segment ([0-3]s) is dedicated for slow-start comparisons &
-# 2nd, 3rd, & 4th are dedicated for the "changing" conditions.
-
-for start in 0 3 10 17
+# All windows of a data dir are saved from a single read of its logs, or from
+# the summaries cc_solo.sh saved while merging them, whose delay percentiles
+# and jitter are approximate (--approx-delay)
+for log in `python ../helpers/scenarios.py single-flow --schemes $cc --fields dir`
 do
-    for log in $data/dataset-gen*-${cc}-*
-    do
-        if [ $start -eq 0 ]
-        then
-            win_end_time=$end_of_ss_comp_segment
-        else
-            win_end_time=$((start+period))
-        fi
-        win_start_time=$start
-        python ../analysis/save_piecewise.py --data-dir $log --win-start=$((win_start_time+setup_time)) --win-end=$((win_end_time+setup_time)) &
-        pids="$pids $!"
-        cnt=$((cnt+1))
-        if [ $cnt -gt $cpu_num ]
-        then
-            for pid in $pids
-            do
-                wait $pid
-            done
-            cnt=0
-            pids=""
-        fi
-    done
+    if [ ! -d $data/$log ]
+    then
+        continue
+    fi
+    python ../analysis/save_piecewise.py --data-dir $data/$log --windows="$windows" --approx-delay &
+    pids="$pids $!"
+    cnt=$((cnt+1))
+    if [ $cnt -gt $cpu_num ]
+    then
+        for pid in $pids
+        do
+            wait $pid
+        done
+        cnt=0
+        pids=""
+    fi
 done
 
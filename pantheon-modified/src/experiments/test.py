@@ -52,6 +52,10 @@ class Test(object):
         self.bw2 = args.bw2
 
         self.srate = args.srate
+        self.summarize = args.summarize
+        self.summary_windows = args.summary_windows
+        self.summary_exact_delay = args.summary_exact_delay
+        self.compress_logs = args.compress_logs
         # used for cleanup
         self.proc_first = None
         self.proc_second = None
@@ -697,15 +701,28 @@ class Test(object):
             datalink_tun_logs.append(datalink_tun_log)
             acklink_tun_logs.append(acklink_tun_log)
 
+        # optionally summarize and compress the merged logs in the same pass
+        merge_args = []
+        if self.summarize:
+            merge_args = ['--summary']
+            if self.summary_windows:
+                merge_args += ['--windows', self.summary_windows]
+            if self.summary_exact_delay:
+                merge_args += ['--exact-delay']
+        if self.compress_logs:
+            merge_args += ['--compress', self.compress_logs]
+
         cmd = [merge_tunnel_logs, 'multiple', '-o', self.datalink_log]
         if self.mode == 'local':
             cmd += ['--link-log', self.mm_datalink_log]
+        cmd += merge_args
         cmd += datalink_tun_logs
         call(cmd)
 
         cmd = [merge_tunnel_logs, 'multiple', '-o', self.acklink_log]
         if self.mode == 'local':
             cmd += ['--link-log', self.mm_acklink_log]
+        cmd += merge_args
         cmd += acklink_tun_logs
         call(cmd)
 
@@ -798,6 +815,8 @@ def run_tests(args):
     meta = vars(args).copy()
     meta['cc_schemes'] = sorted(cc_schemes)
     meta['git_summary'] = git_summary
+    # CPUs and NUMA nodes of the runs, when the scheduler pinned them
+    meta['cpu_placement'] = utils.get_cpu_placement()
 
     metadata_path = path.join(args.data_dir, 'pantheon_metadata.json')
     utils.save_test_metadata(meta, metadata_path)
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import time
+import argparse
+from os import path
+
+import context
+import scenarios
+import scheduler
+from compressed_log import find_log
+from subprocess_wrappers import call
+
+# a campaign takes every scenario of a grid through its steps: run (the
+# emulation, whose test merges the tunnel logs of every run; merge records
+# that the merged logs are all there), analysis, piecewise (the
+# piecewise_perf_*.json of its windows), logs (with --raw-logs, compresses or
+# deletes the mm-link logs, which nothing reads after them) and ingest (into
+# the results store of the leagues). The state of every step of every
+# scenario is appended to a manifest, data/campaign-<grid>.manifest, as soon
+# as it changes. Run again, e.g. after a crash or a reboot, the campaign
+# skips the steps done and retries those that failed or were left running,
+# and the steps after them. It runs from src/experiments, like the runall
+# scripts.
+#
+# By default every step runs for all the scenarios before the next one
+# starts. With --pipeline, the steps after the run of a scenario are added
+# to the same jobs as soon as it finishes, at a lower priority and niced, so
+# that they fill the CPUs the emulations leave free without slowing them,
+# and the raw logs of a scenario go as soon as it is analyzed.
+STEPS = ['run', 'merge', 'analysis', 'piecewise', 'logs', 'ingest']
+
+DATA_DIR = 'data'
+
+# the scripts of the steps, by whether the grid has several flows
+ARGS = ('{scheme} {prefix} {flows} {runs} {interval} {delay} {queue} '
+        '"{loss}" {link} {duration} {bw} {bw2} {setup_time}')
+COMMANDS = {
+    False: {'run': './cc_solo.sh ' + ARGS,
+            'analysis': './cc_solo_analysis.sh ' + ARGS},
+    True: {'run': './cc_multi.sh ' + ARGS,
+           'analysis': './cc_multi_analysis.sh ' + ARGS},
+}
+# the runs summarize the windows while merging their logs, and the piecewise
+# step reads these summaries, whose delay percentiles are approximate
+PIECEWISE_COMMAND = ('python ../analysis/save_piecewise.py --data-dir %s '
+                     '--windows="%s" --approx-delay')
+LOGS_COMMAND = 'python ../helpers/compressed_log.py %s %s'
+INGEST_COMMAND = ['python', '../analysis/results_store.py', '--datadir']
+
+
+class Manifest(object):
+    # append-only log of the states of the steps, one JSON record per line,
+    # each synced to disk before the campaign goes on; a line torn by a
+    # crash is ignored
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.states = {}
+        self.seq = 0
+
+        torn = False
+        if path.isfile(manifest_path):
+            with open(manifest_path) as manifest:
+                for line in manifest:
+                    torn = not line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                        self.update(record)
+                    except (ValueError, KeyError):
+                        sys.stderr.write('Warning: skipping a torn record of '
+                                         '%s\n' % manifest_path)
+
+        self.manifest = open(manifest_path, 'a')
+        if torn:
+            self.manifest.write('\n')
+
+    def update(self, record):
+        self.seq += 1
+        self.states[(record['dir'], record['step'])] = (record['state'],
+                                                        self.seq)
+
+    def state(self, dir_name, step):
+        # (state, order of the record), or (None, 0) if none
+        return self.states.get((dir_name, step), (None, 0))
+
+    def record(self, dir_name, step, state, **info):
+        record = dict(info, dir=dir_name, step=step, state=state,
+                      time=time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.manifest.write(json.dumps(record, sort_keys=True) + '\n')
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+        self.update(record)
+
+    def close(self):
+        self.manifest.close()
+
+
+def run_logs(scenario, name):
+    # paths of the logs <cc>_<name>_run<r>.log of every scheme and run of the
+    # scenario, or None if its test left no metadata
+    data_dir = path.join(DATA_DIR, scenario['dir'])
+    try:
+        with open(path.join(data_dir, 'pantheon_metadata.json')) as meta_fh:
+            meta = json.load(meta_fh)
+    except (IOError, ValueError):
+        return None
+
+    return [path.join(data_dir, '%s_%s_run%d.log' % (cc, name, run_id))
+            for cc in meta['cc_schemes']
+            for run_id in xrange(1, meta['run_times'] + 1)]
+
+
+def merged(scenario):
+    # whether the run left a merged datalink log for every scheme and run
+    log_paths = run_logs(scenario, 'datalink')
+    return log_paths is not None and all(find_log(log_path) is not None
+                                         for log_path in log_paths)
+
+
+class Campaign(object):
+    def __init__(self, grid, scenario_list, manifest, steps, args):
+        self.grid = grid
+        self.scenarios = scenario_list
+        self.manifest = manifest
+        self.steps = [step for step in STEPS if step in steps]
+        self.args = args
+        self.multi = grid['flows'] > 1
+        # steps run by a pipeline, not to retry them in the same campaign
+        self.tried = set()
+
+    def done(self, scenario, step):
+        # whether the step is done, since the step before it last was
+        state, seq = self.manifest.state(scenario['dir'], step)
+        if state != 'done':
+            return False
+        previous = self.previous(step)
+        return (previous is None or
+                seq > self.manifest.state(scenario['dir'], previous)[1])
+
+    def previous(self, step):
+        # the step of the campaign before this one
+        index = self.steps.index(step)
+        return self.steps[index - 1] if index > 0 else None
+
+    def is_pending(self, scenario, step):
+        # whether the step of the scenario is to be run: not done, after the
+        # step before; a run whose logs were not all merged is run again
+        previous = self.previous(step)
+        return ((not self.done(scenario, step) or
+                 (step == 'run' and 'merge' in self.steps and
+                  not self.done(scenario, 'merge'))) and
+                (previous is None or self.done(scenario, previous)))
+
+    def pending(self, step):
+        return [scenario for scenario in self.scenarios
+                if self.is_pending(scenario, step)]
+
+    def command(self, scenario, step):
+        if step == 'piecewise':
+            windows = scenarios.windows(self.grid,
+                                        intervals=[scenario['interval']])
+            return PIECEWISE_COMMAND % (
+                path.join(DATA_DIR, scenario['dir']),
+                ' '.join('%s:%s' % window for window in windows))
+        if step == 'logs':
+            log_paths = ((run_logs(scenario, 'mm_datalink') or []) +
+                         (run_logs(scenario, 'mm_acklink') or []))
+            return LOGS_COMMAND % (self.args.raw_logs, ' '.join(log_paths))
+        return COMMANDS[self.multi][step].format(**scenario)
+
+    def add_job(self, jobs, scenario, step, then=None):
+        # adds the step of the scenario to the jobs; then(scenario) is called
+        # once it finished and was recorded
+        def on_start(job):
+            self.manifest.record(scenario['dir'], step, 'started')
+
+        def on_done(job):
+            self.finish(scenario, step, job.proc.returncode)
+            if then:
+                then(scenario)
+
+        command = self.command(scenario, step)
+        if step == 'run':
+            jobs.add(scenario['cpus'], command, on_start, on_done)
+        else:
+            # the analysis of the runs yields to the emulations
+            jobs.add(1, command, on_start, on_done, priority=1,
+                     niceness=self.args.nice, delay=0)
+
+    def schedule(self, step, scenario_list):
+        # runs the step of the scenarios as jobs of the scheduler
+        args = self.args
+        if step == 'run':
+            jobs = scheduler.from_args(args)
+        else:
+            jobs = scheduler.Scheduler(args.slots)
+
+        for scenario in scenario_list:
+            self.add_job(jobs, scenario, step)
+        jobs.run()
+
+    def advance(self, jobs, scenario):
+        # adds the first step of the scenario still to do, unless it already
+        # ran in this campaign; its job adds the step after it in turn
+        for step in self.steps:
+            if step == 'ingest' or not self.is_pending(scenario, step):
+                continue
+            if (scenario['dir'], step) in self.tried:
+                return
+            self.tried.add((scenario['dir'], step))
+
+            if step == 'merge':
+                # of runs made before, outside the campaign
+                self.manifest.record(scenario['dir'], step, 'done' if
+                                     merged(scenario) else 'failed')
+                continue
+            self.add_job(jobs, scenario, step,
+                         lambda scenario: self.advance(jobs, scenario))
+            return
+
+    def finish(self, scenario, step, returncode):
+        dir_name = scenario['dir']
+        if returncode != 0:
+            self.manifest.record(dir_name, step, 'failed',
+                                 returncode=returncode)
+            return
+
+        if step == 'piecewise':
+            windows = scenarios.windows(self.grid,
+                                        intervals=[scenario['interval']])
+            missing = [window for window in windows if not path.isfile(
+                path.join(DATA_DIR, dir_name,
+                          'piecewise_perf_%d_%d.json' % window))]
+            if missing:
+                self.manifest.record(dir_name, step, 'failed',
+                                     missing=missing)
+                return
+        self.manifest.record(dir_name, step, 'done')
+
+        # the test returns 0 even when a run failed; its merged logs tell
+        if step == 'run' and 'merge' in self.steps:
+            self.manifest.record(dir_name, 'merge',
+                                 'done' if merged(scenario) else 'failed')
+
+    def ingest(self, scenario_list):
+        # one incremental ingest of the data directory for all of them
+        for scenario in scenario_list:
+            self.manifest.record(scenario['dir'], 'ingest', 'started')
+        returncode = call(INGEST_COMMAND + [DATA_DIR])
+        for scenario in scenario_list:
+            self.finish(scenario, 'ingest', returncode)
+
+    def pipeline(self):
+        # runs the steps of every scenario one after the other, those of all
+        # the scenarios as jobs of one scheduler, and ingests them at the end
+        jobs = scheduler.from_args(self.args)
+        for scenario in self.scenarios:
+            self.advance(jobs, scenario)
+        jobs.run()
+
+        if 'ingest' in self.steps:
+            scenario_list = self.pending('ingest')
+            sys.stderr.write('Campaign step ingest: %d scenarios to do\n'
+                             % len(scenario_list))
+            if scenario_list:
+                self.ingest(scenario_list)
+
+    def run(self):
+        for step in self.steps:
+            if step == 'merge' and 'run' in self.steps:
+                # recorded with the run
+                continue
+
+            scenario_list = self.pending(step)
+            sys.stderr.write('Campaign step %s: %d scenarios to do\n'
+                             % (step, len(scenario_list)))
+            if not scenario_list:
+                continue
+            if step == 'merge':
+                # of runs made before, outside the campaign
+                for scenario in scenario_list:
+                    self.manifest.record(scenario['dir'], step, 'done' if
+                                         merged(scenario) else 'failed')
+            elif step == 'ingest':
+                self.ingest(scenario_list)
+            else:
+                self.schedule(step, scenario_list)
+
+    def summary(self):
+        # "step: done/total" of every step
+        return ', '.join('%s %d/%d' % (step, sum(
+            1 for scenario in self.scenarios if self.done(scenario, step)),
+            len(self.scenarios)) for step in self.steps)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='run every scenario of a grid through the steps of a '
+        'campaign, recording them in a manifest so that running it again '
+        'only does the steps not done yet')
+
+    parser.add_argument('grid', help='grid of src/scenarios.yml to run')
+    parser.add_argument(
+        '--schemes', metavar='"SCHEME1 SCHEME2..."', required=True,
+        help='space-separated list of schemes to run every scenario for')
+    parser.add_argument('--links', metavar='BW', type=int, nargs='+',
+                        help='only the scenarios of these links')
+    parser.add_argument('--delays', metavar='DELAY', type=int, nargs='+',
+                        help='only the scenarios of these one-way delays')
+    parser.add_argument(
+        '--steps', metavar='STEP', nargs='+', choices=STEPS,
+        help='steps to take the scenarios through, of %s (default all, logs '
+        'with --raw-logs only); a step waits for the step before it of these '
+        'only' % ' '.join(STEPS))
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help='start the steps of a scenario as soon as its run finished, '
+        'alongside the runs of the others, instead of each step for all the '
+        'scenarios in turn')
+    parser.add_argument(
+        '--nice', metavar='NICENESS', type=int, default=19,
+        help='niceness of the jobs of the steps after the run, which also '
+        'get the lowest best-effort I/O priority (default 19)')
+    parser.add_argument(
+        '--raw-logs', choices=['gzip', 'zstd', 'delete'],
+        help='compress the mm-link logs of a scenario with gzip or zstd, or '
+        'delete them, once it is analyzed (default keep them)')
+    parser.add_argument(
+        '--manifest', metavar='FILE',
+        help='manifest of the campaign (default '
+        'data/campaign-<grid>.manifest)')
+    scheduler.parse_scheduler_shared(parser)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    grid = scenarios.load_grid(args.grid)
+    scenario_list = list(scenarios.expand(grid, args.schemes.split(),
+                                          args.links, args.delays))
+
+    manifest_path = args.manifest or path.join(
+        DATA_DIR, 'campaign-%s.manifest' % args.grid)
+    if not path.isdir(path.dirname(manifest_path) or '.'):
+        os.makedirs(path.dirname(manifest_path))
+    manifest = Manifest(manifest_path)
+
+    steps = args.steps or [step for step in STEPS
+                           if step != 'logs' or args.raw_logs]
+    if 'logs' in steps and not args.raw_logs:
+        sys.exit('the logs step needs --raw-logs')
+
+    campaign = Campaign(grid, scenario_list, manifest, steps, args)
+    if args.pipeline:
+        campaign.pipeline()
+    else:
+        campaign.run()
+    sys.stderr.write('Campaign %s: %s\n' % (args.grid, campaign.summary()))
+    manifest.close()
+
+
+if __name__ == '__main__':
+    main()
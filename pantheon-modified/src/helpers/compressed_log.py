@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import errno
+import shutil
+import argparse
+import subprocess
+
+# merged tunnel logs and mm-link logs may be stored compressed as <log>.gz
+# or <log>.zst; readers are given the uncompressed name and open whichever
+# file exists. (de)compression runs in a gzip or zstd child process, so it
+# also overlaps with parsing in the reader.
+COMPRESSORS = {
+    'gzip': ('.gz', ['gzip', '-c'], ['gzip', '-d', '-c']),
+    'zstd': ('.zst', ['zstd', '-q', '-c'], ['zstd', '-q', '-d', '-c']),
+}
+
+# sidecars the analysis keeps next to a stored log: the parsed columns of
+# tunnel_log.py and the timestamp index of merge_tunnel_logs.py
+SIDECAR_SUFFIXES = ['.cols', '.idx']
+
+
+def compression_of(log_path):
+    for method, (ext, _, _) in COMPRESSORS.items():
+        if log_path.endswith(ext):
+            return method
+    return None
+
+
+def find_log(log_path):
+    # path of the stored log, or None if it does not exist in any form
+    if os.path.isfile(log_path):
+        return log_path
+    for method in sorted(COMPRESSORS):
+        if os.path.isfile(log_path + COMPRESSORS[method][0]):
+            return log_path + COMPRESSORS[method][0]
+    return None
+
+
+class PipedLog(object):
+    # file-like end of a pipe to or from a (de)compressor; close() waits
+    # for the child and fails like a file would if it did. Readers may stop
+    # early, in which case the decompressor is just stopped.
+    def __init__(self, proc, fh, name, program):
+        self.proc = proc
+        self.fh = fh
+        self.name = name
+        self.program = program
+        self.written = 0
+        self.eof = False
+
+    def read(self, *args):
+        data = self.fh.read(*args)
+        if not data:
+            self.eof = True
+        return data
+
+    def readline(self):
+        line = self.fh.readline()
+        if not line:
+            self.eof = True
+        return line
+
+    def readlines(self):
+        lines = self.fh.readlines()
+        self.eof = True
+        return lines
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def write(self, data):
+        self.fh.write(data)
+        self.written += len(data)
+
+    def tell(self):
+        # offset in the uncompressed log written so far
+        return self.written
+
+    def close(self):
+        if self.fh.closed:
+            return
+        reading = self.proc.stdout is self.fh
+        if reading and not self.eof and self.proc.poll() is None:
+            self.proc.terminate()
+            self.fh.close()
+            self.proc.wait()
+            return
+
+        self.fh.close()
+        if self.proc.wait() != 0:
+            raise IOError('%s failed on %s' % (self.program, self.name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def remove_sidecars(stored_path):
+    for sidecar in [stored_path + suffix for suffix in SIDECAR_SUFFIXES]:
+        if os.path.isdir(sidecar):
+            shutil.rmtree(sidecar, ignore_errors=True)
+        elif os.path.isfile(sidecar):
+            os.remove(sidecar)
+
+
+def remove_log(log_path):
+    # every stored form of the log, with their sidecars
+    for stored_path in [log_path] + [log_path + ext
+                                     for ext, _, _ in COMPRESSORS.values()]:
+        if os.path.isfile(stored_path):
+            os.remove(stored_path)
+        remove_sidecars(stored_path)
+
+
+def open_log(log_path, mode='r'):
+    stored_path = find_log(log_path)
+    if stored_path is None:
+        raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), log_path)
+
+    method = compression_of(stored_path)
+    if method is None:
+        return open(stored_path, mode)
+
+    cmd = COMPRESSORS[method][2] + [stored_path]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                universal_newlines='b' not in mode)
+    except OSError as exception:
+        raise IOError('cannot run %s to read %s: %s'
+                      % (cmd[0], stored_path, exception))
+    return PipedLog(proc, proc.stdout, stored_path, cmd[0])
+
+
+def create_log(log_path, method=None):
+    # opens <log_path> for writing, or <log_path><ext> through a compressor;
+    # other stored forms of the log would shadow it, so they are removed
+    remove_log(log_path)
+    if method is None:
+        return open(log_path, 'w')
+
+    ext, cmd, _ = COMPRESSORS[method]
+    out = open(log_path + ext, 'wb')
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=out)
+    except OSError as exception:
+        raise IOError('cannot run %s to write %s: %s'
+                      % (cmd[0], log_path + ext, exception))
+    finally:
+        out.close()
+    return PipedLog(proc, proc.stdin, log_path + ext, cmd[0])
+
+
+def compress_log(log_path, method):
+    # replaces <log_path> by <log_path><ext>
+    ext, cmd, _ = COMPRESSORS[method]
+    with open(log_path, 'rb') as src:
+        with open(log_path + ext + '.tmp', 'wb') as out:
+            if subprocess.call(cmd, stdin=src, stdout=out) != 0:
+                raise IOError('%s failed on %s' % (cmd[0], log_path))
+    os.rename(log_path + ext + '.tmp', log_path + ext)
+    os.remove(log_path)
+    remove_sidecars(log_path)
+
+    for other_ext, _, _ in COMPRESSORS.values():
+        if other_ext != ext and os.path.isfile(log_path + other_ext):
+            os.remove(log_path + other_ext)
+            remove_sidecars(log_path + other_ext)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='compress logs in place, or delete them in whatever form '
+        'they are stored')
+
+    parser.add_argument('method', choices=sorted(COMPRESSORS) + ['delete'],
+                        help='compressor to store the logs with, or delete')
+    parser.add_argument('logs', metavar='LOG', nargs='+',
+                        help='uncompressed name of a log')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    for log_path in args.logs:
+        if args.method == 'delete':
+            remove_log(log_path)
+            continue
+
+        stored_path = find_log(log_path)
+        if stored_path is None:
+            sys.stderr.write('Warning: %s does not exist\n' % log_path)
+        elif compression_of(stored_path) is None:
+            compress_log(log_path, args.method)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+import re
+import sys
+import argparse
+from os import path
+
+import yaml
+
+import context
+
+# the scenario grids declared in src/scenarios.yml; "scenarios.py GRID"
+# prints the scenarios of a grid, one per line, for the shell scripts
+SCENARIOS_PATH = path.join(context.src_dir, 'scenarios.yml')
+
+VARIANT_RE = re.compile(r'^(\d+)x-([ud])-(\d+)s$')
+
+# fields of every scenario; dir is the data directory of its scheme
+FIELDS = ['dir', 'prefix', 'scheme', 'name', 'link', 'trace', 'bw', 'bw2',
+          'variant', 'delay', 'queue', 'loss', 'interval', 'flows', 'runs',
+          'duration', 'setup_time', 'cpus']
+
+
+def parse_scenarios(scenarios_path=SCENARIOS_PATH):
+    with open(scenarios_path) as scenarios:
+        return yaml.safe_load(scenarios)
+
+
+def load_grid(grid_name, scenarios_path=SCENARIOS_PATH):
+    grids = parse_scenarios(scenarios_path)
+    if grid_name not in grids:
+        sys.exit('%s is not a scenario grid in %s'
+                 % (grid_name, scenarios_path))
+    return grids[grid_name]
+
+
+def variant_bw(bw, variant):
+    # bandwidth the capacity of a link variant changes to
+    if not variant:
+        return bw
+
+    match = VARIANT_RE.match(variant)
+    if match is None:
+        sys.exit('link variant %s is not in the form <scale>x-<u|d>-<period>s'
+                 % variant)
+    scale = int(match.group(1))
+    if match.group(2) == 'u':
+        return bw * scale
+    return bw // scale
+
+
+def cpus(grid, bw, bw2):
+    # CPUs an experiment of the grid keeps busy, by the peak bandwidth of its
+    # link: those of the first cost whose max_bw it does not exceed
+    peak = max(bw, bw2)
+    for cost in grid.get('cpus', []):
+        if cost.get('max_bw') is None or peak <= cost['max_bw']:
+            return cost['cpus']
+    return 1
+
+
+def variants(grid):
+    # every link variant of the grid, in order
+    ret = []
+    for link in grid['links']:
+        for variant in link['variants']:
+            if variant and variant not in ret:
+                ret.append(variant)
+    return ret
+
+
+def grid_points(grid, league=False):
+    # (loss, bw, variant, delay, queue multiple, interval) of every scenario
+    # of a grid, in the order of the leagues; only those the league ranks if
+    # league
+    for loss in grid['losses']:
+        for link in grid['links']:
+            link_variants = link['variants']
+            if league:
+                link_variants = link.get('league_variants', link_variants)
+            for variant in link_variants:
+                for delay in grid['delays']:
+                    for queue in grid['queues']:
+                        for interval in grid['intervals']:
+                            yield (loss, link['bw'], variant, delay, queue,
+                                   interval)
+
+
+def expand(grid, schemes=None, links=None, delays=None, intervals=None,
+           shard=None, league=False):
+    # the scenarios of a grid, as dicts of FIELDS, for each of schemes (or
+    # once with no scheme); only those with the given links, delays and
+    # intervals, and of shard (k, n) only every n-th one from the k-th, and
+    # only those the league ranks if league. Scenarios with the same data
+    # directory are only given once.
+    seen = set()
+    index = -1
+    for scheme in schemes or [None]:
+        for loss, bw, variant, delay, queue, interval in grid_points(grid,
+                                                                     league):
+            if ((links and bw not in links) or
+                    (delays and delay not in delays) or
+                    (intervals and interval not in intervals)):
+                continue
+
+            link = str(bw)
+            if variant:
+                link += '-%s-plus-10' % variant
+            # the BDP in packets of 1500 bytes: 12 Mbps is one per ms
+            queue = int(queue * (2 * bw * delay // 12))
+            bw2 = variant_bw(bw, variant)
+            name = 'wired%s-%d-%d-%s' % (link, delay, queue, loss)
+            if grid['flows'] > 1:
+                name += '-%d' % interval
+
+            if (scheme, name) in seen:
+                continue
+            seen.add((scheme, name))
+            index += 1
+            if shard and index % shard[1] != shard[0]:
+                continue
+
+            yield {
+                'dir': (None if scheme is None else
+                        '%s-%s-%s' % (grid['prefix'], scheme, name)),
+                'prefix': grid['prefix'],
+                'scheme': scheme,
+                'name': name,
+                'link': link,
+                'trace': 'wired' + link,
+                'bw': bw,
+                'bw2': bw2,
+                'variant': variant,
+                'delay': delay,
+                'queue': queue,
+                'loss': loss,
+                'interval': interval,
+                'flows': grid['flows'],
+                'runs': grid['runs'],
+                'duration': grid['duration'],
+                'setup_time': grid['setup_time'],
+                'cpus': cpus(grid, bw, bw2),
+            }
+
+
+def windows(grid, league=False, intervals=None):
+    # (start, end) in seconds of the windows of the grid in the logs of its
+    # experiments, for each of its intervals; only the windows of the league
+    # if league
+    relative = grid['windows']
+    if league:
+        relative = grid.get('league_windows', relative)
+
+    ret = []
+    for interval in grid['intervals']:
+        if intervals and interval not in intervals:
+            continue
+        offset = grid['setup_time'] + interval
+        for win_start, win_end in relative:
+            window = (win_start + offset, win_end + offset)
+            if window not in ret:
+                ret.append(window)
+    return ret
+
+
+def parse_shard(shard):
+    try:
+        k, n = [int(x) for x in shard.split('/')]
+        if not 0 <= k < n:
+            raise ValueError
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'shard %s is not in the form K/N with 0 <= K < N' % shard)
+    return k, n
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='print the scenarios of a grid of src/scenarios.yml, one '
+        'per line with the fields asked for, or its windows')
+
+    parser.add_argument('grid', help='grid to expand, e.g. single-flow')
+    parser.add_argument(
+        '--scenarios', metavar='YAML', default=SCENARIOS_PATH,
+        help='file of the scenario grids (default src/scenarios.yml)')
+    parser.add_argument(
+        '--schemes', metavar='"SCHEME1 SCHEME2..."',
+        help='space-separated list of schemes to give every scenario for')
+    parser.add_argument('--links', metavar='BW', type=int, nargs='+',
+                        help='only the scenarios of these links')
+    parser.add_argument('--delays', metavar='DELAY', type=int, nargs='+',
+                        help='only the scenarios of these one-way delays')
+    parser.add_argument('--intervals', metavar='INTERVAL', type=int,
+                        nargs='+', help='only the scenarios of these '
+                        'intervals between flows')
+    parser.add_argument(
+        '--shard', metavar='K/N', type=parse_shard,
+        help='only every N-th scenario from the K-th one (from 0), to split '
+        'the grid between N machines')
+    parser.add_argument(
+        '--fields', metavar='FIELD', nargs='+', choices=FIELDS,
+        default=['scheme', 'name'],
+        help='fields to print of every scenario (default scheme name); one '
+        'of %s' % ' '.join(FIELDS))
+    parser.add_argument(
+        '--format', metavar='TEMPLATE',
+        help='print every scenario as TEMPLATE with its {FIELD}s filled in, '
+        'e.g. "{cpus} ./cc_solo.sh {scheme} ..." for scheduler.py')
+    parser.add_argument(
+        '--list', metavar='FIELD', choices=FIELDS,
+        help='print the values of one field, each once')
+    parser.add_argument(
+        '--windows', action='store_true',
+        help='print the windows as "START:END START:END..." instead')
+    parser.add_argument('--league', action='store_true',
+                        help='only the scenarios, or with --windows the '
+                        'windows, of the league')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    grid = load_grid(args.grid, args.scenarios)
+
+    if args.windows:
+        print(' '.join('%s:%s' % window for window in windows(
+            grid, args.league, args.intervals)))
+        return
+
+    listed = []
+    schemes = args.schemes.split() if args.schemes else None
+    for scenario in expand(grid, schemes, args.links, args.delays,
+                           args.intervals, args.shard, args.league):
+        if args.format is not None:
+            print(args.format.format(**scenario))
+        elif args.list is None:
+            print(' '.join(str(scenario[field]) for field in args.fields))
+        elif scenario[args.list] not in listed:
+            listed.append(scenario[args.list])
+            print(scenario[args.list])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import math
+import time
+import argparse
+import multiprocessing
+
+import context
+import utils
+from subprocess_wrappers import Popen, call
+
+# runs shell commands as a work queue on the CPUs of the machine: every job
+# has a cost, the CPUs it keeps busy, and starts as soon as the jobs running
+# leave that many CPUs free, the costliest first; smaller jobs fill the CPUs
+# a costly one cannot use yet. "scheduler.py" reads the jobs, one per line as
+# "COST COMMAND", e.g. from "scenarios.py GRID --format ..."
+#
+# With pinning, every job gets COST CPUs of its own, on one NUMA node when
+# one has enough of them free, and the command and everything it starts
+# (mahimahi shells, tunnel managers, wrappers) runs on them only; test.py
+# records them in pantheon_metadata.json.
+
+
+class Job(object):
+    def __init__(self, index, cost, command, on_start=None, on_done=None,
+                 priority=0, niceness=0, delay=0):
+        self.index = index
+        self.cost = cost
+        self.command = command
+        # called with the job when it starts, and when it finished
+        self.on_start = on_start
+        self.on_done = on_done
+        # jobs of a lower priority only start when none of a higher one fits;
+        # niceness lowers their CPU and I/O priority too
+        self.priority = priority
+        self.niceness = niceness
+        self.delay = delay
+        self.proc = None
+        self.cpus = []
+
+
+def parse_job(line):
+    # (cost, command) of a line of jobs
+    try:
+        cost, command = line.split(None, 1)
+        return float(cost), command.strip()
+    except ValueError:
+        sys.exit('job "%s" is not in the form "COST COMMAND"' % line.strip())
+
+
+class Scheduler(object):
+    def __init__(self, slots=None, delay=0, cleanup=None, pin=False,
+                 numa=False, cpus=None):
+        self.slots = slots or multiprocessing.cpu_count()
+        self.delay = delay
+        self.cleanup = cleanup
+        self.pin = pin or numa
+        self.numa = numa
+        if self.pin:
+            # the jobs fill the CPUs given, or those the scheduler may use;
+            # taskset cannot pin them to any other
+            allowed = set(utils.get_allowed_cpus())
+            self.free_cpus = set(cpus or allowed)
+            if self.free_cpus - allowed:
+                sys.exit('CPUs %s are not among those the scheduler may run '
+                         'on (%s)' % (utils.format_cpu_list(
+                             self.free_cpus - allowed),
+                             utils.format_cpu_list(allowed)))
+            self.slots = len(self.free_cpus)
+            self.nodes = utils.get_numa_nodes()
+        self.pending = []
+        self.added = 0
+        self.running = {}
+        self.free = self.slots
+        self.failed = []
+
+    def add(self, cost, command, on_start=None, on_done=None, priority=0,
+            niceness=0, delay=None):
+        # adds a job, also while the jobs run, e.g. from on_done
+        self.added += 1
+        job = Job(self.added, cost, command, on_start, on_done, priority,
+                  niceness, self.delay if delay is None else delay)
+        self.pending.append(job)
+        return job
+
+    def cost(self, job):
+        # a job that needs more than all the CPUs runs alone; pinned, it
+        # takes whole CPUs
+        if self.pin:
+            return min(max(int(math.ceil(job.cost)), 1), self.slots)
+        return min(job.cost, self.slots)
+
+    def place(self, count):
+        # (count free CPUs, their NUMA node or None): all on the node with
+        # the fewest free CPUs that has enough, to keep larger blocks free
+        # for costlier jobs, or else the first free ones of any node
+        free_on = {}
+        for cpu in self.free_cpus:
+            free_on.setdefault(self.nodes.get(cpu, 0), []).append(cpu)
+        fitting = [(len(cpus), node) for node, cpus in free_on.items()
+                   if len(cpus) >= count]
+        if fitting:
+            node = min(fitting)[1]
+            return sorted(free_on[node])[:count], node
+        return sorted(self.free_cpus)[:count], None
+
+    def launch(self, job):
+        cmd = []
+        if job.niceness:
+            cmd = ['nice', '-n', str(job.niceness), 'ionice', '-c', '2', '-n',
+                   '7']
+
+        if self.pin:
+            job.cpus, node = self.place(self.cost(job))
+            self.free_cpus -= set(job.cpus)
+            cpu_list = utils.format_cpu_list(job.cpus)
+            if self.numa and node is not None:
+                cmd += ['numactl', '--physcpubind=' + cpu_list,
+                        '--membind=%d' % node]
+            else:
+                cmd += ['taskset', '-c', cpu_list]
+
+        if not cmd:
+            return Popen(job.command, shell=True)
+        return Popen(cmd + ['/bin/sh', '-c', job.command])
+
+    def held_below(self, priority):
+        # CPUs of the running jobs of a lower priority
+        return sum(self.cost(job) for job in self.running.values()
+                   if job.priority > priority)
+
+    def start_fitting(self):
+        # starts every pending job that fits in the free CPUs, or the first
+        # one when none runs. Jobs of a lower priority than the first one
+        # that does not fit only take CPUs it could not use even if they all
+        # finished, so that they never hold it back for longer than the
+        # lower-priority jobs already running take
+        self.pending.sort(key=lambda job: (job.priority, -job.cost, job.index))
+        blocked = None
+        for job in list(self.pending):
+            if (blocked is not None and job.priority > blocked.priority and
+                    self.free + self.held_below(blocked.priority) >=
+                    self.cost(blocked)):
+                continue
+            if self.running and self.cost(job) > self.free:
+                if blocked is None:
+                    blocked = job
+                continue
+            self.pending.remove(job)
+            if job.on_start:
+                job.on_start(job)
+            job.proc = self.launch(job)
+            self.running[job.proc.pid] = job
+            self.free -= self.cost(job)
+            if job.delay:
+                time.sleep(job.delay)
+
+    def wait_one(self):
+        # waits for any job to finish and frees its CPUs
+        while True:
+            pid, status = os.wait()
+            if pid in self.running:
+                break
+
+        job = self.running.pop(pid)
+        if os.WIFSIGNALED(status):
+            job.proc.returncode = -os.WTERMSIG(status)
+        else:
+            job.proc.returncode = os.WEXITSTATUS(status)
+        self.free += self.cost(job)
+        if self.pin:
+            self.free_cpus |= set(job.cpus)
+        if job.proc.returncode != 0:
+            self.failed.append(job)
+            sys.stderr.write('Warning: job failed (status %d): %s\n'
+                             % (job.proc.returncode, job.command))
+        if job.on_done:
+            job.on_done(job)
+        return job
+
+    def run(self):
+        # runs all the jobs; returns the ones that failed
+        self.failed = []
+        finished = 0
+        while self.pending or self.running:
+            self.start_fitting()
+            self.wait_one()
+
+            # e.g. clean-tmp.sh, about as often as every job had run once
+            finished += 1
+            if self.cleanup and finished % self.slots == 0:
+                call(self.cleanup, shell=True)
+        if self.cleanup:
+            call(self.cleanup, shell=True)
+        return self.failed
+
+
+def parse_scheduler_shared(parser):
+    parser.add_argument(
+        '--slots', type=int,
+        help='CPUs to fill with jobs (default all the CPUs of the machine)')
+    parser.add_argument(
+        '--pin', action='store_true',
+        help='run every job on COST CPUs of its own (with taskset), which '
+        'all the processes it starts inherit; --slots is then the number of '
+        'CPUs of --cpus')
+    parser.add_argument(
+        '--numa', action='store_true',
+        help='pin the jobs with numactl instead, binding their memory to the '
+        'NUMA node of their CPUs; implies --pin')
+    parser.add_argument(
+        '--cpus', metavar='LIST', type=utils.parse_cpu_list,
+        help='CPUs to pin the jobs to, e.g. "2-63", of those the scheduler '
+        'may run on (default all of them)')
+    parser.add_argument(
+        '--delay', metavar='SECONDS', type=float, default=0,
+        help='time to wait after starting a job before starting another one')
+    parser.add_argument(
+        '--cleanup', metavar='COMMAND',
+        help='command to run after as many jobs as slots finished, and at '
+        'the end, e.g. "sudo ./clean-tmp.sh"')
+
+
+def from_args(args):
+    return Scheduler(args.slots, args.delay, args.cleanup, args.pin,
+                     args.numa, args.cpus)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='run shell commands keeping the CPUs busy: each starts '
+        'as soon as the commands running leave enough CPUs for its cost')
+
+    parser.add_argument(
+        'jobs', nargs='?', metavar='JOBS',
+        help='file of the jobs, one per line as "COST COMMAND" with COST the '
+        'CPUs the command keeps busy (default stdin)')
+    parse_scheduler_shared(parser)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    scheduler = from_args(args)
+    jobs_file = open(args.jobs) if args.jobs else sys.stdin
+    for line in jobs_file:
+        if line.strip() and not line.startswith('#'):
+            scheduler.add(*parse_job(line))
+    if args.jobs:
+        jobs_file.close()
+
+    if scheduler.run():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -238,3 +238,65 @@ def get_sys_info():
     sys_info += check_output(['sysctl', 'net.ipv4.tcp_rmem'])
     sys_info += check_output(['sysctl', 'net.ipv4.tcp_wmem'])
     return sys_info
+
+
+def parse_cpu_list(cpu_list):
+    # CPUs of a list such as "0-5,12,14-15", as in /proc and taskset -c
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpu_list(cpus):
+    # the shortest list of CPUs for taskset -c, e.g. "0-5,12"
+    parts = []
+    for cpu in sorted(cpus):
+        if parts and parts[-1][1] == cpu - 1:
+            parts[-1][1] = cpu
+        else:
+            parts.append([cpu, cpu])
+    return ','.join(str(first) if first == last else '%d-%d' % (first, last)
+                    for first, last in parts)
+
+
+def get_allowed_cpus(pid='self'):
+    # CPUs a process may run on
+    with open('/proc/%s/status' % pid) as status:
+        for line in status:
+            if line.startswith('Cpus_allowed_list:'):
+                return parse_cpu_list(line.split(':', 1)[1])
+    return range(os.sysconf('SC_NPROCESSORS_ONLN'))
+
+
+def get_numa_nodes():
+    # {CPU: its NUMA node}; empty when the system shows no NUMA nodes
+    nodes = {}
+    node_dir = '/sys/devices/system/node'
+    if not path.isdir(node_dir):
+        return nodes
+
+    for name in os.listdir(node_dir):
+        if not name.startswith('node') or not name[4:].isdigit():
+            continue
+        with open(path.join(node_dir, name, 'cpulist')) as cpulist:
+            for cpu in parse_cpu_list(cpulist.read()):
+                nodes[cpu] = int(name[4:])
+    return nodes
+
+
+def get_cpu_placement():
+    # the CPUs and NUMA nodes this process, and all it starts, is pinned to
+    cpus = get_allowed_cpus()
+    nodes = get_numa_nodes()
+    return {
+        'cpus': format_cpu_list(cpus),
+        'numa_nodes': sorted(set(nodes[cpu] for cpu in cpus if cpu in nodes)),
+        'pinned': len(cpus) < os.sysconf('SC_NPROCESSORS_ONLN'),
+    }